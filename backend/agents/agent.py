@@ -11,7 +11,9 @@ from typing import List, Dict, Any
 from llama_cpp import Llama  # For llama.cpp models
 from transformers import pipeline, AutoModelForSequenceClassification
 
-from memory_manager import MemoryManager
+from context_window import ContextWindow
+from memory_namespaces import SHARED_NAMESPACE, namespace_name
+from memory_registry import memory_registry
 from prompts import PromptTemplates
 from tool_manager import ToolManager
 from tools.file_system_tool import FileSystemTool
@@ -27,7 +29,7 @@ logger = logging.getLogger(__name__)
 
 
 class Agent(ABC):
-    def __init__(self, agent_id: int, name: str, description: str, skills: List[str], tools: List[str], role: str = None, permissions: Dict[str, bool] = None, status: str = "inactive", model_path: str = None, api_key: str = None, search_engine_id: str = None):
+    def __init__(self, agent_id: int, name: str, description: str, skills: List[str], tools: List[str], role: str = None, permissions: Dict[str, bool] = None, status: str = "inactive", model_path: str = None, api_key: str = None, search_engine_id: str = None, context_tokens: int = 2048, response_tokens: int = 512):
         self.id = agent_id
         self.name = name
         self.description = description
@@ -38,9 +40,16 @@ class Agent(ABC):
         self.status = status
         self.model_path = model_path
         self.llm_interface = None  # LLM is loaded dynamically
-        self.memory_manager = MemoryManager()
+        self.namespaced_memory = memory_registry.acquire_namespaced_memory(shared=True, legacy_memory_file="memory.pkl")  # Shared by all agents and the API; one model per process, shards safe across processes. memory.pkl's memories move to its shared namespace.
+        self.memory_manager = self.namespaced_memory.namespace(namespace_name("agent", agent_id))  # This agent's own shard and index; its writes go here.
+        self.memory_namespaces = [namespace_name("agent", agent_id), SHARED_NAMESPACE]  # Its reads also see the API's (and memory.pkl's) memories.
         self.prompt_templates = PromptTemplates()
         self.context = self.load_agent_context() or ""
+        self.response_tokens = response_tokens  # Part of the model window left free for the task and the response.
+        self.context_window = ContextWindow(max_tokens=context_tokens)  # Re-tokenized with the model's tokenizer once it loads.
+        self._context_tokenizer = None
+        if self.context:
+            self.context_window.add(self.context)
         self.tool_manager = ToolManager()  # Optional
         self.metrics = {
             'tasks_completed': 0,
@@ -155,12 +164,35 @@ class Agent(ABC):
                     self.llm_interface = LLM_Interface(model_path=self.model_path) #Update with correct path to model
                     self.llm_interface.load_model()  # Correct method call
 
+            self.configure_context_window()
         except Exception as e:
             logger.error(f"Agent {self.name}: Could not load LLM: {e}") #Add agent name
 
+    def configure_context_window(self):
+        """Counts context tokens with the loaded model's tokenizer and sizes the window to the model's context length."""
+        model = getattr(self.llm_interface, "model", None)
+        tokenizer = getattr(self.llm_interface, "tokenizer", None) or (model if hasattr(model, "tokenize") else None)  # llama.cpp models tokenize themselves.
+        if tokenizer is None or self._context_tokenizer is tokenizer:
+            return
+        try:
+            n_ctx = model.n_ctx() if hasattr(model, "n_ctx") else getattr(getattr(model, "config", None), "max_position_embeddings", None)
+            max_tokens = n_ctx - self.response_tokens if n_ctx else None
+            self.context_window.set_tokenizer(tokenizer, max_tokens)
+            self._context_tokenizer = tokenizer
+            self.context = self.context_window.render()
+        except Exception as e:
+            logger.warning(f"Agent {self.name}: Could not use the model's tokenizer for the context window, estimating tokens instead: {e}")
+
 
     def unload_llm(self):  # Unloads LLM interface, frees resources.
         self.llm_interface = None
+
+    def close(self):  # Call when the agent is terminated; frees the LLM and releases the shared namespaced memory.
+        self.unload_llm()
+        if self.namespaced_memory is not None:
+            memory_registry.release_namespaced_memory(self.namespaced_memory)
+            self.namespaced_memory = None
+            self.memory_manager = None
     
     def generate_text(self, prompt):
         if self.model_path.endswith('.gguf'):
@@ -184,7 +216,8 @@ class Agent(ABC):
 
     def update_context(self, task, response):
         new_message = f"User: {task}\nAI: {response}"
-        self.context = self.memory_manager.manage_context(self.context, new_message)
+        self.context_window.add(new_message)  # Whole turns in, whole oldest turns out; no re-tokenizing the history.
+        self.context = self.context_window.render()
         self.save_agent_context() #Optional: if using persistence.
 
     def save_agent_context(self): #Implement persistent context storage in derived classes if needed.
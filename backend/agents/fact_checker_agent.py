@@ -11,6 +11,7 @@ from typing import List, Dict, Any
 from llama_cpp import Llama  # For llama.cpp models
 from transformers import pipeline, AutoModelForSequenceClassification
 
+from agent import Agent
 from memory_manager import MemoryManager
 from prompts import PromptTemplates
 from tool_manager import ToolManager
@@ -98,6 +99,12 @@ class FactCheckerAgent(Agent):  # Inherits from the abstract Agent class
             - 'verified': True if claim is verified, False otherwise.
             - 'evidence': Evidence supporting the verification result.
         """
+        return self.verify_claims([claim])[0]
+
+
+    def verify_claims(self, claims: List[str]) -> List[Dict[str, Any]]:
+        """verify_claim() for several claims; all memory lookups are one batched search_many call over this agent's and the
+        shared namespace."""
         # Placeholder implementation (replace with actual verification logic).
         try:
             # This is where you would implement your fact-checking logic using:
@@ -106,22 +113,29 @@ class FactCheckerAgent(Agent):  # Inherits from the abstract Agent class
             # - Knowledge base lookups (if you have one)
 
 
-            #For demonstration, this simple version searches for the claim in the memory manager and the web:
-            memory_result = self.memory_manager.search(claim)
-            web_search_results = self.use_tools(claim) if self.requires_tools(claim) else ""
-            evidence = ""
-            if memory_result:
-                evidence += f"Memory: {memory_result}\n"
-            if web_search_results:
-                evidence += f"Web Search: {web_search_results}"
-
-            verified = bool(memory_result or web_search_results)  #Placeholder logic
-            return {"verified": verified, "evidence": evidence} # Return a dictionary containing whether the information was verified, and any relevant supporting evidence found.
-
-
+            #For demonstration, this simple version searches for the claims in the memory manager and the web:
+            memory_results = self.namespaced_memory.search_many(claims, namespaces=self.memory_namespaces)  # This agent's shard and the shared one.
         except Exception as e:  #Handles any errors during verification
-            logger.error(f"FactCheckerAgent.verify_claim: Error verifying claim '{claim}': {e}") #Logs the error and provides details, such as the claim that failed to be verified.
-            return {"verified": False, "evidence": f"Error during verification: {e}"}  #Fallback on error, provides feedback
+            logger.error(f"FactCheckerAgent.verify_claims: Error searching memory for {len(claims)} claims: {e}")
+            return [{"verified": False, "evidence": f"Error during verification: {e}"} for _ in claims]
+
+        verifications = []
+        for claim, memory_result in zip(claims, memory_results):
+            try:
+                web_search_results = self.use_tools(claim) if self.requires_tools(claim) else ""
+                evidence = ""
+                if memory_result:
+                    evidence += f"Memory: {memory_result}\n"
+                if web_search_results:
+                    evidence += f"Web Search: {web_search_results}"
+
+                verified = bool(memory_result or web_search_results)  #Placeholder logic
+                verifications.append({"verified": verified, "evidence": evidence}) # Whether the information was verified, and any relevant supporting evidence found.
+
+            except Exception as e:  #Handles any errors during verification
+                logger.error(f"FactCheckerAgent.verify_claim: Error verifying claim '{claim}': {e}") #Logs the error and provides details, such as the claim that failed to be verified.
+                verifications.append({"verified": False, "evidence": f"Error during verification: {e}"})  #Fallback on error, provides feedback
+        return verifications
 
 
 #In main.py or wherever you create your agents:
@@ -1,7 +1,8 @@
 from flask import Flask, request, jsonify, make_response, abort
 from agent_system import AgentSystem
 from llm_interface import LLM_Interface
-from memory_manager import MemoryManager
+from memory_namespaces import SHARED_NAMESPACE
+from memory_registry import memory_registry
 from agent import Agent
 from flask_cors import CORS
 import sqlite3
@@ -29,7 +30,8 @@ db_path = os.path.join(basedir, 'agent_data.db')
 # For now, keep these outside:
 model_path = "_ACTUAL_PATH_/llama.cpp/llama-3.2-3b-instruct-q8_0.gguf"  # Update this path if needed.
 llm_interface = LLM_Interface(model_path=model_path)  # Initialize the LLM interface with model path
-memory_manager = MemoryManager()
+namespaced_memory = memory_registry.acquire_namespaced_memory(shared=True, legacy_memory_file="memory.pkl")  # Same instance the agents share; shared=True as several API worker processes may open the shards.
+memory_manager = namespaced_memory.namespace(SHARED_NAMESPACE)  # Not any one agent's shard; holds the memories imported from memory.pkl, and every agent searches it alongside its own.
 agent_system = AgentSystem(llm_interface, memory_manager)  # Initialize with LLM
 
 
@@ -0,0 +1,174 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Tuple, Callable
+
+from graph_backend import GraphBackend
+
+
+
+class CachedGraph(GraphBackend):
+    """Read-through LRU cache in front of another GraphBackend for get_node and search_nodes, so agents that look up the
+    same hot entities and searches again are served from memory instead of Neo4j.
+
+    Writes made through the cache invalidate exactly what they can change: a new node drops the cached searches that
+    could match it (those of its type and those without a type); relationships appear in neither result, so creating
+    them drops nothing. Writes made elsewhere (another process or client of the same graph) are not seen: call
+    invalidate() after them, or pass version_source, a cheap callable returning a counter that such writers bump, which
+    is checked before every lookup. Either bumps version, which retires every older entry at once.
+    Traversals (subgraph, shortest_path) are not cached.
+    """
+
+    def __init__(self, graph: GraphBackend, max_entries: int = 10_000, version_source: Callable[[], Any] = None):
+        self.graph = graph
+        self.max_entries = max_entries
+        self.version_source = version_source
+        self.version = 0  # Entries cached under an older version are stale.
+        self._source_version = version_source() if version_source else None
+        self._entries: "OrderedDict[Tuple, Tuple[int, Any]]" = OrderedDict()  # Key -> (version, result).
+        self._searches: Dict[Any, set] = {}  # node_type -> keys of its cached searches, for invalidation by type.
+        self._writes = 0  # Invalidations so far; a result read before one is not cached after it.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0  # Entries dropped by writes.
+
+
+    def _check_version(self):
+        if self.version_source is None:
+            return
+        source_version = self.version_source()
+        if source_version != self._source_version:
+            self._source_version = source_version
+            self.invalidate()
+
+
+    def _get(self, key: Tuple) -> Tuple[bool, Any, int]:
+        """(hit, result, writes): result is the cached one on a hit; writes stamps a miss for _put."""
+        self._check_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self.version:
+                self._entries.move_to_end(key)  # Most recently used.
+                self.hits += 1
+                return True, entry[1], self._writes
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return False, None, self._writes
+
+
+    def _put(self, key: Tuple, result: Any, writes: int):
+        with self._lock:
+            if self.max_entries <= 0 or writes != self._writes:  # A write raced the read; its result may be stale.
+                return
+            self._entries[key] = (self.version, result)
+            self._entries.move_to_end(key)
+            if key[0] == "search":
+                self._searches.setdefault(key[2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))  # Least recently used.
+                self.evictions += 1
+
+
+    def _drop(self, key: Tuple):
+        del self._entries[key]
+        if key[0] == "search":
+            self._searches.get(key[2], set()).discard(key)
+
+
+    def _invalidate_type(self, node_type: str):
+        """Drops the cached searches a new node of node_type could appear in."""
+        with self._lock:
+            self._writes += 1
+            for searched_type in (node_type, None):
+                for key in self._searches.pop(searched_type, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+
+    def invalidate(self):
+        """Retires every cached result, e.g. after another process wrote to the graph."""
+        with self._lock:
+            self._writes += 1
+            self.version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._searches.clear()
+
+
+    def create_node(self, node_type: str, properties: Dict[str, Any]) -> int or None:
+        try:
+            return self.graph.create_node(node_type, properties)
+        finally:
+            self._invalidate_type(node_type)
+
+
+    def create_nodes(self, node_type: str, properties_list: List[Dict[str, Any]], batch_size: int = None) -> List[int] or None:
+        try:
+            return self.graph.create_nodes(node_type, properties_list, batch_size)
+        finally:
+            self._invalidate_type(node_type)  # Even on error: earlier batches may have been committed.
+
+
+    def create_relationship(self, source_node_id: int, target_node_id: int, relationship_type: str, properties: Dict[str, Any] = None) -> bool:
+        return self.graph.create_relationship(source_node_id, target_node_id, relationship_type, properties)
+
+
+    def create_relationships(self, relationships: Iterable[Tuple], batch_size: int = None) -> int:
+        return self.graph.create_relationships(relationships, batch_size)
+
+
+    def get_node(self, node_id: int) -> Dict[str, Any] or None:
+        """The node's properties, from the cache if possible. A missing node is not cached, so creating it needs no
+        invalidation."""
+        key = ("node", node_id)
+        hit, node, writes = self._get(key)
+        if not hit:
+            node = self.graph.get_node(node_id)
+            if node is None:
+                return None
+            self._put(key, node, writes)
+        return dict(node)  # A copy, so callers cannot change the cached node.
+
+
+    def search_nodes(self, query: str = None, node_type=None, properties=None, limit: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        """A page of search results, from the cache if the same search (query, type, properties, page) was made before."""
+        key = ("search", query, node_type, json.dumps(properties or {}, sort_keys=True, default=str), limit, skip)
+        hit, nodes, writes = self._get(key)
+        if not hit:
+            nodes = self.graph.search_nodes(query, node_type, properties, limit, skip)
+            if nodes:  # Backends report errors as an empty page, so empty pages are not cached.
+                self._put(key, nodes, writes)
+        return [dict(node) for node in nodes]
+
+
+    def subgraph(self, node_ids: List[int], depth: int = 1, relationship_types: List[str] = None, direction: str = "both", limit: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+        return self.graph.subgraph(node_ids, depth, relationship_types, direction, limit)
+
+
+    def shortest_path(self, source_node_id: int, target_node_id: int, relationship_types: List[str] = None, direction: str = "both", max_depth: int = 6) -> Dict[str, List[Dict[str, Any]]] or None:
+        return self.graph.shortest_path(source_node_id, target_node_id, relationship_types, direction, max_depth)
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and sizes, e.g. for the metrics UI."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'version': self.version
+            }
+
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            self._searches.clear()
+        self.graph.close()
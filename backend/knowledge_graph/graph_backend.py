@@ -0,0 +1,94 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+GRAPH_BACKENDS = ("neo4j", "local")
+DIRECTIONS = ("out", "in", "both")  # Which relationships a traversal follows from a node.
+
+
+
+class GraphBackend(ABC):
+    """The knowledge graph API shared by every backend: KnowledgeGraph (a Neo4j server) and LocalGraph (in-process, SQLite).
+
+    Nodes have one type (label) and a property dict and are addressed by integer ids; relationships are typed, directed
+    and may carry properties. Errors are logged and reported by the return value (None, False, 0 or []), not raised.
+
+    Traversals (subgraph, neighbourhood, shortest_path) return {'nodes': [{'id', 'type', 'properties'}, ...],
+    'relationships': [{'id', 'source', 'target', 'type', 'properties'}, ...]}, each read in one read transaction (for
+    KnowledgeGraph, shortest_path is one query; subgraph and neighbourhood run one query per hop, then one for the result).
+    """
+
+    @abstractmethod
+    def create_node(self, node_type: str, properties: Dict[str, Any]) -> int or None:
+        pass
+
+
+    @abstractmethod
+    def create_nodes(self, node_type: str, properties_list: List[Dict[str, Any]], batch_size: int = None) -> List[int] or None:
+        pass
+
+
+    @abstractmethod
+    def create_relationship(self, source_node_id: int, target_node_id: int, relationship_type: str, properties: Dict[str, Any] = None) -> bool:
+        pass
+
+
+    @abstractmethod
+    def create_relationships(self, relationships: Iterable[Tuple], batch_size: int = None) -> int:
+        pass
+
+
+    @abstractmethod
+    def get_node(self, node_id: int) -> Dict[str, Any] or None:
+        pass
+
+
+    @abstractmethod
+    def search_nodes(self, query: str = None, node_type=None, properties=None, limit: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        pass
+
+
+    @abstractmethod
+    def subgraph(self, node_ids: List[int], depth: int = 1, relationship_types: List[str] = None, direction: str = "both", limit: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+        """The nodes within depth hops of any of node_ids, following only relationship_types (default: all) in direction,
+        nearest first and at most limit of them, with every relationship of those types between them."""
+        pass
+
+
+    def neighbourhood(self, node_id: int, depth: int = 1, relationship_types: List[str] = None, direction: str = "both", limit: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+        """The k-hop neighbourhood of one node, e.g. to build an agent's context around an entity."""
+        return self.subgraph([node_id], depth, relationship_types, direction, limit)
+
+
+    @abstractmethod
+    def shortest_path(self, source_node_id: int, target_node_id: int, relationship_types: List[str] = None, direction: str = "both", max_depth: int = 6) -> Dict[str, List[Dict[str, Any]]] or None:
+        """The nodes (in order) and relationships of a shortest path of at most max_depth hops, or None if there is none."""
+        pass
+
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+
+def open_graph(backend: str = "neo4j", cache_entries: int = 0, **kwargs: Any) -> GraphBackend:
+    """Opens a knowledge graph on the given backend: "neo4j" (KnowledgeGraph; uri, username, password, ...) or "local"
+    (LocalGraph; path of its SQLite file). Each backend's module is imported on demand, so "local" needs no Neo4j driver.
+    With cache_entries, lookups go through a CachedGraph of that size."""
+    if backend == "neo4j":
+        from knowledge_graph import KnowledgeGraph
+        graph = KnowledgeGraph(**kwargs)
+    elif backend == "local":
+        from local_graph import LocalGraph
+        graph = LocalGraph(**kwargs)
+    else:
+        raise ValueError(f"open_graph: Unknown backend '{backend}'. Expected one of {GRAPH_BACKENDS}.")
+    if cache_entries:
+        from cached_graph import CachedGraph
+        graph = CachedGraph(graph, max_entries=cache_entries)
+    return graph
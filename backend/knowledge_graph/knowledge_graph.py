@@ -1,19 +1,65 @@
 import logging
-from typing import List, Dict, Any
+import queue
+import re
+from contextlib import contextmanager
+from itertools import groupby
+from typing import List, Dict, Any, Iterable, Tuple
 
 from neo4j import GraphDatabase  # For Neo4j (install with: pip install neo4j)
+
+from graph_backend import DIRECTIONS, GraphBackend
 # from rdflib import Graph, URIRef, Literal, BNode  # For RDFlib (optional - install with: pip install rdflib)
 
 logger = logging.getLogger(__name__)
 
 
-class KnowledgeGraph:
-    def __init__(self, uri: str = "bolt://localhost:7687", username: str = "neo4j", password: str = "your_password", graph_name="TeagardanKnowledgeGraph"): # Default values - replace with your actual credentials
+_WORD = re.compile(r"\w+")  # Never split by the full-text analyzer, and free of Lucene syntax characters.
+
+
+def _quote(name: str) -> str:
+    """Backtick-quotes a label, relationship type or property key, which Cypher cannot take as parameters."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def _fulltext_candidates(query: str) -> str:
+    """A Lucene query matching every node that contains query as a substring (and more): each of its words within
+    some indexed token, e.g. "ali sm" -> "*ali* AND *sm*". Empty if query has no words."""
+    return " AND ".join(f"*{word}*" for word in _WORD.findall(query.lower()))
+
+
+def _relationship_pattern(relationship_types: List[str] = None) -> str:
+    """The type filter of a relationship pattern, e.g. ":`KNOWS`|`FOLLOWS`" (empty for any type)."""
+    return ":" + "|".join(_quote(name) for name in relationship_types) if relationship_types else ""
+
+
+def _arrows(direction: str) -> Tuple[str, str]:
+    """The two sides of a relationship pattern that follows relationships in direction."""
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown direction '{direction}'. Expected one of {DIRECTIONS}.")
+    return {"out": ("-", "->"), "in": ("<-", "-"), "both": ("-", "-")}[direction]
+
+
+# Projections of the `nodes` and `relationships` lists of a traversal into GraphBackend's result dicts.
+_NODES = "[n IN nodes | {id: id(n), type: head(labels(n)), properties: properties(n)}]"
+_RELATIONSHIPS = "[r IN relationships | {id: id(r), source: id(startNode(r)), target: id(endNode(r)), type: type(r), properties: properties(r)}]"
+
+
+class KnowledgeGraph(GraphBackend):
+    """GraphBackend on a Neo4j server (see LocalGraph for an in-process one)."""
+
+    def __init__(self, uri: str = "bolt://localhost:7687", username: str = "neo4j", password: str = "your_password", graph_name="TeagardanKnowledgeGraph", session_pool_size: int = 8, batch_size: int = 1000, fulltext_properties=("name", "description", "text"), auto_index: bool = True): # Default values - replace with your actual credentials
         self.driver = None
         self.uri = uri
         self.username = username
         self.password = password
         self.graph_name = graph_name
+        self.batch_size = batch_size  # Rows sent per UNWIND transaction by create_nodes/create_relationships.
+        self._sessions = queue.LifoQueue(maxsize=session_pool_size)  # Idle sessions reused across calls instead of opening one per call.
+        self.fulltext_properties = tuple(fulltext_properties)  # Properties search_nodes matches its query text against.
+        self.auto_index = auto_index  # Create the indexes a search_nodes call needs on first use (see ensure_indexes).
+        self._indexes = set()  # (kind, label, property) of indexes known to exist...
+        self._online_indexes = set()  # ...and of those known to be populated.
+        self._failed_indexes = set()  # Not retried, e.g. for lack of schema privileges.
 
         try: #Try connecting, otherwise raise exception.  This helps in alerting you to any misconfigurations in your database, before attempting to use it.
             self.driver = GraphDatabase.driver(self.uri, auth=(self.username, self.password)) #Establish connection
@@ -27,12 +73,38 @@ class KnowledgeGraph:
 
 
     def close(self):
+        while True:  # Idle pooled sessions first; the driver owns their connections.
+            try:
+                self._sessions.get_nowait().close()
+            except queue.Empty:
+                break
         if self.driver:  #Check to make sure the driver exists before attempting to use it.  This helps avoid errors and makes the program more robust.
 
             self.driver.close()
             logger.info("KnowledgeGraph: Connection to Neo4j closed.")
 
 
+    @contextmanager
+    def _session(self):
+        """Borrows an idle session from the pool, or opens one, and returns it to the pool afterwards.
+
+        Sessions are not thread-safe, so each is used by one caller at a time; one that raised is closed instead of reused.
+        """
+        try:
+            session = self._sessions.get_nowait()
+        except queue.Empty:
+            session = self.driver.session()
+        try:
+            yield session
+        except Exception:
+            session.close()
+            raise
+        try:
+            self._sessions.put_nowait(session)
+        except queue.Full:
+            session.close()
+
+
     def create_node(self, node_type: str, properties: Dict[str, Any]) -> int or None: #Updated for better typing, returns node ID.
         """Creates a node in the graph."""
         if not self.driver:
@@ -41,7 +113,7 @@ class KnowledgeGraph:
 
 
         try:
-            with self.driver.session() as session: #Use a session.  More robust.
+            with self._session() as session: #Use a session.  More robust.
                 result = session.write_transaction(self._create_and_return_id, node_type, properties)  # Correct method call.
                 logger.info(f"KnowledgeGraph.create_node: Created node with type '{node_type}' and properties '{properties}'. Node ID: {result}")  #Log and show information about created node.
 
@@ -60,7 +132,7 @@ class KnowledgeGraph:
 
         # Uses f-strings for query construction.  Makes the query easier to read.  You can modify the query as needed if the structure of your database is different, or use an index if one is created for your database.
         query = f'''
-            CREATE (n:{node_type} $props)
+            CREATE (n:{_quote(node_type)} $props)
             RETURN id(n) AS node_id
         '''
 
@@ -72,6 +144,82 @@ class KnowledgeGraph:
 
 
 
+    def create_nodes(self, node_type: str, properties_list: List[Dict[str, Any]], batch_size: int = None) -> List[int] or None:
+        """Creates many nodes of one type: one transaction with a single UNWIND query per batch_size nodes.
+
+        Returns the node ids in input order, or None on error (batches committed before the error are kept).
+        """
+        if not self.driver:
+            logger.error("KnowledgeGraph.create_nodes: Not connected to the database.")
+            return None
+
+        batch_size = batch_size or self.batch_size
+        node_ids = []
+        try:
+            with self._session() as session:
+                for start in range(0, len(properties_list), batch_size):
+                    node_ids.extend(session.write_transaction(self._create_nodes, node_type, properties_list[start:start + batch_size]))
+            logger.info(f"KnowledgeGraph.create_nodes: Created {len(node_ids)} nodes of type '{node_type}'.")
+            return node_ids
+        except Exception as e:
+            logger.error(f"KnowledgeGraph.create_nodes: Error creating nodes of type '{node_type}' after {len(node_ids)} nodes: {e}")
+            return None
+
+
+    @staticmethod
+    def _create_nodes(tx, node_type, rows):
+        """Inner function for batched node creation; UNWIND keeps the input order."""
+        query = f'''
+            UNWIND $rows AS props
+            CREATE (n:{_quote(node_type)})
+            SET n = props
+            RETURN id(n) AS node_id
+        '''
+        return [record["node_id"] for record in tx.run(query, rows=rows)]
+
+
+
+
+    def create_relationships(self, relationships: Iterable[Tuple], batch_size: int = None) -> int:
+        """Creates many relationships, given as (source_node_id, target_node_id, relationship_type[, properties]) tuples.
+
+        Relationships are grouped by consecutive type (a type cannot be a query parameter) and sent batch_size per
+        transaction with a single UNWIND query. Returns the number created; on error, those committed before it.
+        """
+        if not self.driver:
+            logger.error("KnowledgeGraph.create_relationships: Not connected to the database.")
+            return 0
+
+        batch_size = batch_size or self.batch_size
+        created = 0
+        try:
+            with self._session() as session:
+                for relationship_type, group in groupby(relationships, key=lambda relationship: relationship[2]):
+                    rows = [{'source_id': r[0], 'target_id': r[1], 'props': (r[3] if len(r) > 3 else None) or {}} for r in group]
+                    for start in range(0, len(rows), batch_size):
+                        created += session.write_transaction(self._create_relationships, relationship_type, rows[start:start + batch_size])
+            logger.info(f"KnowledgeGraph.create_relationships: Created {created} relationships.")
+        except Exception as e:
+            logger.error(f"KnowledgeGraph.create_relationships: Error after creating {created} relationships: {e}")
+        return created
+
+
+    @staticmethod
+    def _create_relationships(tx, relationship_type, rows):
+        """Inner function for batched relationship creation."""
+        query = f"""
+            UNWIND $rows AS row
+            MATCH (a) WHERE id(a) = row.source_id
+            MATCH (b) WHERE id(b) = row.target_id
+            CREATE (a)-[r:{_quote(relationship_type)}]->(b)
+            SET r = row.props
+            RETURN count(r) AS created
+        """
+        return tx.run(query, rows=rows).single()["created"]
+
+
+
+
     def create_relationship(self, source_node_id: int, target_node_id: int, relationship_type: str, properties: Dict[str, Any] = None) -> bool:  #Return boolean for success/failure.
 
         """Creates a relationship between two nodes."""
@@ -84,7 +232,7 @@ class KnowledgeGraph:
 
         try:
 
-            with self.driver.session() as session:
+            with self._session() as session:
                 session.write_transaction(self._create_relationship, source_node_id, target_node_id, relationship_type, properties)
                 logger.info(f"KnowledgeGraph.create_relationship: Created relationship '{relationship_type}' between nodes {source_node_id} and {target_node_id} with properties {properties}.") #Log successful relationship creation and provide relevant details.
 
@@ -104,7 +252,7 @@ class KnowledgeGraph:
         query = f"""
             MATCH (a) WHERE id(a) = $source_id
             MATCH (b) WHERE id(b) = $target_id
-            CREATE (a)-[r:{relationship_type} $props]->(b)
+            CREATE (a)-[r:{_quote(relationship_type)} $props]->(b)
             RETURN r
         """ # Uses parameterized query.
 
@@ -130,7 +278,7 @@ class KnowledgeGraph:
 
         try:  #Error handling when getting node.  Handles exceptions such as connection or authentication errors, or invalid query or parameters given.
 
-            with self.driver.session() as session: #Use session. More robust.
+            with self._session() as session: #Use session. More robust.
 
                 node = session.read_transaction(self._get_node, node_id)  #Correct call
                 return node
@@ -164,9 +312,16 @@ class KnowledgeGraph:
 
 
 
-    def search_nodes(self, query: str, node_type=None, properties=None) -> List[Dict[str, Any]]: #Return a list of dictionaries
+    def search_nodes(self, query: str = None, node_type=None, properties=None, limit: int = 100, skip: int = 0) -> List[Dict[str, Any]]: #Return a list of dictionaries
         """
-        Searches for nodes matching the given query and optional filters.
+        Searches for nodes matching the given query and optional filters, returning one page (skip, limit) of them.
+
+        query is a case-insensitive substring of one of the fulltext_properties (as in LocalGraph); properties must equal
+        the given values. Pages are ordered by id. Once the node_type's full-text index is online it narrows the
+        candidates down, but the substring check decides, so results do not change when it comes online. Values are
+        always query parameters, so searches of the same shape reuse one cached query plan. With a node_type and
+        auto_index, the label+property and full-text indexes the search needs are created on first use (best effort,
+        without waiting for them to populate). Without a node_type no index applies.
         """
 
 
@@ -177,10 +332,13 @@ class KnowledgeGraph:
 
 
 
-        try:
-            with self.driver.session() as session:
+        if node_type and self.auto_index:
+            self.ensure_indexes(node_type, list(properties or {}), fulltext=bool(query))
 
-                nodes = session.read_transaction(self._search_nodes, query, node_type, properties)  # Correct call
+        try:
+            with self._session() as session:
+                fulltext = bool(query and node_type) and self._fulltext_online(session, node_type)
+                nodes = session.read_transaction(self._search_nodes, query, node_type, properties, skip, limit, self.fulltext_properties, fulltext)  # Correct call
                 return nodes
         except Exception as e:  # Handle exception and include details.
             logger.error(f"KnowledgeGraph.search_nodes: Error during node search: {e}") #Log and show error info.  Can improve for users.
@@ -191,26 +349,181 @@ class KnowledgeGraph:
 
 
     @staticmethod  #staticmethod since self is not used.
-    def _search_nodes(tx, query, node_type, properties):
-        """Inner function for node search."""
+    def _search_nodes(tx, query, node_type, properties, skip, limit, fulltext_properties, fulltext=False):
+        """Inner function for node search; fulltext: take the query's candidates from the node_type's (online) full-text index."""
+
+        params = {'skip': skip, 'limit': limit}
+        conditions = []
+        for i, (key, value) in enumerate((properties or {}).items()):
+            conditions.append(f"n.{_quote(key)} = $value{i}")
+            params[f"value{i}"] = value
+
+        candidates = _fulltext_candidates(query) if fulltext and query else ""
+        if candidates:  # The label's full-text index, instead of scanning every node of the label.
+            match = "CALL db.index.fulltext.queryNodes($index, $candidates) YIELD node AS n"
+            params['index'] = KnowledgeGraph.fulltext_index_name(node_type)
+            params['candidates'] = candidates
+        else:
+            match = f"MATCH (n:{_quote(node_type)})" if node_type else "MATCH (n)"
+        if query:  # Case-insensitive substring, also of full-text candidates (Lucene matches whole tokens).
+            conditions.append("(" + " OR ".join(f"toLower(toString(n.{_quote(name)})) CONTAINS $query" for name in fulltext_properties) + ")")
+            params['query'] = query.lower()
 
+        where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        result = tx.run(f"{match}{where_clause} RETURN n ORDER BY id(n) SKIP $skip LIMIT $limit", params)  # Stable pages. A dict, as $query would clash with run()'s own query argument.
+        nodes = [dict(record['n']) for record in result]
+        return nodes
 
-        #Base query.
-        where_clause = ""
-        if node_type:
-            where_clause += f"n:{node_type} "  #Add filter for type if provided.
-        if properties: #Add filter for properties if given.
 
-            for key, value in properties.items():
 
-                #Add query for each property.  You should sanitize values to avoid injection attacks.  You'll need to implement this as required for your specific property types.
-                where_clause += f"AND n.{key} = '{value}' " if where_clause else f"n.{key} = '{value}' " 
-        query = f"MATCH (n) WHERE {where_clause} RETURN n" if where_clause else "MATCH (n) RETURN n"
-        # Use query to search.
 
-        result = tx.run(query)
-        nodes = [dict(record['n']) for record in result]
-        return nodes
+    @staticmethod
+    def index_name(node_type: str, property_name: str) -> str:
+        return f"kg_{node_type}_{property_name}"
+
+
+    @staticmethod
+    def fulltext_index_name(node_type: str) -> str:
+        return f"kg_{node_type}_fulltext"
+
+
+    def ensure_indexes(self, node_type: str, properties: Iterable[str] = (), fulltext: bool = False, wait: bool = False, timeout: int = 300) -> bool:
+        """Creates a range index on each of the node_type's properties and, with fulltext, the node_type's full-text index
+        over fulltext_properties, unless they exist. Best effort: failures are logged and not retried.
+
+        With wait (e.g. at startup, never on a request path), also waits up to timeout seconds until they are online.
+        Returns whether every index was created.
+        """
+        wanted = [("range", node_type, name) for name in properties] + ([("fulltext", node_type, None)] if fulltext else [])
+        missing = [index for index in wanted if index not in self._indexes and index not in self._failed_indexes]
+        if not missing and not wait:
+            return not any(index in self._failed_indexes for index in wanted)
+        try:
+            with self._session() as session:  # Schema changes run as their own auto-commit transactions.
+                for index in missing:
+                    kind, label, name = index
+                    try:
+                        if kind == "range":
+                            session.run(f"CREATE INDEX {_quote(self.index_name(label, name))} IF NOT EXISTS FOR (n:{_quote(label)}) ON (n.{_quote(name)})").consume()
+                        else:
+                            fields = ", ".join(f"n.{_quote(field)}" for field in self.fulltext_properties)
+                            session.run(f"CREATE FULLTEXT INDEX {_quote(self.fulltext_index_name(label))} IF NOT EXISTS FOR (n:{_quote(label)}) ON EACH [{fields}]").consume()
+                        self._indexes.add(index)
+                    except Exception as e:
+                        logger.warning(f"KnowledgeGraph.ensure_indexes: Could not create {kind} index for '{label}' (searching without it): {e}")
+                        self._failed_indexes.add(index)
+                if wait:
+                    session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+                    self._online_indexes.update(index for index in wanted if index in self._indexes)
+        except Exception as e:
+            logger.warning(f"KnowledgeGraph.ensure_indexes: Error ensuring indexes for '{node_type}': {e}")
+            return False
+        logger.info(f"KnowledgeGraph.ensure_indexes: Ensured {len(missing)} indexes for '{node_type}'.")
+        return not any(index in self._failed_indexes for index in wanted)
+
+
+    def _fulltext_online(self, session, node_type: str) -> bool:
+        """Whether the node_type's full-text index exists and is populated; querying it before then would fail."""
+        index = ("fulltext", node_type, None)
+        if index in self._online_indexes:
+            return True
+        if index not in self._indexes:
+            return False
+        try:
+            record = session.run("SHOW FULLTEXT INDEXES YIELD name, state WHERE name = $name RETURN state", name=self.fulltext_index_name(node_type)).single()
+        except Exception as e:
+            logger.warning(f"KnowledgeGraph.search_nodes: Could not read the state of the full-text index of '{node_type}': {e}")
+            return False
+        if record and record["state"] == "ONLINE":
+            self._online_indexes.add(index)
+            return True
+        return False
+
+
+
+
+    def subgraph(self, node_ids: List[int], depth: int = 1, relationship_types: List[str] = None, direction: str = "both", limit: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+        """The nodes within depth hops of any of node_ids, nearest first and at most limit of them, and the relationships
+        of relationship_types between them, fetched in one read transaction with one query per hop."""
+        if not self.driver:
+            logger.error("KnowledgeGraph.subgraph: Not connected to the database.")
+            return {'nodes': [], 'relationships': []}
+
+        try:
+            with self._session() as session:
+                return session.read_transaction(self._subgraph, list(node_ids), int(depth), relationship_types, direction, limit)
+        except Exception as e:
+            logger.error(f"KnowledgeGraph.subgraph: Error fetching the subgraph around nodes {node_ids}: {e}")
+            return {'nodes': [], 'relationships': []}
+
+
+    @staticmethod
+    def _subgraph(tx, node_ids, depth, relationship_types, direction, limit):
+        """Inner function for subgraph extraction: breadth first, each hop expands only the DISTINCT nodes first reached
+        by the previous one (a variable-length match would enumerate every path, exponentially many around hubs), so the
+        work is bounded by the visited nodes. Then the relationships between them are collected from their outgoing side
+        (so each appears once)."""
+        types = _relationship_pattern(relationship_types)
+        left, right = _arrows(direction)
+        expand = f"""
+            UNWIND $frontier AS frontier_id
+            MATCH (a){left}[{types}]{right}(b) WHERE id(a) = frontier_id AND NOT id(b) IN $visited
+            RETURN DISTINCT id(b) AS node_id ORDER BY node_id LIMIT $limit
+        """
+        frontier = [record['node_id'] for record in tx.run("MATCH (n) WHERE id(n) IN $node_ids RETURN id(n) AS node_id ORDER BY node_id LIMIT $limit", node_ids=node_ids, limit=limit)]
+        found = list(frontier)  # Nearest first.
+        for _ in range(depth):
+            if not frontier or len(found) >= limit:
+                break
+            frontier = [record['node_id'] for record in tx.run(expand, frontier=frontier, visited=found, limit=limit - len(found))]
+            found.extend(frontier)
+        if not found:
+            return {'nodes': [], 'relationships': []}
+
+        query = f"""
+            MATCH (n) WHERE id(n) IN $node_ids
+            WITH collect(n) AS nodes
+            UNWIND nodes AS a
+            OPTIONAL MATCH (a)-[r{types}]->(b) WHERE b IN nodes
+            WITH nodes, collect(r) AS relationships
+            RETURN {_NODES} AS nodes, {_RELATIONSHIPS} AS relationships
+        """
+        record = tx.run(query, node_ids=found).single()
+        order = {node_id: i for i, node_id in enumerate(found)}
+        return {'nodes': sorted(record['nodes'], key=lambda node: order[node['id']]), 'relationships': record['relationships']}
+
+
+
+
+    def shortest_path(self, source_node_id: int, target_node_id: int, relationship_types: List[str] = None, direction: str = "both", max_depth: int = 6) -> Dict[str, List[Dict[str, Any]]] or None:
+        """A shortest path of at most max_depth hops (Cypher shortestPath, one query), or None if there is none."""
+        if not self.driver:
+            logger.error("KnowledgeGraph.shortest_path: Not connected to the database.")
+            return None
+
+        try:
+            with self._session() as session:
+                return session.read_transaction(self._shortest_path, source_node_id, target_node_id, relationship_types, direction, int(max_depth))
+        except Exception as e:
+            logger.error(f"KnowledgeGraph.shortest_path: Error finding a path from node {source_node_id} to {target_node_id}: {e}")
+            return None
+
+
+    @staticmethod
+    def _shortest_path(tx, source_node_id, target_node_id, relationship_types, direction, max_depth):
+        """Inner function for shortest path search."""
+        types = _relationship_pattern(relationship_types)
+        left, right = _arrows(direction)
+        hops = "0" if source_node_id == target_node_id else "1"  # shortestPath rejects a zero-length path unless asked for one.
+        query = f"""
+            MATCH (a) WHERE id(a) = $source_id
+            MATCH (b) WHERE id(b) = $target_id
+            MATCH path = shortestPath((a){left}[{types}*{hops}..{max_depth}]{right}(b))
+            WITH nodes(path) AS nodes, relationships(path) AS relationships
+            RETURN {_NODES} AS nodes, {_RELATIONSHIPS} AS relationships
+        """
+        record = tx.run(query, source_id=source_node_id, target_id=target_node_id).single()
+        return {'nodes': record['nodes'], 'relationships': record['relationships']} if record else None
 
 #(Optional) RDFlib implementation (uncomment if needed):
 
@@ -0,0 +1,325 @@
+import json
+import logging
+import operator
+import sqlite3
+import threading
+from array import array
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Tuple
+
+from graph_backend import DIRECTIONS, GraphBackend
+
+
+logger = logging.getLogger(__name__)
+
+
+def _index_key(value: Any) -> str:
+    """Hashable form of a property value (values may be lists or dicts), as used by the property indexes."""
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+
+class LocalGraph(GraphBackend):
+    """In-process GraphBackend: the graph lives in compact arrays in RAM, and every write is committed to a SQLite file.
+
+    Node ids are dense row numbers, so get_node is a list lookup. Relationships are parallel arrays of source, target
+    and interned type, and every node has arrays of its outgoing and incoming relationship ids. search_nodes starts from
+    the node list of a label and, for property filters, from a hash index per (label, property), built on first use and
+    kept up to date on insert. Meant for single-process deployments and tests; a shared graph needs KnowledgeGraph.
+    """
+
+    def __init__(self, path: str = "knowledge_graph.db", batch_size: int = 1000, fulltext_properties=("name", "description", "text")):
+        self.path = path  # SQLite file, or ":memory:" for a graph that is not persisted.
+        self.batch_size = batch_size  # Rows per SQLite transaction in create_nodes/create_relationships.
+        self.fulltext_properties = tuple(fulltext_properties)  # Properties search_nodes matches its query text against.
+        self._lock = threading.RLock()
+
+        self.labels: List[str] = []  # Interned node types...
+        self.types: List[str] = []  # ...and relationship types.
+        self._label_ids: Dict[str, int] = {}
+        self._type_ids: Dict[str, int] = {}
+        self.node_labels = array('I')  # Node id -> position in labels.
+        self.node_properties: List[Dict[str, Any]] = []
+        self.nodes_by_label: Dict[int, array] = {}  # Label -> its node ids, ascending.
+        self.outgoing: List[array] = []  # Node id -> ids of the relationships starting at it.
+        self.incoming: List[array] = []  # Node id -> ids of the relationships ending at it.
+        self.relationship_sources = array('q')
+        self.relationship_targets = array('q')
+        self.relationship_types = array('I')  # Relationship id -> position in types.
+        self.relationship_properties: List[Dict[str, Any]] = []
+        self._property_indexes: Dict[Tuple[int, str], Dict[str, List[int]]] = {}  # (label, property) -> value -> node ids.
+
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)  # Access is serialized by self._lock.
+            self._db.execute("CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, label TEXT NOT NULL, properties TEXT NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS relationships (id INTEGER PRIMARY KEY, source INTEGER NOT NULL, target INTEGER NOT NULL, type TEXT NOT NULL, properties TEXT NOT NULL)")
+            self._db.commit()
+            for _, label, properties in self._db.execute("SELECT id, label, properties FROM nodes ORDER BY id"):
+                self._add_node(label, json.loads(properties))
+            for _, source, target, relationship_type, properties in self._db.execute("SELECT id, source, target, type, properties FROM relationships ORDER BY id"):
+                self._add_relationship(source, target, relationship_type, json.loads(properties))
+            logger.info(f"LocalGraph: Opened '{path}' with {len(self.node_properties)} nodes and {len(self.relationship_properties)} relationships.")
+        except sqlite3.Error as e:
+            logger.error(f"LocalGraph: Error opening '{path}': {e}")
+            self._db = None
+
+
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+                logger.info(f"LocalGraph: Closed '{self.path}'.")
+
+
+    @staticmethod
+    def _intern(name: str, names: List[str], ids: Dict[str, int]) -> int:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+
+    def _add_node(self, label: str, properties: Dict[str, Any]) -> int:
+        """Adds a committed node to the in-memory graph."""
+        node_id = len(self.node_properties)
+        label_id = self._intern(label, self.labels, self._label_ids)
+        self.node_labels.append(label_id)
+        self.node_properties.append(properties)
+        self.nodes_by_label.setdefault(label_id, array('q')).append(node_id)
+        self.outgoing.append(array('q'))
+        self.incoming.append(array('q'))
+        for (indexed_label, name), index in self._property_indexes.items():
+            if indexed_label == label_id and name in properties:
+                index.setdefault(_index_key(properties[name]), []).append(node_id)
+        return node_id
+
+
+    def _add_relationship(self, source: int, target: int, relationship_type: str, properties: Dict[str, Any]) -> int:
+        """Adds a committed relationship to the in-memory graph."""
+        relationship_id = len(self.relationship_properties)
+        self.relationship_sources.append(source)
+        self.relationship_targets.append(target)
+        self.relationship_types.append(self._intern(relationship_type, self.types, self._type_ids))
+        self.relationship_properties.append(properties)
+        self.outgoing[source].append(relationship_id)
+        self.incoming[target].append(relationship_id)
+        return relationship_id
+
+
+    def has_node(self, node_id: int) -> bool:
+        return self._node_index(node_id) is not None
+
+
+    def _node_index(self, node_id: int) -> int or None:
+        """node_id as a plain int (from any integer type, e.g. numpy.int64) if that node exists, else None."""
+        try:
+            node_id = operator.index(node_id)
+        except TypeError:
+            return None
+        return node_id if 0 <= node_id < len(self.node_properties) else None
+
+
+    def create_node(self, node_type: str, properties: Dict[str, Any]) -> int or None:
+        """Creates a node in the graph. Returns its id."""
+        node_ids = self.create_nodes(node_type, [properties])
+        return node_ids[0] if node_ids else None
+
+
+    def create_nodes(self, node_type: str, properties_list: List[Dict[str, Any]], batch_size: int = None) -> List[int] or None:
+        """Creates many nodes of one type, batch_size per SQLite transaction. Returns their ids in input order, or None on
+        error (batches committed before the error are kept)."""
+        if not self._db:
+            logger.error("LocalGraph.create_nodes: Graph is not open.")
+            return None
+
+        batch_size = batch_size or self.batch_size
+        node_ids = []
+        with self._lock:
+            try:
+                for start in range(0, len(properties_list), batch_size):
+                    payloads = [json.dumps(properties or {}, default=str) for properties in properties_list[start:start + batch_size]]
+                    first_id = len(self.node_properties)
+                    with self._db:  # One transaction, committed on exit.
+                        self._db.executemany("INSERT INTO nodes (id, label, properties) VALUES (?, ?, ?)", [(first_id + i, node_type, payload) for i, payload in enumerate(payloads)])
+                    node_ids.extend(self._add_node(node_type, json.loads(payload)) for payload in payloads)  # As stored, e.g. dates as strings.
+                return node_ids
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error(f"LocalGraph.create_nodes: Error creating nodes of type '{node_type}' after {len(node_ids)} nodes: {e}")
+                return None
+
+
+    def create_relationship(self, source_node_id: int, target_node_id: int, relationship_type: str, properties: Dict[str, Any] = None) -> bool:
+        """Creates a relationship between two nodes."""
+        return self.create_relationships([(source_node_id, target_node_id, relationship_type, properties)]) == 1
+
+
+    def create_relationships(self, relationships: Iterable[Tuple], batch_size: int = None) -> int:
+        """Creates many relationships, given as (source_node_id, target_node_id, relationship_type[, properties]) tuples,
+        batch_size per SQLite transaction. Relationships with a missing node are skipped, as a MATCH in Neo4j would.
+        Returns the number created; on error, those committed before it."""
+        if not self._db:
+            logger.error("LocalGraph.create_relationships: Graph is not open.")
+            return 0
+
+        batch_size = batch_size or self.batch_size
+        relationships = list(relationships)
+        created = 0
+        with self._lock:
+            try:
+                for start in range(0, len(relationships), batch_size):
+                    endpoints = [(self._node_index(r[0]), self._node_index(r[1]), r) for r in relationships[start:start + batch_size]]
+                    batch = [(source, target, r[2], json.dumps((r[3] if len(r) > 3 else None) or {}, default=str)) for source, target, r in endpoints
+                             if source is not None and target is not None]
+                    first_id = len(self.relationship_properties)
+                    with self._db:
+                        self._db.executemany("INSERT INTO relationships (id, source, target, type, properties) VALUES (?, ?, ?, ?, ?)", [(first_id + i,) + row for i, row in enumerate(batch)])
+                    for source, target, relationship_type, payload in batch:
+                        self._add_relationship(source, target, relationship_type, json.loads(payload))
+                    created += len(batch)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error(f"LocalGraph.create_relationships: Error after creating {created} relationships: {e}")
+        if created < len(relationships):
+            logger.warning(f"LocalGraph.create_relationships: Created {created} of {len(relationships)} relationships; the others have a missing node or failed.")
+        return created
+
+
+    def get_node(self, node_id: int) -> Dict[str, Any] or None:
+        """Retrieves a node's properties, or None if there is no such node."""
+        with self._lock:
+            node_id = self._node_index(node_id)
+            return dict(self.node_properties[node_id]) if node_id is not None else None
+
+
+    def _property_index(self, label_id: int, name: str) -> Dict[str, List[int]]:
+        index = self._property_indexes.get((label_id, name))
+        if index is None:  # Built on first search by this property, then maintained by _add_node.
+            index = self._property_indexes[(label_id, name)] = {}
+            for node_id in self.nodes_by_label.get(label_id, ()):
+                properties = self.node_properties[node_id]
+                if name in properties:
+                    index.setdefault(_index_key(properties[name]), []).append(node_id)
+        return index
+
+
+    def search_nodes(self, query: str = None, node_type=None, properties=None, limit: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        """Searches for nodes matching the given query and optional filters, returning one page (skip, limit) of them by id.
+
+        query is a case-insensitive substring of one of the fulltext_properties; properties must equal the given values.
+        With a node_type, the candidates come from the label's node list or, with property filters, its property indexes.
+        """
+        with self._lock:
+            properties = properties or {}
+            if node_type is not None:
+                label_id = self._label_ids.get(node_type)
+                if label_id is None:
+                    return []
+                if properties:
+                    matches = [set(self._property_index(label_id, name).get(_index_key(value), ())) for name, value in properties.items()]
+                    candidates = sorted(set.intersection(*matches))
+                else:
+                    candidates = self.nodes_by_label.get(label_id, ())
+            else:  # No label to narrow the search down: scan every node.
+                candidates = (node_id for node_id in range(len(self.node_properties))
+                              if all(name in self.node_properties[node_id] and _index_key(self.node_properties[node_id][name]) == _index_key(value) for name, value in properties.items()))
+
+            if query:
+                query = query.lower()
+                candidates = (node_id for node_id in candidates
+                              if any(query in str(self.node_properties[node_id].get(name, "")).lower() for name in self.fulltext_properties))
+            return [dict(self.node_properties[node_id]) for node_id in islice(candidates, skip, skip + limit)]
+
+
+    def _node_dict(self, node_id: int) -> Dict[str, Any]:
+        return {'id': node_id, 'type': self.labels[self.node_labels[node_id]], 'properties': dict(self.node_properties[node_id])}
+
+
+    def _relationship_dict(self, relationship_id: int) -> Dict[str, Any]:
+        return {'id': relationship_id, 'source': self.relationship_sources[relationship_id], 'target': self.relationship_targets[relationship_id],
+                'type': self.types[self.relationship_types[relationship_id]], 'properties': dict(self.relationship_properties[relationship_id])}
+
+
+    def _type_filter(self, relationship_types: List[str] = None) -> set or None:
+        """Type ids to follow, or None for all."""
+        return None if relationship_types is None else {self._type_ids[name] for name in relationship_types if name in self._type_ids}
+
+
+    def _neighbours(self, node_id: int, type_ids: set or None, direction: str):
+        """Yields (relationship id, neighbouring node id) for the relationships of a node a traversal may follow."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"LocalGraph: Unknown direction '{direction}'. Expected one of {DIRECTIONS}.")
+        if direction != "in":
+            for relationship_id in self.outgoing[node_id]:
+                if type_ids is None or self.relationship_types[relationship_id] in type_ids:
+                    yield relationship_id, self.relationship_targets[relationship_id]
+        if direction != "out":
+            for relationship_id in self.incoming[node_id]:
+                if type_ids is None or self.relationship_types[relationship_id] in type_ids:
+                    yield relationship_id, self.relationship_sources[relationship_id]
+
+
+    def subgraph(self, node_ids: List[int], depth: int = 1, relationship_types: List[str] = None, direction: str = "both", limit: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+        """The nodes within depth hops of any of node_ids (breadth first, so nearest first, at most limit of them) and the
+        relationships of the followed types between them."""
+        with self._lock:
+            try:
+                type_ids = self._type_filter(relationship_types)
+                found = {}  # Node id -> hops, in visiting order.
+                frontier = deque()
+                for node_id in map(self._node_index, node_ids):
+                    if node_id is not None and node_id not in found and len(found) < limit:
+                        found[node_id] = 0
+                        frontier.append(node_id)
+                while frontier and len(found) < limit:
+                    node_id = frontier.popleft()
+                    if found[node_id] == depth:
+                        continue
+                    for _, other in self._neighbours(node_id, type_ids, direction):
+                        if other not in found:
+                            found[other] = found[node_id] + 1
+                            frontier.append(other)
+                            if len(found) == limit:
+                                break
+
+                relationships = [relationship_id for node_id in found for relationship_id in self.outgoing[node_id]
+                                 if self.relationship_targets[relationship_id] in found and (type_ids is None or self.relationship_types[relationship_id] in type_ids)]
+                return {'nodes': [self._node_dict(node_id) for node_id in found], 'relationships': [self._relationship_dict(relationship_id) for relationship_id in relationships]}
+            except ValueError as e:
+                logger.error(f"LocalGraph.subgraph: {e}")
+                return {'nodes': [], 'relationships': []}
+
+
+    def shortest_path(self, source_node_id: int, target_node_id: int, relationship_types: List[str] = None, direction: str = "both", max_depth: int = 6) -> Dict[str, List[Dict[str, Any]]] or None:
+        """A shortest path of at most max_depth hops (breadth first search), or None if there is none."""
+        with self._lock:
+            source_node_id, target_node_id = self._node_index(source_node_id), self._node_index(target_node_id)
+            if source_node_id is None or target_node_id is None:
+                return None
+            try:
+                type_ids = self._type_filter(relationship_types)
+                parents = {source_node_id: None}  # Node id -> (relationship id, previous node id) it was reached by.
+                hops = {source_node_id: 0}
+                frontier = deque([source_node_id])
+                while frontier and target_node_id not in parents:
+                    node_id = frontier.popleft()
+                    if hops[node_id] == max_depth:
+                        continue
+                    for relationship_id, other in self._neighbours(node_id, type_ids, direction):
+                        if other not in parents:
+                            parents[other] = (relationship_id, node_id)
+                            hops[other] = hops[node_id] + 1
+                            frontier.append(other)
+            except ValueError as e:
+                logger.error(f"LocalGraph.shortest_path: {e}")
+                return None
+            if target_node_id not in parents:
+                return None
+
+            nodes, relationships = [target_node_id], []
+            while parents[nodes[-1]] is not None:
+                relationship_id, previous = parents[nodes[-1]]
+                relationships.append(relationship_id)
+                nodes.append(previous)
+            return {'nodes': [self._node_dict(node_id) for node_id in reversed(nodes)], 'relationships': [self._relationship_dict(relationship_id) for relationship_id in reversed(relationships)]}
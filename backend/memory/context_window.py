@@ -0,0 +1,117 @@
+import logging
+from collections import deque
+from typing import Any, Callable, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def make_token_counter(tokenizer: Any = None) -> Callable[[str], int]:
+    """Returns a function counting tokens with the given tokenizer.
+
+    Accepts a llama.cpp Llama (tokenize(bytes)), a Hugging Face tokenizer (encode(str)) or any callable returning
+    tokens. Without a tokenizer, falls back to the usual ~4 characters per token estimate.
+    """
+    if tokenizer is None:
+        return lambda text: (len(text) + 3) // 4
+    if hasattr(tokenizer, "tokenize") and not hasattr(tokenizer, "encode"):  # llama_cpp.Llama
+        return lambda text: len(tokenizer.tokenize(text.encode("utf-8"), add_bos=False))
+    if hasattr(tokenizer, "encode"):  # transformers tokenizer
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    if callable(tokenizer):
+        return lambda text: len(tokenizer(text))
+    raise TypeError(f"Unsupported tokenizer type: {type(tokenizer)}")
+
+
+
+class ContextWindow:
+    """Conversation context kept as whole messages with cached token counts, bounded by a token budget.
+
+    Adding a message costs one tokenization of that message; the oldest whole messages are evicted from the front of
+    a deque (O(1) each) until the total fits max_tokens, so nothing is ever cut mid-message. If a summarizer is given
+    (callable(previous_summary, evicted_messages) -> str, e.g. an LLM call), evicted messages are folded into a
+    summary kept at the start of the context.
+    """
+
+    def __init__(self, max_tokens: int = 2048, tokenizer: Any = None, summarizer: Callable[[str, List[str]], str] = None, separator: str = "\n"):
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.separator = separator
+        self.count_tokens = make_token_counter(tokenizer)
+        self.messages: "deque[Tuple[str, int]]" = deque()  # (message, token count)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.total_tokens = 0  # Messages plus separators, excluding the summary.
+        self._separator_tokens = self.count_tokens(separator) if separator else 0
+        self._rendered = None  # Cached render(), invalidated on change.
+
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+    @property
+    def token_count(self) -> int:
+        """Tokens used by the rendered context (summary, messages and separators)."""
+        return self.total_tokens + self.summary_tokens + (self._separator_tokens if self.summary and self.messages else 0)
+
+
+    def set_tokenizer(self, tokenizer: Any, max_tokens: int = None):
+        """Switches to the loaded model's tokenizer (and window size), recounting the messages held once."""
+        self.count_tokens = make_token_counter(tokenizer)
+        self._separator_tokens = self.count_tokens(self.separator) if self.separator else 0
+        if max_tokens is not None:
+            self.max_tokens = max_tokens
+        self.messages = deque((message, self.count_tokens(message)) for message, _ in self.messages)
+        self.total_tokens = sum(tokens for _, tokens in self.messages) + self._separator_tokens * max(0, len(self.messages) - 1)
+        self.summary_tokens = self.count_tokens(self.summary) if self.summary else 0
+        self._evict()
+
+
+    def add(self, message: str):
+        """Appends a whole message and evicts the oldest messages that no longer fit."""
+        tokens = self.count_tokens(message)
+        if self.messages:
+            self.total_tokens += self._separator_tokens
+        self.messages.append((message, tokens))
+        self.total_tokens += tokens
+        self._evict()
+
+
+    def _evict(self):
+        while self.token_count > self.max_tokens and len(self.messages) > 1:  # The newest message is always kept.
+            evicted = []
+            while self.token_count > self.max_tokens and len(self.messages) > 1:
+                message, tokens = self.messages.popleft()
+                self.total_tokens -= tokens + (self._separator_tokens if self.messages else 0)
+                evicted.append(message)
+            if self.summarizer:  # A longer summary may push out further messages, which are then summarized too.
+                self._summarize(evicted)
+
+        if self.summary and self.token_count > self.max_tokens:  # The summary has to fit alongside the newest message.
+            logger.warning("ContextWindow: Summary does not fit in the context window, dropping it.")
+            self.summary, self.summary_tokens = "", 0
+        self._rendered = None
+
+
+    def _summarize(self, evicted: List[str]):
+        try:
+            self.summary = self.summarizer(self.summary, evicted)
+            self.summary_tokens = self.count_tokens(self.summary) if self.summary else 0
+        except Exception as e:
+            logger.error(f"ContextWindow: Error summarizing {len(evicted)} evicted messages: {e}")
+
+
+    def render(self) -> str:
+        """The context as a string: summary (if any) followed by the retained messages."""
+        if self._rendered is None:
+            parts = ([self.summary] if self.summary else []) + [message for message, _ in self.messages]
+            self._rendered = self.separator.join(parts)
+        return self._rendered
+
+
+    def clear(self):
+        self.messages.clear()
+        self.summary, self.summary_tokens, self.total_tokens = "", 0, 0
+        self._rendered = None
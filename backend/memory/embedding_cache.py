@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class EmbeddingCache:
+    """Caches embeddings keyed by (model name, sha256 of the text), so repeated encodes cost a hash lookup.
+
+    An in-process LRU of max_entries sits in front of an optional SQLite file (db_path) that survives restarts and
+    holds up to max_db_entries, evicting the oldest insertions first. Returned arrays are read-only because they are
+    shared between callers.
+    """
+
+    def __init__(self, max_entries: int = 10_000, db_path: str = None, max_db_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self.db_path = db_path
+        self._entries: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0  # Subset of hits served from SQLite rather than RAM.
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        self._db_count = 0
+
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)  # Access is serialized by self._lock.
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))")
+                self._db.commit()
+                self._db_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"EmbeddingCache: Could not open cache database '{db_path}', using memory only: {e}")
+                self._db = None
+
+
+    @staticmethod
+    def _key(model_name: str, text: str) -> Tuple[str, bytes]:
+        return model_name, hashlib.sha256(text.encode("utf-8")).digest()
+
+
+    def get(self, model_name: str, text: str) -> np.ndarray or None:
+        """Returns the cached embedding, or None on a miss."""
+        return self.get_many(model_name, [text])[0]
+
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[np.ndarray or None]:
+        keys = [self._key(model_name, text) for text in texts]
+        results = []
+        with self._lock:
+            for key in keys:
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)  # Most recently used.
+                    self.hits += 1
+                else:
+                    embedding = self._get_from_db(key)
+                    if embedding is not None:
+                        self.hits += 1
+                        self.disk_hits += 1
+                        self._put_in_memory(key, embedding)
+                    else:
+                        self.misses += 1
+                results.append(embedding)
+        return results
+
+
+    def put(self, model_name: str, text: str, embedding: np.ndarray):
+        self.put_many(model_name, [text], [embedding])
+
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: List[np.ndarray]):
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self._key(model_name, text)
+                embedding = np.array(embedding, dtype=np.float32)
+                embedding.setflags(write=False)
+                self._put_in_memory(key, embedding)
+                rows.append((key[0], key[1], embedding.tobytes()))
+            self._put_in_db(rows)
+
+
+    def _put_in_memory(self, key: Tuple[str, bytes], embedding: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # Least recently used.
+            self.evictions += 1
+
+
+    def _get_from_db(self, key: Tuple[str, bytes]) -> np.ndarray or None:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE model = ? AND hash = ?", key).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"EmbeddingCache: Error reading cache database: {e}")
+            return None
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)  # frombuffer over bytes is already read-only.
+
+
+    def _put_in_db(self, rows: List[Tuple[str, bytes, bytes]]):
+        if self._db is None or not rows:
+            return
+        try:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)", rows)
+            self._db_count += self._db.total_changes - before
+            if self._db_count > self.max_db_entries:  # Oldest insertions go first (rowid order).
+                excess = self._db_count - self.max_db_entries
+                self._db.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)", (excess,))
+                self._db_count -= excess
+                self.evictions += excess
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"EmbeddingCache: Error writing cache database: {e}")
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and sizes, e.g. for the metrics UI."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._entries),
+                'disk_entries': self._db_count
+            }
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+                self._db_count = 0
+
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,25 +1,81 @@
 import logging
-from typing import List, Union  # Import Union for type hinting
+import threading
+import time
+from typing import Any, Dict, List, Tuple, Union  # Import Union for type hinting
 import numpy as np
 from sentence_transformers import SentenceTransformer  # For sentence embeddings
+
+from embedding_cache import EmbeddingCache
 #from sklearn.feature_extraction.text import TfidfVectorizer # For TF-IDF (optional)
 
 
 logger = logging.getLogger(__name__)
 
 
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"  # Dynamically quantized export shipped with the sentence-transformers hub models.
+SIMILARITY_CHUNK_ROWS = 8192  # Candidate rows scored per matrix product; bounds the temporary memory of the similarity APIs.
+
+
 
 class Embeddings:
-    def __init__(self, model_name: str = 'all-mpnet-base-v2', model: SentenceTransformer = None): #Default model, you can customize.
+    def __init__(self, model_name: str = 'all-mpnet-base-v2', model: SentenceTransformer = None, lazy: bool = False, cache: EmbeddingCache = None, cache_size: int = 10_000, backend: str = "torch", threads: int = None, onnx_file: str = None): #Default model, you can customize.
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Embeddings: Unknown backend '{backend}'. Expected one of {EMBEDDING_BACKENDS}.")
         self.model_name = model_name
-        self.model = model or self.load_model(model_name) #Load on init.
+        # Inference runtime: "torch", or ONNX Runtime ("onnx", or "onnx-int8" for the int8 quantized export), which is
+        # much cheaper on CPU-only hosts. All produce embeddings of the same shape; see benchmark_backends().
+        self.backend = backend
+        self.threads = threads  # Intra-op CPU threads (ONNX: per session; torch: process-wide). None keeps the runtime default.
+        self.onnx_file = onnx_file or (ONNX_INT8_FILE if backend == "onnx-int8" else None)  # ONNX model file within the model repository.
+        # Backends differ in the last digits, so cached embeddings are kept apart per backend.
+        self.cache_key = model_name if backend == "torch" else f"{model_name}@{backend}"
+        # Repeated texts are served from the cache instead of the model. Pass a shared cache, or cache_size=0 to disable.
+        self.cache = cache if cache is not None else (EmbeddingCache(max_entries=cache_size) if cache_size > 0 else None)
+        self._model = model
+        self._load_failed = False  # Don't retry a failed load on every call.
+        self._lock = threading.Lock()
+        if self._model is None and not lazy: #Load on init unless lazy, in which case the first generate() loads it.
+            self._model = self.load_model(model_name)
+            self._load_failed = self._model is None
+
+
+    @property
+    def model(self) -> SentenceTransformer or None:
+        """The loaded model, loaded on first use if the instance was created lazily."""
+        if self._model is None and not self._load_failed:
+            with self._lock:
+                if self._model is None and not self._load_failed:
+                    self._model = self.load_model(self.model_name)
+                    self._load_failed = self._model is None
+        return self._model
+
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+
+    def unload(self):
+        """Drops the model so its memory can be freed; the next generate() loads it again."""
+        with self._lock:
+            self._model = None
+            self._load_failed = False
 
 
 
 
     def load_model(self, model_name: str) -> SentenceTransformer:  # Correct return type hint. Load model and handles potential errors during model loading.
-        """Loads the specified embedding model."""
+        """Loads the specified embedding model on the configured backend, falling back to torch if ONNX is unavailable."""
+        if self.backend != "torch":
+            try:
+                return SentenceTransformer(model_name, backend="onnx", model_kwargs=self._onnx_model_kwargs())
+            except Exception as e:  # onnxruntime/optimum not installed, or no ONNX export for this model.
+                logger.warning(f"Embeddings.load_model: Could not load '{model_name}' with the '{self.backend}' backend, using torch: {e}")
         try:
+            if self.threads:
+                import torch  # Installed with sentence-transformers.
+                torch.set_num_threads(self.threads)
             model = SentenceTransformer(model_name)
             return model
 
@@ -29,27 +85,50 @@ class Embeddings:
             return None
 
 
+    def _onnx_model_kwargs(self) -> Dict[str, Any]:
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if self.onnx_file:
+            model_kwargs["file_name"] = self.onnx_file
+        if self.threads:
+            import onnxruntime  # Optional dependency, only needed for the ONNX backends.
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.threads
+            session_options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = session_options
+        return model_kwargs
 
-    def generate(self, text: Union[str, List[str]]) -> np.ndarray or None: # Type hint, handles list of strings, returns appropriate data structure.
-        """Generates embeddings for the given text.  Handles single string or list of strings."""
 
-        if not self.model:
-            logger.error("Embeddings.generate: Embedding model not loaded.") #Error logging, provides context.
+
+    def generate(self, text: Union[str, List[str]], batch_size: int = 32) -> np.ndarray or None: # Type hint, handles list of strings, returns appropriate data structure.
+        """Generates embeddings for the given text.  Handles single string or list of strings (encoded batch_size at a time).
+
+        Texts already in the cache are not encoded again; only the misses go through the model.
+        """
+
+        if not isinstance(text, (str, list)): # If it is an invalid type.
+            logger.error(f"Embeddings.generate: Invalid input type: {type(text)}. Expected string or list of strings.")
             return None
 
+        texts = [text] if isinstance(text, str) else text
+        cached = self.cache.get_many(self.cache_key, texts) if self.cache is not None else [None] * len(texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
 
-        try:  # Error handling during embedding generation.
-            if isinstance(text, str):
-                embeddings = self.model.encode(text) #Generate embeddings from the text
+        if missing and not self.model:
+            logger.error("Embeddings.generate: Embedding model not loaded.") #Error logging, provides context.
+            return None
 
-            elif isinstance(text, list):
-                embeddings = self.model.encode(text) #Generate embeddings from the list.
 
-            else: # If it is an invalid type.
-                logger.error(f"Embeddings.generate: Invalid input type: {type(text)}. Expected string or list of strings.")
-                return None
+        try:  # Error handling during embedding generation.
+            if missing:
+                encoded = self.model.encode([texts[i] for i in missing], batch_size=batch_size) #One batched forward pass per batch_size strings.
+                for i, embedding in zip(missing, encoded):
+                    cached[i] = embedding
+                if self.cache is not None:
+                    self.cache.put_many(self.cache_key, [texts[i] for i in missing], encoded)
 
-            return embeddings #Return embeddings
+            if isinstance(text, str):
+                return cached[0] #Return embeddings
+            return np.stack(cached) if cached else np.empty((0, 0), dtype=np.float32)
         except Exception as e:
             logger.error(f"Embeddings.generate: Error generating embeddings for '{text}': {e}") #Log error and details.
             return None  #If there is an error during generation, signal with None.
@@ -75,8 +154,123 @@ class Embeddings:
 
 
 
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Scales embeddings (a vector or a matrix of row vectors) to unit length, as float32."""
+        embeddings = np.array(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)  # Leaves all-zero vectors as they are instead of producing NaNs.
+
+
+    @staticmethod
+    def _candidate_blocks(candidates: np.ndarray, normalized: bool, chunk_rows: int):
+        """Yields (first row, float32 block of unit rows) over the candidates, chunk_rows at a time."""
+        for start in range(0, candidates.shape[0], chunk_rows):
+            block = candidates[start:start + chunk_rows]
+            yield start, np.ascontiguousarray(block, dtype=np.float32) if normalized else Embeddings.normalize(block)
+
+
+    @staticmethod
+    def similarities(queries: np.ndarray, candidates: np.ndarray, normalized: bool = False, chunk_rows: int = SIMILARITY_CHUNK_ROWS) -> np.ndarray or None:
+        """Cosine similarities of one query (a vector: returns shape (n,)) or many (a matrix: returns (queries, n)) with n candidate rows.
+
+        One matrix product per chunk_rows candidates. Pass normalized=True for unit-length float32 embeddings (e.g. from a
+        cosine MemoryManager) to skip normalizing them again.
+        """
+        try:
+            queries, candidates = np.asarray(queries), np.asarray(candidates)
+            single = queries.ndim == 1
+            queries = np.atleast_2d(np.asarray(queries, dtype=np.float32) if normalized else Embeddings.normalize(queries))
+            scores = np.empty((queries.shape[0], candidates.shape[0]), dtype=np.float32)
+            for start, block in Embeddings._candidate_blocks(candidates, normalized, chunk_rows):
+                scores[:, start:start + len(block)] = queries @ block.T
+            return scores[0] if single else scores
+        except Exception as e:
+            logger.error(f"Embeddings.similarities: Error calculating similarities: {e}")
+            return None
+
+
+    @staticmethod
+    def top_k(queries: np.ndarray, candidates: np.ndarray, k: int, normalized: bool = False, chunk_rows: int = SIMILARITY_CHUNK_ROWS) -> Tuple[np.ndarray, np.ndarray] or None:
+        """(scores, candidate indices) of the k candidates most similar to each query, best first; shaped like similarities().
+
+        Each chunk of candidates is reduced to its own top k with argpartition, so memory stays bounded by chunk_rows however
+        many candidates there are.
+        """
+        try:
+            queries, candidates = np.asarray(queries), np.asarray(candidates)
+            single = queries.ndim == 1
+            queries = np.atleast_2d(np.asarray(queries, dtype=np.float32) if normalized else Embeddings.normalize(queries))
+            k = min(k, candidates.shape[0])
+            best_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+            best_indices = np.empty((queries.shape[0], 0), dtype=np.int64)
+            for start, block in Embeddings._candidate_blocks(candidates, normalized, chunk_rows):
+                scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+                indices = np.concatenate([best_indices, np.broadcast_to(np.arange(start, start + len(block)), (queries.shape[0], len(block)))], axis=1)
+                if scores.shape[1] > k:
+                    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k else np.empty((queries.shape[0], 0), dtype=np.int64)
+                    scores, indices = np.take_along_axis(scores, keep, axis=1), np.take_along_axis(indices, keep, axis=1)
+                best_scores, best_indices = scores, indices
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best_scores, best_indices = np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_indices, order, axis=1)
+            return (best_scores[0], best_indices[0]) if single else (best_scores, best_indices)
+        except Exception as e:
+            logger.error(f"Embeddings.top_k: Error ranking candidates: {e}")
+            return None
+
+
+    @property
+    def active_backend(self) -> str or None:
+        """The backend the loaded model actually runs on ("torch" after an ONNX fallback), or None before loading."""
+        if self._model is None:
+            return None
+        return getattr(self._model, "backend", "torch")  # SentenceTransformer records its backend; injected models are torch.
+
+
+
     # Optional: TF-IDF Embeddings (uncomment if needed)
     # def generate_tfidf(self, texts: List[str]):
     #     vectorizer = TfidfVectorizer()  # Initialize the vectorizer
     #     tfidf_matrix = vectorizer.fit_transform(texts) # Fit and transform the text list.
-    #     # ... (Rest of the implementation - get feature names, create dictionary, etc.)
\ No newline at end of file
+    #     # ... (Rest of the implementation - get feature names, create dictionary, etc.)
+
+
+
+def benchmark_backends(model_name: str, texts: List[str], backends=EMBEDDING_BACKENDS, batch_size: int = 32, threads: int = None) -> List[Dict[str, Any]]:
+    """Reports load time, throughput (texts per second) and agreement with the torch embeddings (mean and minimum cosine
+    similarity per text) for each backend. Uncached, so every backend encodes every text. If torch cannot be loaded,
+    agreement is not measured: mean_cosine and min_cosine are None (and a warning is logged)."""
+    reference = None
+    report = []
+    for backend in ("torch",) + tuple(b for b in backends if b != "torch"):
+        try:
+            start_time = time.perf_counter()
+            embeddings = Embeddings(model_name, cache_size=0, backend=backend, threads=threads)
+            load_seconds = time.perf_counter() - start_time
+            if embeddings.model is None:
+                if backend == "torch":
+                    logger.warning(f"benchmark_backends: Could not load '{model_name}' with torch; reporting no agreement with it.")
+                continue
+            embeddings.generate(texts[:batch_size], batch_size=batch_size)  # Warm up (lazy graph optimization, allocator).
+
+            start_time = time.perf_counter()
+            vectors = np.asarray(embeddings.generate(texts, batch_size=batch_size), dtype=np.float32)
+            seconds = time.perf_counter() - start_time
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            if backend == "torch":
+                reference = vectors
+            agreement = np.sum(vectors * reference, axis=1) if reference is not None else None
+            if backend in backends:
+                report.append({
+                    'backend': backend,
+                    'active_backend': embeddings.active_backend,
+                    'load_seconds': load_seconds,
+                    'texts_per_second': len(texts) / seconds if seconds else float("inf"),
+                    'mean_cosine': float(agreement.mean()) if agreement is not None else None,
+                    'min_cosine': float(agreement.min()) if agreement is not None else None
+                })
+        except Exception as e:
+            logger.error(f"benchmark_backends: Error benchmarking '{backend}': {e}")
+            if backend == "torch":
+                logger.warning(f"benchmark_backends: No torch reference for '{model_name}'; reporting no agreement with it.")
+    return report
@@ -0,0 +1,129 @@
+import logging
+import math
+import re
+from array import array
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+# Words, plus compound tokens joined by . - _ / : such as "main.py", "jira-1234" or "0x80070005", so exact identifiers
+# match as a whole; their parts are indexed too, so "1234" still finds "JIRA-1234".
+_COMPOUND_TOKEN = re.compile(r"\w+(?:[.\-/:]\w+)*")
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of text: each compound token and, if it has several parts, each of its parts."""
+    terms = []
+    for token in _COMPOUND_TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = _WORD.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+
+class LexicalIndex:
+    """Incrementally maintained inverted index over memory texts, scored with Okapi BM25.
+
+    Postings are per-term arrays of (row, term frequency) appended as memories are added, so adding a memory costs
+    time proportional to its length and a query only touches the postings of its own terms. Rows are store rows,
+    like in MetadataIndex and the vector index; deleted rows are passed to search() as exclude until compaction
+    rebuilds the index.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1  # Term frequency saturation.
+        self.b = b  # Document length normalization.
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (rows, term frequencies)
+        self.doc_lengths = array('I')  # Terms per row.
+        self.total_length = 0
+
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+
+    def add(self, row: int, text: str):
+        """Indexes one text. Rows must be added in increasing order without gaps (they are store row numbers)."""
+        terms = tokenize(text or "")
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            rows, frequencies = self.postings.setdefault(term, (array('q'), array('I')))
+            rows.append(row)
+            frequencies.append(count)
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+
+
+    @classmethod
+    def build(cls, columns: "MemoryColumns", size: int = None, **kwargs: Any) -> "LexicalIndex":
+        """Builds an index over the texts in a MemoryColumns (its first size rows, default: all); deleted rows index as
+        empty texts."""
+        index = cls(**kwargs)
+        for row in range(len(columns) if size is None else size):
+            index.add(row, columns.text(row) if columns.is_live(row) else "")
+        return index
+
+
+    def search(self, query: str, k: int, rows: np.ndarray = None, exclude: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (BM25 scores, rows) of the k best matching rows, best first; only rows containing a query term score.
+
+        rows restricts the search to the given sorted rows (e.g. from a MetadataIndex filter), exclude drops the given rows.
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]  # Unique, in query order.
+        if not terms or not len(self):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)  # Released below, before add() may grow the array.
+        average_length = self.total_length / len(self) or 1.0
+        matched_rows, matched_scores = [], []
+        for term in terms:
+            term_rows, frequencies = self.postings[term]
+            term_rows = np.array(term_rows, dtype=np.int64)  # Copies: a live buffer view would stop add() from growing the arrays.
+            frequencies = np.array(frequencies, dtype=np.float32)
+            idf = math.log(1.0 + (len(self) - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[term_rows] / average_length)
+            matched_rows.append(term_rows)
+            matched_scores.append(idf * frequencies * (self.k1 + 1.0) / (frequencies + norm))
+        del doc_lengths
+
+        candidates, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores)).astype(np.float32)
+        keep = np.ones(len(candidates), dtype=bool)
+        if rows is not None:
+            keep &= np.isin(candidates, rows, assume_unique=True)
+        if exclude is not None and len(exclude):
+            keep &= ~np.isin(candidates, exclude)
+        candidates, scores = candidates[keep], scores[keep]
+
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], candidates[order]
+
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """Fuses ranked result lists (memory entries with an 'id') by reciprocal rank: score = sum of 1 / (k + rank).
+
+    Ranks rather than raw scores are combined, so cosine similarities and BM25 scores need no calibration. The first
+    list's copy of an entry is kept, completed with keys only the other lists have (e.g. their own scores), and given
+    the fused score as 'rrf_score'.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result['id'], dict(result, rrf_score=0.0))
+            for key, value in result.items():
+                entry.setdefault(key, value)
+            entry['rrf_score'] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda entry: entry['rrf_score'], reverse=True)[:top_k]
@@ -0,0 +1,214 @@
+import json
+import logging
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class MemoryView(Mapping):
+    """Read-only, dict-like view of one memory in a MemoryColumns, as returned by MemoryManager searches.
+
+    Holds only the columns and a row, so assembling a result allocates one small object instead of copying an entry
+    dict; fields are decoded from the columns when accessed. Keys: 'id', 'text', 'metadata', 'timestamp' and, for
+    search results, 'similarity_score'. Other keys may be set (e.g. 'namespace'); copy() returns a plain dict.
+    A view stays valid after compaction because compaction builds new columns instead of renumbering these.
+    """
+
+    __slots__ = ('columns', 'row', 'similarity_score', '_extra')
+    FIELDS = ('id', 'text', 'metadata', 'timestamp')
+
+    def __init__(self, columns: "MemoryColumns", row: int, similarity_score: float = None):
+        self.columns = columns
+        self.row = row
+        self.similarity_score = similarity_score
+        self._extra = None
+
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'id':
+            return self.columns.memory_id(self.row)
+        if key == 'text':
+            return self.columns.text(self.row)
+        if key == 'metadata':
+            return self.columns.metadata(self.row)
+        if key == 'timestamp':
+            return self.columns.timestamp(self.row)
+        if key == 'similarity_score' and self.similarity_score is not None:
+            return self.similarity_score
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+
+    def __setitem__(self, key: str, value: Any):
+        if key == 'similarity_score':
+            self.similarity_score = value
+        elif key in self.FIELDS:
+            raise TypeError(f"MemoryView: '{key}' is read-only; use MemoryManager.update_memory().")
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key == 'similarity_score' and self.similarity_score is not None:
+            value, self.similarity_score = self.similarity_score, None
+            return value
+        if self._extra and key in self._extra:
+            return self._extra.pop(key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.FIELDS
+        if self.similarity_score is not None:
+            yield 'similarity_score'
+        if self._extra:
+            yield from self._extra
+
+
+    def __len__(self) -> int:
+        return len(self.FIELDS) + (self.similarity_score is not None) + len(self._extra or ())
+
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+
+class MemoryColumns:
+    """Column store of memory entries, row i being store row i.
+
+    Instead of one dict (with a str, a dict and a datetime) per memory, each field is a contiguous column: 16-byte
+    ids, UTF-8 texts in one blob indexed by offsets, int64 microsecond timestamps and metadata interned as JSON (most
+    memories share a handful of distinct metadata dicts), plus a live flag per row. Embeddings stay in the memory
+    store's memory map. Deleted rows keep their place until compaction builds new columns from the live rows.
+
+    Indexing returns a MemoryView, or None for a deleted row, so the columns can be used like the old entry list.
+    """
+
+    def __init__(self):
+        self.ids = bytearray()  # uuid4 bytes, 16 per row.
+        self.text_blob = bytearray()
+        self.text_offsets = array('q', [0])  # Row i's text is text_blob[text_offsets[i]:text_offsets[i + 1]].
+        self.timestamps = array('q')  # Microseconds since the epoch.
+        self.metadata_ids = array('I')  # Row -> position in metadata_values.
+        self.metadata_values: List[str] = []  # Distinct metadata, as JSON.
+        self._metadata_lookup: Dict[str, int] = {}
+        self.live = bytearray()  # 1 per live row, 0 once deleted.
+        self.live_count = 0
+
+
+    def __len__(self) -> int:
+        return len(self.live)
+
+
+    def __getitem__(self, row: int) -> MemoryView or None:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return MemoryView(self, row) if self.live[row] else None
+
+
+    def __iter__(self) -> Iterator[MemoryView or None]:
+        return (self[row] for row in range(len(self)))
+
+
+    def append(self, memory_id: str, text: str, metadata: Dict[str, Any], timestamp: float):
+        """Appends one memory (timestamp in seconds since the epoch) as the next row."""
+        self.ids += bytes.fromhex(memory_id)
+        self.text_blob += text.encode("utf-8")
+        self.text_offsets.append(len(self.text_blob))
+        self.timestamps.append(round(timestamp * 1_000_000))
+        self.metadata_ids.append(self._intern(json.dumps(metadata or {}, sort_keys=True, separators=(",", ":"), default=str)))
+        self.live.append(1)
+        self.live_count += 1
+
+
+    def _intern(self, metadata_json: str) -> int:
+        metadata_id = self._metadata_lookup.get(metadata_json)
+        if metadata_id is None:
+            metadata_id = self._metadata_lookup[metadata_json] = len(self.metadata_values)
+            self.metadata_values.append(metadata_json)
+        return metadata_id
+
+
+    def delete(self, row: int):
+        if self.live[row]:
+            self.live[row] = 0
+            self.live_count -= 1
+
+
+    def is_live(self, row: int) -> bool:
+        return 0 <= row < len(self) and self.live[row] == 1
+
+
+    def memory_id(self, row: int) -> str:
+        return self.ids[row * 16:(row + 1) * 16].hex()
+
+
+    def text(self, row: int) -> str:
+        return self.text_blob[self.text_offsets[row]:self.text_offsets[row + 1]].decode("utf-8")
+
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        """A fresh dict on every call, so callers may modify it."""
+        return json.loads(self.metadata_values[self.metadata_ids[row]])
+
+
+    def timestamp(self, row: int) -> datetime:
+        return datetime.fromtimestamp(self.timestamps[row] / 1_000_000)
+
+
+    def timestamp_seconds(self, row: int) -> float:
+        return self.timestamps[row] / 1_000_000
+
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(np.frombuffer(self.live, dtype=np.uint8)).astype(np.int64) if len(self) else np.empty(0, dtype=np.int64)
+
+
+    def timestamp_array(self) -> np.ndarray:
+        """The timestamps in microseconds as an int64 array (a copy, so the column can keep growing)."""
+        return np.array(self.timestamps, dtype=np.int64)
+
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """The memory store record of a row."""
+        return {'id': self.memory_id(row), 'text': self.text(row), 'metadata': self.metadata(row), 'timestamp': self.timestamp_seconds(row)}
+
+
+    def take(self, rows: np.ndarray) -> "MemoryColumns":
+        """New columns holding the given rows, renumbered from 0 (used by compaction)."""
+        columns = MemoryColumns()
+        for row in rows:
+            row = int(row)
+            columns.ids += self.ids[row * 16:(row + 1) * 16]
+            columns.text_blob += self.text_blob[self.text_offsets[row]:self.text_offsets[row + 1]]
+            columns.text_offsets.append(len(columns.text_blob))
+            columns.timestamps.append(self.timestamps[row])
+            columns.metadata_ids.append(columns._intern(self.metadata_values[self.metadata_ids[row]]))
+            columns.live.append(1)
+        columns.live_count = len(columns.live)
+        return columns
+
+
+    def nbytes(self) -> int:
+        """Approximate RAM used by the columns."""
+        return (len(self.ids) + len(self.text_blob) + self.text_offsets.itemsize * len(self.text_offsets) + self.timestamps.itemsize * len(self.timestamps)
+                + self.metadata_ids.itemsize * len(self.metadata_ids) + sum(len(value) for value in self.metadata_values) + len(self.live))
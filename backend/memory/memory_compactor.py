@@ -0,0 +1,50 @@
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class MemoryCompactor:
+    """Background thread applying a MemoryManager's retention policy (ttl, max_entries) every interval seconds.
+
+    Expired memories are deleted, and the store is compacted once enough of it is dead, so disk usage, the index and
+    search latency stay bounded in long-running deployments. Callers never have to do this themselves, but expire()
+    and compact() hold the manager's lock, so add_memory and search calls wait while the store is being rewritten.
+    """
+
+    def __init__(self, memory_manager, interval: float = 300.0):
+        self.memory_manager = memory_manager
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-compactor", daemon=True)
+            self._thread.start()
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+    def run_once(self):
+        try:
+            expired = self.memory_manager.expire()
+            self.memory_manager.save_memory()  # Compacts if the deletions pushed the store over its dead ratio.
+            if expired:
+                logger.info(f"MemoryCompactor: Expired {expired} memories from '{self.memory_manager.store.path}'.")
+        except Exception as e:
+            logger.error(f"MemoryCompactor: Error applying retention policy: {e}")
+
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
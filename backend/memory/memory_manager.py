@@ -1,141 +1,798 @@
 import logging
-import faiss  # For efficient similarity search (install with: pip install faiss-cpu)
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import numpy as np
-from sentence_transformers import SentenceTransformer #For sentence embeddings (install with: pip install sentence-transformers)
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Tuple, Union
 #from sklearn.feature_extraction.text import TfidfVectorizer # For TF-IDF (if needed, install scikit-learn)
 #from fuzzywuzzy import fuzz  # For Fuzzy Matching if not using other methods. (install with: pip install fuzzywuzzy)
-import pickle  # For saving and loading embeddings
+import pickle  # Only used to migrate legacy memory.pkl files into the memory store.
+
+from context_window import ContextWindow
+from embeddings import Embeddings
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from memory_columns import MemoryColumns, MemoryView
+from memory_compactor import MemoryCompactor
+from memory_store import MemoryStore
+from memory_writer import WriteBehindWriter
+from metadata_index import MetadataIndex
+from vector_index import AdaptiveIndex, BENCHMARK_TIERS, benchmark_index_tiers
 
 
 logger = logging.getLogger(__name__)
 
 
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+DURABILITY_LEVELS = ("sync", "batch")
+DEDUP_NEIGHBOURS = 4  # Nearest memories checked for a near-duplicate (with the same metadata) of each memory.
+HYBRID_CANDIDATES = 50  # Minimum results taken from each of the vector and lexical searches before fusing them.
+
 
 class MemoryManager:
-    def __init__(self, embedding_model_name: str = 'all-mpnet-base-v2', embedding_dim: int = 768, memory_file: str = "memory.pkl"): #Uses default embedding model, can modify if needed.
+    def __init__(self, embedding_model_name: str = 'all-mpnet-base-v2', embedding_dim: int = 768, memory_file: str = "memory.pkl", fsync: bool = True, index_type: str = "flat", promote_threshold: int = 50_000, metric: str = "cosine", embeddings: Embeddings = None, ttl: float = None, max_entries: int = None, compact_interval: float = None, quantization: str = "float32", durability: str = "sync", write_batch_size: int = 256, write_interval_ms: float = 50.0, write_queue_size: int = 10_000, shared: bool = False, dedup_threshold: float = None): #Uses default embedding model, can modify if needed.
         self.embedding_model_name = embedding_model_name
-        try: #Initialize embedding model.
-            self.embedding_model = SentenceTransformer(embedding_model_name) # Initialize here
-        except Exception as e: #Handle potential errors while loading the model.
-            logger.error(f"MemoryManager: Could not load SentenceTransformer model '{embedding_model_name}': {e}")
-            self.embedding_model = None
+        # Pass a shared Embeddings (see MemoryRegistry) to avoid loading the same model once per manager. The model loads on first use.
+        self.embeddings = embeddings or Embeddings(embedding_model_name, lazy=True)
+        self._lock = threading.RLock()  # Managers may be shared by several agents; serializes writes.
 
         self.embedding_dim = embedding_dim
-        self.memory: List[Dict[str, Any]] = []  # Stores messages and metadata
+        self.memory = MemoryColumns()  # Stores messages and metadata, row = store row. Deleted rows read as None until compaction.
+        self.rows_by_id: Dict[str, int] = {}  # Stable memory id -> current store row (rows change on compaction, ids never do).
+        self.metadata_index = MetadataIndex()  # Metadata/timestamp -> rows, for filtered search.
+        self._excluded, self._excluded_key = None, None  # Rows searches skip (see _excluded_rows).
+        self.lexical_index = None  # BM25 over the texts, for exact-term and hybrid search; built by the first such search.
+        self._lexical_build_lock = threading.Lock()
         self.index = None # Initialize FAISS index
-        self.memory_file = memory_file  # File to save/load memory
+        self.index_type = index_type  # Tier to promote to once promote_threshold memories exist: one of INDEX_TIERS.
+        self.promote_threshold = promote_threshold
+        self.metric = metric  # "cosine": embeddings are normalized at insert and scored by inner product. "l2": legacy squared L2.
+        self.memory_file = memory_file  # Legacy pickle file; memories now live in the append-only store next to it.
+        # Cosine similarity at which a new memory counts as a near-duplicate of an existing one and is merged into it (None: off).
+        if dedup_threshold is not None and metric != "cosine":
+            raise ValueError("MemoryManager: dedup_threshold needs metric='cosine'.")
+        if dedup_threshold is not None and durability == "batch":  # add_memory could not return the id a queued memory is merged into.
+            raise ValueError("MemoryManager: dedup_threshold needs durability='sync'.")
+        self.dedup_threshold = dedup_threshold
+        self.quantization = quantization  # "int8" stores embeddings in 1 byte per dimension (cosine only); see MemoryStore.
+        self.store = MemoryStore(os.path.splitext(memory_file)[0] + ".store", embedding_dim, fsync=fsync, metric=metric, quantization=quantization, shared=shared)  # shared: several processes (e.g. API workers) may open the store.
+        self.ttl = ttl  # Retention policy applied by expire(): memories older than ttl seconds...
+        self.max_entries = max_entries  # ...and the oldest memories beyond max_entries are deleted.
+
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"MemoryManager: Unknown durability '{durability}', expected one of {DURABILITY_LEVELS}.")
+        self.durability = durability  # "sync": add_memory returns once committed. "batch": write-behind group commit, see flush().
 
         self.load_memory()  # Load saved memory if exists.
 
+        self.writer = None
+        if durability == "batch":  # Embeds and commits queued add_memory calls in the background, write_batch_size at a time.
+            self.writer = WriteBehindWriter(self._commit_records, write_queue_size, write_batch_size, write_interval_ms / 1000.0)
 
+        self.compactor = None
+        if compact_interval:  # Applies the retention policy and compacts in the background.
+            self.compactor = MemoryCompactor(self, compact_interval)
+            self.compactor.start()
 
-    def load_memory(self): # Load memory if exists, otherwise create index
 
-        try:
-            with open(self.memory_file, 'rb') as f:
-                self.memory = pickle.load(f) #Load memory
 
-            self.build_index() #After loading, build the index on it.
-        except (FileNotFoundError, EOFError):  # Handle if file does not exist
-            self.build_index()  # Initialize a new FAISS index
-            logger.warning("Memory file not found or empty. Creating a new memory.")
+    def load_memory(self): # Open the memory store (recovering from any torn write) and build the index from it.
+
+        try:
+            os.makedirs(self.store.path, exist_ok=True)
+            with self._lock, self.store.locked():  # Loading may write (ids, migrations), and other processes may be writing.
+                records = self.store.open()  # Embeddings stay on disk; the index memory-maps them.
+                self._load_columns(records)
+                del records  # The columns hold the same data in a fraction of the space.
+                self._reconcile_metric()
+                self.metadata_index = MetadataIndex.build(self.memory)
+                self.lexical_index = None  # Tokenizing every text is slow, and most callers never search lexically.
+
+                if not self.memory and os.path.isfile(self.memory_file):  # One-time migration of an old pickle file.
+                    self.migrate_pickle()
+
+                self.build_index() #After loading, build the index on it.
         except Exception as e: #Handle other exceptions loading memory.
             logger.error(f"MemoryManager.load_memory: Error loading memory: {e}")  # Log error
-
-
-    def save_memory(self): # Save memory to the pickle file.
+            self.build_index()
+
+
+    def _reconcile_metric(self):
+        """An existing store keeps its metric and quantization, except that an l2 store is normalized in place when cosine
+        is requested, and a float32 cosine store is quantized in place when int8 is requested."""
+        normalize = self.store.metric != self.metric and self.metric == "cosine"
+        if self.store.metric != self.metric and not normalize:
+            logger.warning(f"MemoryManager: Store '{self.store.path}' holds normalized embeddings; using cosine similarity instead of '{self.metric}'.")
+            self.metric = self.store.metric
+        quantize = self.store.quantization != self.quantization and self.quantization == "int8"
+        if self.store.quantization != self.quantization and not quantize:
+            logger.warning(f"MemoryManager: Store '{self.store.path}' holds int8 embeddings; keeping them instead of '{self.quantization}'.")
+            self.quantization = self.store.quantization
+        if not normalize and not quantize:
+            return
+
+        embeddings = self.store.decode(self.store.embeddings())
+        if normalize:
+            logger.info(f"MemoryManager: Normalizing {len(self.store)} stored embeddings for cosine similarity.")
+            embeddings = self.normalize(embeddings)
+        if quantize:
+            logger.info(f"MemoryManager: Quantizing {len(self.store)} stored embeddings to int8.")
+        self.store.metric, self.store.quantization = self.metric, self.quantization
+        self._rewrite_store(embeddings)
+
+
+    def _load_columns(self, records: List[Dict[str, Any]]):
+        """Loads store records into the columns and maps ids to rows. Stores written before ids existed get ids assigned, once."""
+        missing_ids = False
+        self.memory = MemoryColumns()
+        for record in records:
+            if not record.get('id'):
+                record['id'] = uuid.uuid4().hex
+                missing_ids = True
+            self.memory.append(record['id'], record['text'], record.get('metadata'), record['timestamp'])
+        for row in self.store.deleted_rows:
+            self.memory.delete(row)
+
+        superseded = []
+        self.rows_by_id = {}
+        for row in self.memory.live_rows().tolist():
+            memory_id = records[row]['id']
+            if memory_id in self.rows_by_id:  # Crashed between writing an update and deleting the old version.
+                superseded.append(self.rows_by_id[memory_id])
+            self.rows_by_id[memory_id] = row
+
+        if superseded:
+            self.store.delete(superseded)
+            for row in superseded:
+                self.memory.delete(row)
+        if missing_ids:
+            logger.info(f"MemoryManager: Assigning ids to the memories in '{self.store.path}'.")
+            self._rewrite_store()
+
+
+    def _rewrite_store(self, embeddings: np.ndarray = None):
+        """Compacts the store to the live entries (with embeddings, default: the stored ones) and renumbers their rows in
+        timestamp order, so that time windows and the ttl cutoff are bisects again (see MetadataIndex) after updates or
+        backdated memories appended rows out of order."""
+        live_rows = self.memory.live_rows()
+        live_rows = live_rows[np.argsort(self.memory.timestamp_array()[live_rows], kind="stable")]
+        embeddings = self.store.embeddings() if embeddings is None else embeddings
+        if len(live_rows) < len(self.memory):
+            embeddings = embeddings[live_rows]
+        self.store.compact(self._records(live_rows), embeddings)
+        self.memory = self.memory.take(live_rows)  # New columns: views handed out earlier keep reading the old ones.
+        self.rows_by_id = {self.memory.memory_id(row): row for row in range(len(self.memory))}
+
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Scales embeddings (a vector or a matrix of row vectors) to unit length, as float32."""
+        return Embeddings.normalize(embeddings)
+
+
+    def migrate_pickle(self):
+        """Imports a legacy memory.pkl into the memory store, then renames the pickle so it is not imported twice."""
         try:
-            with open(self.memory_file, "wb") as f:  # Correct file mode
-                pickle.dump(self.memory, f) #Saves the memory to the pickle file.
-
-        except Exception as e:
-            logger.error(f"MemoryManager.save_memory: Error saving memory: {e}")  #Log error
-
-
-    def generate_embeddings(self, text: str) -> np.ndarray or None: # Correct return type hint
-        """Generates embeddings for given text using pre-trained model."""
+            with open(self.memory_file, 'rb') as f:
+                legacy_memory = pickle.load(f)
+        except EOFError:  # Empty legacy file, nothing to migrate.
+            legacy_memory = []
+
+        legacy_memory = [entry for entry in legacy_memory if entry.get('embedding') is not None]
+        records = [{'id': uuid.uuid4().hex, 'text': entry['text'], 'metadata': entry.get('metadata') or {}, 'timestamp': (entry.get('timestamp') or datetime.now()).timestamp()} for entry in legacy_memory]
+        embeddings = np.array([entry['embedding'] for entry in legacy_memory], dtype=np.float32).reshape(-1, self.embedding_dim)
+        self.store.append_many(self.normalize(embeddings) if self.metric == "cosine" else embeddings, records)  # One write for the whole file.
+        self._remember(records)
+
+        os.replace(self.memory_file, self.memory_file + ".migrated")
+        logger.info(f"MemoryManager.migrate_pickle: Migrated {len(self.memory)} memories from '{self.memory_file}'.")
+
+
+    def import_memory_file(self, memory_file: str) -> int:
+        """Moves the memories of another memory file (its store, or a legacy pickle) into this manager, keeping their ids,
+        timestamps and embeddings, then renames that store to .migrated so it is not imported twice.
+
+        Runs under this manager's write lock, so processes sharing the store import it once. Returns the number imported.
+        """
+        store_path = os.path.splitext(memory_file)[0] + ".store"
+        with self._writing():
+            if not os.path.isfile(memory_file) and not os.path.isdir(store_path):
+                return 0
+            source = MemoryManager(self.embedding_model_name, self.embedding_dim, memory_file, metric=self.metric, embeddings=self.embeddings, shared=self.store.shared)  # Migrates a pickle into its store.
+            try:
+                live_rows = source.memory.live_rows()
+                records = source._records(live_rows)
+                embeddings = source.store.decode(source.store.embeddings()[live_rows])
+            finally:
+                source.close()
+            if records:
+                self._write_records(records, embeddings)
+            os.replace(store_path, store_path + ".migrated")
+            logger.info(f"MemoryManager.import_memory_file: Imported {len(records)} memories from '{memory_file}' into '{self.store.path}'.")
+            return len(records)
+
+
+    @staticmethod
+    def _new_record(text: str, metadata: Dict[str, Any], timestamp: datetime, memory_id: str = None) -> Dict[str, Any]:
+        return {'id': memory_id or uuid.uuid4().hex, 'text': text, 'metadata': metadata or {}, 'timestamp': timestamp.timestamp()}
+
+
+    def _append_entry(self, text: str, embedding: np.ndarray, metadata: Dict[str, Any], timestamp: datetime, memory_id: str = None) -> MemoryView:
+        """Commits one entry to the store (O(1) I/O) and to the in-memory columns."""
+        record = self._new_record(text, metadata, timestamp, memory_id)
+        self.store.append(embedding, record)
+        self._remember([record])
+        return self.memory[len(self.memory) - 1]
+
+
+    def _remember(self, records: List[Dict[str, Any]]):
+        """Adds committed store records to the columns and the metadata and lexical indexes (row = row in self.memory)."""
+        for record in records:
+            row = len(self.memory)
+            self.metadata_index.add(row, record['metadata'], record['timestamp'])
+            if self.lexical_index is not None:
+                self.lexical_index.add(row, record['text'])
+            self.rows_by_id[record['id']] = row
+            self.memory.append(record['id'], record['text'], record['metadata'], record['timestamp'])
+
+
+    def save_memory(self): # Every add is already committed to the store; this only compacts it when enough of it is dead.
         try:
-            if self.embedding_model: #Ensures model exists before using it.
-                return self.embedding_model.encode(text) #Get embedding
-            else: #Handles case where embedding model was not loaded correctly.
-                logger.error("MemoryManager.generate_embeddings: Embedding model not available.")
-                return None  # Return None to signal error
+            if self.store.needs_compaction():
+                self.compact()
         except Exception as e:
-            logger.error(f"MemoryManager.generate_embeddings: Error generating embedding for '{text}': {e}")
-            return None  #Handles cases where generation failed.
-
-
-
-    def build_index(self): # Use FAISS index for similarity search
-
-        if self.memory and self.embedding_model:  #Only build index if the embedding model has loaded correctly and there is existing memory.
-            embeddings = np.array([entry['embedding'] for entry in self.memory if entry.get('embedding') is not None], dtype=np.float32)  #Create array from existing data, ignores items with no embeddings.  Converts to float32 to make sure FAISS can use it.
-            self.index = faiss.IndexFlatL2(self.embedding_dim)  # Create the FAISS index
-            if embeddings.size > 0: #Only add embeddings if the array exists.
-                self.index.add(embeddings)  # Add to the index
-        else:
-            self.index = faiss.IndexFlatL2(self.embedding_dim)  # Create a new index if there's no memory or embedding model yet
-            logger.warning("MemoryManager.build_index: Building a new index, since memory or embedding model not initialized correctly.")
+            logger.error(f"MemoryManager.save_memory: Error saving memory: {e}")  #Log error
 
 
+    def _records(self, rows: Iterable[int] = None) -> List[Dict[str, Any]]:
+        """Store records for the given rows (default: all live memories)."""
+        return [self.memory.record(int(row)) for row in (self.memory.live_rows() if rows is None else rows)]
 
-    def add_memory(self, text: str, metadata: Dict[str, Any] = None, timestamp: datetime = None): #Correct signature to use metadata for other information.
-        """Add text and metadata to memory."""
 
-        embedding = self.generate_embeddings(text) #Generate embedding
-        if embedding is not None: #If the embedding was generated correctly, continue with adding it to memory.
-            memory_entry = {
-                'text': text,
-                'embedding': embedding,
-                'metadata': metadata or {}, #Add metadata, initializes empty dictionary if there's no metadata
-                'timestamp': datetime.now() if timestamp is None else timestamp #Use current time if not provided
-            }
+    def compact(self):
+        """Rewrites the memory store with only the live entries, reclaiming the space of deleted ones."""
+        with self._writing():
+            self.index.wait_for_training()  # Training reads rows that compaction is about to renumber.
+            self._rewrite_store()
+            self.index.reset()
+            self.metadata_index = MetadataIndex.build(self.memory)
+            self.lexical_index = None
+
 
-            self.memory.append(memory_entry)  #Add the information.
+    def flush(self):
+        """Waits until every memory queued by add_memory is committed to the store and searchable (no-op with durability="sync")."""
+        if self.writer:
+            self.writer.flush()
 
-            if self.index:  #If there is an index, add embedding to the index.
-                self.index.add(np.array([embedding], dtype=np.float32))  # Correct usage of np.array and correct type for FAISS
 
+    @contextmanager
+    def _writing(self):
+        """Serializes a write with this process's other threads and, for a shared store, with other processes, once their writes are loaded."""
+        with self._lock, self.store.locked():
+            self.refresh()
+            yield
+
+
+    def refresh(self):
+        """Loads the memories other processes added to or deleted from a shared store (a no-op otherwise). Searches call this."""
+        if not self.store.shared:
+            return
+        with self._lock:
+            changes = self.store.refresh()
+            if changes is None:  # Compacted by another process, so every row number changed: reload.
+                self.index.wait_for_training()
+                self.store.close()
+                self.load_memory()
+                return
+            records, deleted_rows = changes
+            if records:
+                self._remember(records)
+                self.index.add(self.store.embeddings()[len(self.memory) - len(records):])
+            for row in deleted_rows:
+                self.memory.delete(row)
+                memory_id = self.memory.memory_id(row)
+                if self.rows_by_id.get(memory_id) == row:  # Not if an update already moved the id to a newer row.
+                    del self.rows_by_id[memory_id]
+
+
+    def close(self):
+        """Commits queued memories, stops the compactor, waits for background index training and closes the memory store files."""
+        if self.writer:
+            self.writer.stop()
+        if self.compactor:
+            self.compactor.stop()
+        with self._lock:
+            if self.index:
+                self.index.wait_for_training()
+            self.store.close()
+
+
+    @property
+    def embedding_model(self):
+        """The underlying SentenceTransformer, loaded on first access."""
+        return self.embeddings.model
+
+
+    def generate_embeddings(self, text: Union[str, List[str]], batch_size: int = 32) -> np.ndarray or None: # Correct return type hint
+        """Generates embeddings for given text (or a list of texts, batch_size per forward pass) using pre-trained model (unit-normalized in cosine mode)."""
+        embedding = self.embeddings.generate(text, batch_size=batch_size)  # Logs and returns None on failure.
+        if embedding is None:
+            return None
+        return self.normalize(embedding) if self.metric == "cosine" else embedding
+
+
+
+    def build_index(self): # Exact search over the memory-mapped store, promoted to a trained ANN tier as memory grows.
+
+        self.index = AdaptiveIndex(self.store, self.index_type, self.promote_threshold, metric=self.metric)
+
+
+
+    def add_memory(self, text: str, metadata: Dict[str, Any] = None, timestamp: datetime = None) -> str or None: #Correct signature to use metadata for other information.
+        """Add text and metadata to memory. Returns the new memory's id, or None if it could not be added.
+
+        With dedup_threshold set, a near-duplicate of an existing memory is merged into it instead (see _merge_duplicates)
+        and that memory's id is returned. With durability="batch" (which excludes dedup_threshold) the memory is only
+        queued: it is embedded, committed and searchable once the writer's next batch is, or after flush(); a crash before
+        then loses it.
+        """
+        record = self._new_record(text, metadata, datetime.now() if timestamp is None else timestamp)
+        if self.writer:
+            self.writer.submit(record)
+            return record['id']
+        if self._commit_records([record], batch_size=1) is None:  # Appends to the store, no full rewrite.
+            return None
+        return record['id']  # The id it was merged into, if it was.
+
+
+    def get_memory(self, memory_id: str) -> Dict[str, Any] or None:
+        """Returns a copy of the memory with the given id, or None if there is none."""
+        self.flush()
+        with self._lock:
+            self.refresh()
+            row = self.rows_by_id.get(memory_id)
+            return self.memory[row].copy() if row is not None else None
+
+
+    def delete_memories(self, memory_ids: Iterable[str]) -> int:
+        """Deletes memories by id with one tombstone write; their space is reclaimed by compaction. Returns the number deleted."""
+        self.flush()  # Queued memories have no row yet. Not under the lock, which the writer needs to commit them.
+        return self._delete_ids(memory_ids)
+
+
+    def _delete_ids(self, memory_ids: Iterable[str]) -> int:
+        with self._writing():
+            rows = [self.rows_by_id.pop(memory_id) for memory_id in memory_ids if memory_id in self.rows_by_id]
+            if not rows:
+                return 0
+            try:
+                self.store.delete(rows)
+            except Exception as e:
+                logger.error(f"MemoryManager.delete_memories: Error persisting deletion of {len(rows)} memories: {e}")
+                for row in rows:
+                    self.rows_by_id[self.memory.memory_id(row)] = row
+                return 0
+            for row in rows:
+                self.memory.delete(row)
             self.save_memory()
-
-
-    def manage_context(self, current_context: str, new_message: str, context_window: int = 2048) -> str:  # Implements context window management
-        """Manages the context window, appending new messages and removing old ones as needed."""
-
-        updated_context = (current_context + "\n" + new_message).strip()  #Combine current context and new message
-
-        # Implement logic for managing size (e.g., tokens) and update updated_context by removing old messages.  Tokenization of context and messages is required.
-        # Example (simple truncation based on characters - replace with token-based logic):
-
-        if len(updated_context) > context_window:
-            updated_context = updated_context[-context_window:] #Keep last part if context is too large.
-
-        return updated_context
-
-
-    def search(self, query: str, top_k: int = 5, min_score=0.0) -> List[Dict[str, Any]]:  #Type hinting, returns list of dict with text, metadata, timestamp, and similarity score
-        """Searches memory for similar entries."""
-
+            return len(rows)
+
+
+    def delete_memory(self, memory_id: str) -> bool:
+        return self.delete_memories([memory_id]) == 1
+
+
+    def update_memory(self, memory_id: str, text: str = None, metadata: Dict[str, Any] = None) -> bool:
+        """Replaces the text and/or metadata of a memory, keeping its id and timestamp. A new text is re-embedded.
+
+        The timestamp is when the memory was made, which ttl expiry and since/until windows go by, so an update neither
+        extends its life nor moves it in time. The new version is appended before the old one is deleted, so a crash in
+        between never loses the memory.
+        """
+        embedding = self.generate_embeddings(text) if text is not None else None
+        if text is not None and embedding is None:
+            return False
+        self.flush()
+
+        with self._writing():
+            row = self.rows_by_id.get(memory_id)
+            if row is None:
+                logger.warning(f"MemoryManager.update_memory: No memory with id '{memory_id}'.")
+                return False
+            old_entry = self.memory[row]
+            if embedding is None:
+                embedding = self.store.decode(self.store.embeddings()[row:row + 1])[0]
+            try:
+                self._append_entry(old_entry['text'] if text is None else text, embedding, old_entry['metadata'] if metadata is None else metadata, old_entry['timestamp'], memory_id)
+                self.store.delete([row])
+            except Exception as e:
+                logger.error(f"MemoryManager.update_memory: Error persisting update of '{memory_id}': {e}")
+                return False
+            self.memory.delete(row)
+            self.index.add(np.array([embedding], dtype=np.float32))
+            self.save_memory()
+            return True
+
+
+    def expire(self, now: datetime = None) -> int:
+        """Applies the retention policy: deletes memories older than ttl and the oldest beyond max_entries. Returns the number deleted."""
+        if not self.ttl and not self.max_entries:
+            return 0
+        with self._writing():
+            live_rows = self.memory.live_rows()
+            timestamps = self.memory.timestamp_array()[live_rows]
+            expired = np.zeros(len(live_rows), dtype=bool)
+            if self.ttl:
+                expired = timestamps < self._expired_before(now)
+            remaining = np.flatnonzero(~expired)
+            if self.max_entries and len(remaining) > self.max_entries:
+                oldest_first = remaining[np.argsort(timestamps[remaining], kind="stable")]
+                expired[oldest_first[:len(remaining) - self.max_entries]] = True
+            return self._delete_ids([self.memory.memory_id(row) for row in live_rows[expired].tolist()])
+
+
+    def _expired_before(self, now: datetime = None) -> int or None:
+        """The ttl cutoff as a column timestamp (microseconds), or None without a ttl."""
+        if not self.ttl:
+            return None
+        return round(((now or datetime.now()) - timedelta(seconds=self.ttl)).timestamp() * 1_000_000)
+
+
+    def benchmark_index(self, num_queries: int = 100, top_k: int = 10, tiers=BENCHMARK_TIERS) -> List[Dict[str, Any]]:
+        """Reports recall@top_k, latency and bytes per vector of each index tier (and of int8 storage) on this memory,
+        to pick index_type and quantization for a deployment."""
+        embeddings = self.store.decode(self.store.embeddings())
+        if embeddings.shape[0] == 0:
+            logger.warning("MemoryManager.benchmark_index: Memory is empty, nothing to benchmark.")
+            return []
+        rows = np.random.default_rng(0).choice(embeddings.shape[0], min(num_queries, embeddings.shape[0]), replace=False)
+        return benchmark_index_tiers(embeddings, embeddings[np.sort(rows)], top_k, tiers, metric=self.metric)
+
+
+    def add_memories(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, timestamps: List[datetime] = None, batch_size: int = 64) -> int:
+        """Adds many texts at once: encodes batch_size texts per forward pass, then persists and indexes them in one call each.
+
+        Returns the number of memories added, which excludes those merged into existing ones (see dedup_threshold).
+        """
+        if not texts:
+            return 0
+        if metadatas is not None and len(metadatas) != len(texts) or timestamps is not None and len(timestamps) != len(texts):
+            logger.error("MemoryManager.add_memories: metadatas and timestamps must have one entry per text.")
+            return 0
+
+        now = datetime.now()
+        records = [self._new_record(text, metadatas[i] if metadatas else None, timestamps[i] if timestamps else now) for i, text in enumerate(texts)]
+        return self._commit_records(records, batch_size) or 0
+
+
+    def _commit_records(self, records: List[Dict[str, Any]], batch_size: int = 64) -> int or None:
+        """Embeds new store records, then persists them with one store write (and fsync) and indexes them.
+
+        Returns the number of new memories (records merged into existing ones are not counted), or None on error.
+        """
+        embeddings = self.generate_embeddings([record['text'] for record in records], batch_size=batch_size)
+        if embeddings is None:
+            return None
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(records), -1)
+
+        with self._writing():
+            count = len(records)
+            superseded_rows = []
+            if self.dedup_threshold is not None:
+                records, embeddings, superseded_rows = self._merge_duplicates(records, embeddings)
+            try:
+                self._write_records(records, embeddings, superseded_rows)
+            except Exception as e:
+                logger.error(f"MemoryManager._commit_records: Error persisting {count} memories: {e}")
+                return None
+            self.save_memory()
+        return len(records) - len(superseded_rows)  # Each superseded row got one merged new version.
+
+
+    def _write_records(self, records: List[Dict[str, Any]], embeddings: np.ndarray, superseded_rows: List[int] = ()):
+        """Appends records (new memories, or new versions of existing ids) with one store write, then deletes the rows they
+        supersede with one tombstone write, and indexes them. Call inside _writing()."""
+        self.store.append_many(embeddings, records)
+        self._remember(records)
+        if superseded_rows:
+            self.store.delete(superseded_rows)
+            for row in superseded_rows:
+                memory_id = self.memory.memory_id(row)
+                self.memory.delete(row)
+                if self.rows_by_id.get(memory_id) == row:  # Not replaced by a new version above.
+                    del self.rows_by_id[memory_id]
+        if self.index:
+            self.index.add(embeddings)
+
+
+    def _merge_duplicates(self, records: List[Dict[str, Any]], embeddings: np.ndarray) -> Tuple[List[Dict[str, Any]], np.ndarray, List[int]]:
+        """Folds new records that are near-duplicates (cosine >= dedup_threshold) of a live memory, or of an earlier record
+        in the batch, into that memory instead of adding them. Only memories with the same metadata (see _same_metadata)
+        are merged, so a merged record still turns up in every filtered search it would have.
+
+        The memory absorbing them has 'duplicate_count' in its metadata incremented and its timestamp moved to the latest
+        duplicate's; an existing memory is rewritten as a new version with the same id. Each merged record gets the id
+        it was merged into. Returns the records and embeddings to append and the rows they supersede. Call inside _writing().
+        """
+        neighbours = self.search_embeddings(embeddings, top_k=DEDUP_NEIGHBOURS, min_score=self.dedup_threshold)
+        kept, kept_embeddings = [], np.empty_like(embeddings)
+        merged: Dict[int, Dict[str, Any]] = {}  # Existing row -> its new version.
+        for i, record in enumerate(records):
+            neighbour = next((neighbour for neighbour in neighbours[i] if self._same_metadata(neighbour['metadata'], record['metadata'])), None)  # Best scoring first.
+            score = neighbour['similarity_score'] if neighbour else -np.inf
+            target = None
+            if kept:  # Near-duplicates within one batch never reach the index, so compare them directly.
+                similarities = Embeddings.similarities(embeddings[i], kept_embeddings[:len(kept)], normalized=True)
+                similarities[[not self._same_metadata(other['metadata'], record['metadata']) for other in kept]] = -np.inf
+                j = int(np.argmax(similarities))
+                if similarities[j] >= self.dedup_threshold and similarities[j] > score:
+                    target = kept[j]
+            if target is None and neighbour:
+                target = merged.setdefault(neighbour.row, self.memory.record(neighbour.row))
+            if target is None:
+                record['metadata'] = dict(record['metadata'])  # Counted into below, so not the caller's dict.
+                kept_embeddings[len(kept)] = embeddings[i]
+                kept.append(record)
+                continue
+            target['metadata']['duplicate_count'] = target['metadata'].get('duplicate_count', 0) + 1
+            target['timestamp'] = max(target['timestamp'], record['timestamp'])
+            record['id'] = target['id']
+
+        rows = sorted(merged)
+        merged_embeddings = self.store.decode(self.store.embeddings()[rows]) if rows else np.empty((0, self.embedding_dim), dtype=np.float32)
+        return kept + [merged[row] for row in rows], np.concatenate([kept_embeddings[:len(kept)], merged_embeddings]), rows
+
+
+    @staticmethod
+    def _same_metadata(metadata: Dict[str, Any], other: Dict[str, Any]) -> bool:
+        """Whether two memories' metadata are equal apart from 'duplicate_count', so merging one into the other loses
+        nothing a filter (e.g. {"agent_id": 7}) could select on."""
+        return {key: value for key, value in (metadata or {}).items() if key != 'duplicate_count'} == {key: value for key, value in (other or {}).items() if key != 'duplicate_count'}
+
+
+    def deduplicate(self, threshold: float = None, batch_size: int = 1024) -> int:
+        """Offline pass merging near-duplicate memories already in the store (e.g. written before dedup_threshold was set)
+        into the oldest of each group with the same metadata, counted in its 'duplicate_count' as on insert. Returns the
+        number of memories removed.
+        """
+        threshold = self.dedup_threshold if threshold is None else threshold
+        if threshold is None or self.metric != "cosine":
+            logger.error("MemoryManager.deduplicate: Needs a threshold and metric='cosine'.")
+            return 0
+        self.flush()
+        with self._writing():
+            live_rows = self.memory.live_rows()
+            root_of: Dict[int, int] = {}  # Duplicate row -> the row it merges into, which is never a duplicate itself.
+            groups: Dict[int, List[int]] = {}  # Root row -> its duplicates.
+            for start in range(0, len(live_rows), batch_size):
+                chunk = live_rows[start:start + batch_size]
+                queries = self.store.decode(self.store.embeddings()[chunk])
+                for row, neighbours in zip(chunk.tolist(), self.search_embeddings(queries, top_k=DEDUP_NEIGHBOURS, min_score=threshold)):
+                    older = next((neighbour.row for neighbour in neighbours if neighbour.row < row and self._same_metadata(neighbour['metadata'], self.memory.metadata(row))), None)  # Best scoring first.
+                    if older is not None:
+                        root_of[row] = root_of.get(older, older)
+                        groups.setdefault(root_of[row], []).append(row)
+            if not root_of:
+                return 0
+
+            roots = sorted(groups)
+            records = []
+            for root in roots:
+                record = self.memory.record(root)
+                duplicates = groups[root]
+                record['metadata']['duplicate_count'] = sum(self.memory.metadata(row).get('duplicate_count', 0) + 1 for row in duplicates) + record['metadata'].get('duplicate_count', 0)
+                record['timestamp'] = max([record['timestamp']] + [self.memory.timestamp_seconds(row) for row in duplicates])
+                records.append(record)
+            try:
+                self._write_records(records, self.store.decode(self.store.embeddings()[roots]), roots + sorted(root_of))
+            except Exception as e:
+                logger.error(f"MemoryManager.deduplicate: Error persisting deduplication: {e}")
+                return 0
+            self.save_memory()
+            logger.info(f"MemoryManager.deduplicate: Merged {len(root_of)} near-duplicate memories into {len(roots)}.")
+            return len(root_of)
+
+
+    def add_memories_stream(self, items: Iterable[Union[str, Tuple[str, Dict[str, Any]]]], batch_size: int = 64, chunk_size: int = 4096) -> int:
+        """Ingests an iterator of texts or (text, metadata) pairs of any length, holding at most chunk_size of them in memory.
+
+        Returns the number of memories added.
+        """
+        items = iter(items)
+        added = 0
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                return added
+            texts = [item if isinstance(item, str) else item[0] for item in chunk]
+            metadatas = [{} if isinstance(item, str) else item[1] for item in chunk]
+            added += self.add_memories(texts, metadatas, batch_size=batch_size)
+            logger.info(f"MemoryManager.add_memories_stream: Added {added} memories so far.")
+
+
+    def manage_context(self, current_context: str, new_message: str, context_window: int = 2048, tokenizer=None) -> str:  # Implements context window management
+        """Manages the context window, appending new messages and removing old ones as needed.
+
+        Stateless fallback for callers holding the context as a plain string: re-tokenizes it on every call and drops
+        whole oldest lines until it fits context_window tokens. Agents keep a ContextWindow instead, which does the same
+        incrementally.
+        """
+        window = ContextWindow(max_tokens=context_window, tokenizer=tokenizer)
+        for line in (current_context + "\n" + new_message).strip().split("\n"):  #Combine current context and new message
+            window.add(line)
+        return window.render()
+
+
+    def search(self, query: str, top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None, mode: str = "vector") -> List[Dict[str, Any]]:  #Type hinting, returns list of dict with text, metadata, timestamp, and similarity score
+        """Searches memory for similar entries.
+
+        filters restricts the search to entries whose metadata matches, e.g. {"agent_id": 7} or {"priority": {"$gte": 3}}
+        (see MetadataIndex), and since/until to entries with since <= timestamp < until. Candidates are resolved through
+        the metadata index before the vector search, so no over-fetching is needed.
+
+        mode is one of SEARCH_MODES: "vector" (embedding similarity), "lexical" (BM25 over the texts; finds exact terms
+        such as ticket numbers, file names or error codes and needs no embedding) or "hybrid" (both, fused by reciprocal
+        rank). 'similarity_score' is the cosine similarity, the BM25 score or the fused score respectively; hybrid
+        results also carry 'vector_score' and/or 'bm25_score'. min_score applies to vector similarities only.
+        """
+        if mode not in SEARCH_MODES:
+            logger.error(f"MemoryManager.search: Unknown search mode '{mode}'. Expected one of {SEARCH_MODES}.")
+            return []
+        if mode == "lexical":
+            return self.search_lexical(query, top_k, filters, since, until)
 
         query_embedding = self.generate_embeddings(query) #Generate embedding from the query string
-
-        if query_embedding is not None and self.index is not None:  #Check to make sure index and query embedding have been created
-            D, I = self.index.search(np.array([query_embedding], dtype=np.float32), top_k) #Search
+        if mode == "vector":
+            return self.search_embedding(query_embedding, top_k, min_score, filters, since, until)
+
+        candidates = max(top_k * 4, HYBRID_CANDIDATES)  # Fusion needs more than top_k of each list to rerank well.
+        self._build_lexical_index()  # Before taking the lock, so the first hybrid search does not block the others.
+        with self._lock:  # Both lists must see the same rows.
+            self.refresh()
+            vector_results = self.search_embedding(query_embedding, candidates, min_score, filters, since, until)
+            lexical_results = self._search_lexical(query, candidates, filters, since, until)
+        for result in vector_results:
+            result['vector_score'] = result.pop('similarity_score')
+        for result in lexical_results:
+            result['bm25_score'] = result.pop('similarity_score')
+        results = reciprocal_rank_fusion([vector_results, lexical_results], top_k)
+        for result in results:
+            result['similarity_score'] = result.pop('rrf_score')
+        return results
+
+
+    def _excluded_rows(self) -> np.ndarray:
+        """Sorted rows searches must skip: deleted ones and, with a ttl, expired ones (until the compactor deletes them).
+        The same array is returned until a row is deleted or expires or the store is compacted, so the index can reuse
+        its selector for it. Call with the lock held."""
+        deleted_rows = self.store.deleted_rows
+        expired, expired_count = None, 0
+        expired_before = self._expired_before()
+        if expired_before is not None:
+            cutoff = expired_before / 1_000_000
+            expired_count = self.metadata_index.count_before(cutoff)  # Rows 0 to expired_count - 1.
+            if expired_count is None:  # Timestamps out of row order: scan them.
+                expired = self.metadata_index.select(until=cutoff)
+                expired_count = len(expired)
+        key = (self.store.generation, len(deleted_rows), expired_count)  # Tombstones only accumulate within a generation, and expired rows stay expired.
+        if key != self._excluded_key:
+            excluded = np.sort(np.fromiter(deleted_rows, dtype=np.int64, count=len(deleted_rows)))
+            if expired_count:
+                excluded = np.union1d(excluded, np.arange(expired_count, dtype=np.int64) if expired is None else expired)
+            self._excluded, self._excluded_key = excluded, key
+        return self._excluded
+
+
+    def _candidate_rows(self, filters: Dict[str, Any], since: datetime, until: datetime, excluded: np.ndarray) -> np.ndarray or None:
+        """Rows matching the filters and time window, minus the excluded rows, or None when nothing restricts the search.
+        Call with the lock held."""
+        if not filters and since is None and until is None:
+            return None
+        rows = self.metadata_index.select(filters, since, until)  # Raises ValueError on invalid filters.
+        if len(excluded):
+            rows = np.setdiff1d(rows, excluded, assume_unique=True)
+        return rows
+
+
+    def _build_lexical_index(self):
+        """Builds the lexical index on first use. The texts are tokenized without holding any lock (other searches and
+        writes go on meanwhile); only the rows added during the build are indexed under the lock, and a build that a
+        compaction or reload overtook (rows renumbered) starts over."""
+        if self.lexical_index is not None:
+            return
+        with self._lexical_build_lock:  # Never taken with self._lock held.
+            while self.lexical_index is None:
+                with self._lock:
+                    self.refresh()
+                    memory, size = self.memory, len(self.memory)
+                lexical_index = LexicalIndex.build(memory, size)
+                with self._lock:
+                    if self.memory is memory:
+                        for row in range(size, len(memory)):
+                            lexical_index.add(row, memory.text(row) if memory.is_live(row) else "")
+                        self.lexical_index = lexical_index
+
+
+    def search_lexical(self, query: str, top_k: int = 5, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None) -> List[Dict[str, Any]]:
+        """BM25 search over the memory texts; 'similarity_score' is the BM25 score. Costs no embedding."""
+        self._build_lexical_index()
+        with self._lock:
+            self.refresh()
+            return self._search_lexical(query, top_k, filters, since, until)
+
+
+    def _search_lexical(self, query: str, top_k: int, filters: Dict[str, Any], since: datetime, until: datetime) -> List[Dict[str, Any]]:
+        """search_lexical() with the lock held."""
+        if self.lexical_index is None:  # Dropped by a reload or compaction since it was built: rebuild in place.
+            self.lexical_index = LexicalIndex.build(self.memory)
+        excluded = self._excluded_rows()
+        try:
+            rows = self._candidate_rows(filters, since, until, excluded)
+        except ValueError as e:
+            logger.error(f"MemoryManager.search: Invalid filter: {e}")
+            return []
+        if rows is not None and rows.size == 0:
+            return []
+        scores, found = self.lexical_index.search(query, top_k, rows, exclude=excluded)
+        return [MemoryView(self.memory, int(row), float(score)) for score, row in zip(scores, found)]
 
 
-            results = []
-            for i in range(top_k):  # Retrieve data for the top_k closest matches
-              index = I[0][i]  #Get index of ith result
+    def search_embedding(self, query_embedding: np.ndarray, top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None) -> List[Dict[str, Any]]:
+        """search() for an already generated (and, in cosine mode, normalized) query embedding, e.g. one shared by several managers."""
 
-              if index >= 0 and index < len(self.memory): #Check if it's a valid index
-                  score = 1- D[0][i]/2 # Normalize score. Scale from 0 to 1 where 0 is least similar, 1 is most similar.
-                  if score>= min_score:  #Use min_score for threshold.
-                      memory_entry = self.memory[index].copy()  # Make copy to avoid changing the memory directly
-                      memory_entry['similarity_score'] = score
-                      results.append(memory_entry)  # Add the relevant information.
-            return results
+        if query_embedding is not None and self.index is not None:  #Check to make sure index and query embedding have been created
+            return self.search_embeddings(np.array([query_embedding], dtype=np.float32), top_k, min_score, filters, since, until)[0]
 
         else:  #If the index is not available (no memory yet, or issue with the embedding model).  Include more handling here if needed.
             logger.warning(f"MemoryManager.search: Cannot perform search. Index or embedding model not available.")
-            return [] # Return empty list if search isn't possible.
\ No newline at end of file
+            return [] # Return empty list if search isn't possible.
+
+
+    def search_many(self, queries: List[str], top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None, batch_size: int = 32) -> List[List[Dict[str, Any]]]:
+        """search() for many queries at once: one batched encode and one index search over the query matrix.
+
+        Returns one result list per query, in order. filters/since/until apply to every query.
+        """
+        if not queries:
+            return []
+        query_embeddings = self.generate_embeddings(list(queries), batch_size=batch_size)
+        if query_embeddings is None or self.index is None:
+            logger.warning(f"MemoryManager.search_many: Cannot perform search. Index or embedding model not available.")
+            return [[] for _ in queries]
+        return self.search_embeddings(query_embeddings, top_k, min_score, filters, since, until)
+
+
+    def search_embeddings(self, query_embeddings: np.ndarray, top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None) -> List[List[Dict[str, Any]]]:
+        """Searches a (num_queries, dim) matrix of query embeddings with a single index search; one result list per row."""
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+        no_results = [[] for _ in range(query_embeddings.shape[0])]
+        with self._lock:  # Compaction renumbers rows; do not let it run between the index search and the row lookups.
+            self.refresh()
+            excluded = self._excluded_rows()  # Deleted and expired rows stay in the index until compaction; it skips them.
+            try:
+                rows = self._candidate_rows(filters, since, until, excluded)
+            except ValueError as e:
+                logger.error(f"MemoryManager.search: Invalid filter: {e}")
+                return no_results
+            if rows is not None and rows.size == 0:
+                return no_results
+
+            D, I = self.index.search(query_embeddings, top_k, rows, exclude=excluded if rows is None else None) #Search
+
+            if self.metric == "cosine":
+                scores = D  # Inner product of unit vectors is the cosine similarity.
+            else:
+                scores = 1 - D / 2  # Legacy L2 scoring, only meaningful if the embeddings happen to be unit length.
+            all_results = []
+            for query_scores, query_rows in zip(scores.tolist(), I.tolist()):  # Retrieve data for the top_k closest matches of each query
+                results = []
+                for score, index in zip(query_scores, query_rows):
+                    if index < 0:  # Padding: fewer than k rows to return.
+                        break
+                    if score < min_score:  # Results are sorted, nothing further can pass the threshold.
+                        break
+                    results.append(MemoryView(self.memory, index, score))  # Reads the columns lazily; nothing is copied.
+                all_results.append(results)
+            return all_results
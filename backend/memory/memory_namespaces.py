@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import List, Dict, Any
+from urllib.parse import quote, unquote
+
+from embeddings import Embeddings
+from memory_manager import MemoryManager
+
+
+logger = logging.getLogger(__name__)
+
+
+
+SHARED_NAMESPACE = "shared"  # Memories not owned by one agent, user or task, e.g. those of the pre-namespace memory.pkl.
+
+
+def namespace_name(kind: str, key: Any) -> str:
+    """Conventional namespace names: namespace_name("agent", 7) -> "agent/7" (also "user/<id>", "task/<id>")."""
+    return f"{kind}/{key}"
+
+
+
+class NamespacedMemory:
+    """Memory split into namespaces (one per agent, user or task), each a MemoryManager with its own store shard and index.
+
+    Shards live in directory as <quoted namespace>.store and are opened on first use, so a search in one namespace only
+    touches that namespace's rows, and a busy namespace does not slow down or grow the others. Searching several (or
+    all) namespaces embeds the query once, searches every shard and merges their top-k lists by score.
+    All shards share one Embeddings instance; manager_kwargs (index_type, metric, ...) apply to every shard.
+    """
+
+    SHARD_SUFFIX = ".store"
+
+    def __init__(self, directory: str = "memory", embedding_model_name: str = 'all-mpnet-base-v2', embeddings: Embeddings = None, **manager_kwargs: Any):
+        self.directory = directory
+        self.embedding_model_name = embedding_model_name
+        self.embeddings = embeddings or Embeddings(embedding_model_name, lazy=True)
+        self.manager_kwargs = manager_kwargs
+        self.shards: Dict[str, MemoryManager] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+
+    def shard_file(self, namespace: str) -> str:
+        """Legacy-style memory file of a namespace; its store is the same path with the .store suffix."""
+        if not namespace:
+            raise ValueError("NamespacedMemory: Namespace must not be empty.")
+        return os.path.join(self.directory, quote(namespace, safe='') + ".pkl")  # Quoted, so "agent/7" stays one file name.
+
+
+    def namespace(self, namespace: str) -> MemoryManager:
+        """Returns the MemoryManager of a namespace, opening (or creating) its shard on first use."""
+        with self._lock:
+            if namespace not in self.shards:
+                self.shards[namespace] = MemoryManager(embedding_model_name=self.embedding_model_name, memory_file=self.shard_file(namespace), embeddings=self.embeddings, **self.manager_kwargs)
+            return self.shards[namespace]
+
+
+    def namespaces(self) -> List[str]:
+        """All namespaces, both open and on disk."""
+        on_disk = {unquote(name[:-len(self.SHARD_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(self.SHARD_SUFFIX)}
+        with self._lock:
+            return sorted(on_disk | set(self.shards))
+
+
+    def import_memory_file(self, memory_file: str = "memory.pkl", namespace: str = SHARED_NAMESPACE) -> int:
+        """One-time move of an un-namespaced memory file (e.g. the legacy memory.pkl) into a namespace; see
+        MemoryManager.import_memory_file. A no-op once it was imported."""
+        if not os.path.isfile(memory_file) and not os.path.isdir(os.path.splitext(memory_file)[0] + ".store"):
+            return 0  # Without opening (and so creating) the namespace's shard.
+        return self.namespace(namespace).import_memory_file(memory_file)
+
+
+    def add_memory(self, namespace: str, text: str, metadata: Dict[str, Any] = None, timestamp: datetime = None) -> str or None:
+        return self.namespace(namespace).add_memory(text, metadata, timestamp)
+
+
+    def add_memories(self, namespace: str, texts: List[str], metadatas: List[Dict[str, Any]] = None, timestamps: List[datetime] = None, batch_size: int = 64) -> int:
+        return self.namespace(namespace).add_memories(texts, metadatas, timestamps, batch_size)
+
+
+    def search(self, query: str, namespaces: List[str] = None, top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None, mode: str = "vector") -> List[Dict[str, Any]]:
+        """Searches the given namespaces (default: all) and returns the overall top_k, each result tagged with its 'namespace'.
+
+        filters/since/until and mode are applied within every shard, as in MemoryManager.search.
+        """
+        namespaces = self.namespaces() if namespaces is None else namespaces
+        if not namespaces:
+            return []
+        shards = [(namespace, self.namespace(namespace)) for namespace in namespaces]
+
+        if mode == "vector":
+            query_embedding = shards[0][1].generate_embeddings(query)  # Same model and metric in every shard: embed once.
+            if query_embedding is None:
+                logger.warning("NamespacedMemory.search: Cannot perform search. Embedding model not available.")
+                return []
+            search = lambda manager: manager.search_embedding(query_embedding, top_k, min_score, filters, since, until)
+        else:  # Lexical search needs no embedding; hybrid re-embeds per shard, which the embedding cache makes a lookup.
+            search = lambda manager: manager.search(query, top_k, min_score, filters, since, until, mode)
+
+        results = []
+        for namespace, manager in shards:
+            for result in search(manager):
+                result['namespace'] = namespace
+                results.append(result)
+        results.sort(key=lambda result: result['similarity_score'], reverse=True)  # Per-shard lists are already sorted; this merges them.
+        return results[:top_k]
+
+
+    def search_many(self, queries: List[str], namespaces: List[str] = None, top_k: int = 5, min_score=0.0, filters: Dict[str, Any] = None, since: datetime = None, until: datetime = None, batch_size: int = 32) -> List[List[Dict[str, Any]]]:
+        """search() for many queries at once: one batched encode, one index search per shard, and per query the shards'
+        top-k lists merged by score. Returns one result list per query, in order."""
+        namespaces = self.namespaces() if namespaces is None else namespaces
+        if not queries:
+            return []
+        if not namespaces:
+            return [[] for _ in queries]
+        shards = [(namespace, self.namespace(namespace)) for namespace in namespaces]
+        query_embeddings = shards[0][1].generate_embeddings(list(queries), batch_size=batch_size)
+        if query_embeddings is None:
+            logger.warning("NamespacedMemory.search_many: Cannot perform search. Embedding model not available.")
+            return [[] for _ in queries]
+
+        all_results = [[] for _ in queries]
+        for namespace, manager in shards:
+            for results, shard_results in zip(all_results, manager.search_embeddings(query_embeddings, top_k, min_score, filters, since, until)):
+                for result in shard_results:
+                    result['namespace'] = namespace
+                    results.append(result)
+        for results in all_results:
+            results.sort(key=lambda result: result['similarity_score'], reverse=True)
+            del results[top_k:]
+        return all_results
+
+
+    def flush(self):
+        """Waits for every open shard's queued memories to be committed (see MemoryManager.flush)."""
+        with self._lock:
+            shards = list(self.shards.values())
+        for manager in shards:
+            manager.flush()
+
+
+    def close(self):
+        with self._lock:
+            for manager in self.shards.values():
+                manager.close()
+            self.shards.clear()
@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+from typing import Dict, Any
+
+import memory_store
+from embedding_cache import EmbeddingCache
+from embeddings import Embeddings
+from memory_manager import MemoryManager
+from memory_namespaces import NamespacedMemory
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class MemoryRegistry:
+    """Process-wide, reference-counted registry of embedding models and memory managers.
+
+    Agents and the API acquire their MemoryManager (or NamespacedMemory) here instead of constructing one, so every user
+    of the same memory file or directory shares one manager (one store, one index) and every manager using the same
+    model shares one Embeddings instance. Models load lazily on first use and are unloaded when the last reference is released. All shared
+    Embeddings use one EmbeddingCache (entries are keyed by model name), optionally persisted to cache_path.
+    embedding_backend and embedding_threads choose the inference runtime of every model loaded here (see Embeddings).
+    Where shared (multi-process) stores are unsupported (no fcntl, e.g. Windows), shared=True falls back to a
+    single-process store with a warning, so the API and agents still start.
+    """
+
+    def __init__(self, cache_size: int = 10_000, cache_path: str = None, embedding_backend: str = "torch", embedding_threads: int = None):
+        self._lock = threading.Lock()
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.embedding_cache = EmbeddingCache(max_entries=cache_size, db_path=cache_path)
+        self._embeddings: Dict[str, Embeddings] = {}
+        self._embedding_refs: Dict[str, int] = {}
+        self._managers: Dict[str, MemoryManager] = {}
+        self._manager_refs: Dict[str, int] = {}
+        self._namespaced: Dict[str, NamespacedMemory] = {}
+        self._namespaced_refs: Dict[str, int] = {}
+
+
+    def acquire_embeddings(self, model_name: str = 'all-mpnet-base-v2') -> Embeddings:
+        """Returns the shared Embeddings for model_name. Each call must be paired with release_embeddings()."""
+        with self._lock:
+            return self._acquire_embeddings(model_name)
+
+
+    def _acquire_embeddings(self, model_name: str) -> Embeddings:
+        if model_name not in self._embeddings:
+            self._embeddings[model_name] = Embeddings(model_name, lazy=True, cache=self.embedding_cache, backend=self.embedding_backend, threads=self.embedding_threads)  # Loaded by the first generate() call.
+            self._embedding_refs[model_name] = 0
+        self._embedding_refs[model_name] += 1
+        return self._embeddings[model_name]
+
+
+    def release_embeddings(self, model_name: str):
+        with self._lock:
+            self._release_embeddings(model_name)
+
+
+    def _release_embeddings(self, model_name: str):
+        if model_name not in self._embedding_refs:
+            logger.warning(f"MemoryRegistry: Embedding model '{model_name}' is not registered.")
+            return
+        self._embedding_refs[model_name] -= 1
+        if self._embedding_refs[model_name] <= 0:
+            self._embeddings.pop(model_name).unload()
+            del self._embedding_refs[model_name]
+            logger.info(f"MemoryRegistry: Unloaded embedding model '{model_name}'.")
+
+
+    @staticmethod
+    def _store_kwargs(kwargs: Dict[str, Any], path: str) -> Dict[str, Any]:
+        if kwargs.get('shared') and memory_store.fcntl is None:
+            logger.warning(f"MemoryRegistry: Shared memory stores need POSIX file locking; opening '{path}' for this process only. Do not open it from several processes.")
+            return dict(kwargs, shared=False)
+        return kwargs
+
+
+    def acquire_memory_manager(self, memory_file: str = "memory.pkl", embedding_model_name: str = 'all-mpnet-base-v2', **kwargs: Any) -> MemoryManager:
+        """Returns the shared MemoryManager for memory_file, creating it on first use.
+
+        kwargs are passed to MemoryManager only when it is created. Each call must be paired with release_memory_manager().
+        """
+        key = os.path.abspath(memory_file)
+        with self._lock:
+            if key not in self._managers:
+                embeddings = self._acquire_embeddings(embedding_model_name)
+                try:
+                    self._managers[key] = MemoryManager(embedding_model_name=embedding_model_name, memory_file=memory_file, embeddings=embeddings, **self._store_kwargs(kwargs, memory_file))
+                except Exception:
+                    self._release_embeddings(embedding_model_name)
+                    raise
+                self._manager_refs[key] = 0
+            elif self._managers[key].embedding_model_name != embedding_model_name:
+                logger.warning(f"MemoryRegistry: '{memory_file}' is already open with model '{self._managers[key].embedding_model_name}'; ignoring '{embedding_model_name}'.")
+            self._manager_refs[key] += 1
+            return self._managers[key]
+
+
+    def release_memory_manager(self, memory_manager: MemoryManager):
+        """Drops one reference; the last release closes the manager and releases its embedding model."""
+        key = os.path.abspath(memory_manager.memory_file)
+        with self._lock:
+            if self._managers.get(key) is not memory_manager:
+                logger.warning(f"MemoryRegistry: MemoryManager for '{memory_manager.memory_file}' was not acquired from this registry.")
+                return
+            self._manager_refs[key] -= 1
+            if self._manager_refs[key] > 0:
+                return
+            del self._managers[key]
+            del self._manager_refs[key]
+            memory_manager.close()
+            self._release_embeddings(memory_manager.embedding_model_name)
+
+
+    def acquire_namespaced_memory(self, directory: str = "memory", embedding_model_name: str = 'all-mpnet-base-v2', legacy_memory_file: str = None, **kwargs: Any) -> NamespacedMemory:
+        """Returns the shared NamespacedMemory for directory, creating it on first use.
+
+        On creation, the memories of legacy_memory_file (an un-namespaced memory file such as memory.pkl), if given and
+        not yet imported, are moved into its shared namespace. kwargs are passed to every shard's MemoryManager. Each
+        call must be paired with release_namespaced_memory().
+        """
+        key = os.path.abspath(directory)
+        with self._lock:
+            if key not in self._namespaced:
+                embeddings = self._acquire_embeddings(embedding_model_name)
+                try:
+                    namespaced_memory = NamespacedMemory(directory, embedding_model_name, embeddings=embeddings, **self._store_kwargs(kwargs, directory))
+                except Exception:
+                    self._release_embeddings(embedding_model_name)
+                    raise
+                if legacy_memory_file:
+                    try:
+                        namespaced_memory.import_memory_file(legacy_memory_file)
+                    except Exception as e:  # Left in place, so the next start retries.
+                        logger.error(f"MemoryRegistry: Could not import '{legacy_memory_file}' into '{directory}': {e}")
+                self._namespaced[key] = namespaced_memory
+                self._namespaced_refs[key] = 0
+            self._namespaced_refs[key] += 1
+            return self._namespaced[key]
+
+
+    def release_namespaced_memory(self, namespaced_memory: NamespacedMemory):
+        """Drops one reference; the last release closes every shard and releases the embedding model."""
+        key = os.path.abspath(namespaced_memory.directory)
+        with self._lock:
+            if self._namespaced.get(key) is not namespaced_memory:
+                logger.warning(f"MemoryRegistry: NamespacedMemory for '{namespaced_memory.directory}' was not acquired from this registry.")
+                return
+            self._namespaced_refs[key] -= 1
+            if self._namespaced_refs[key] > 0:
+                return
+            del self._namespaced[key]
+            del self._namespaced_refs[key]
+            namespaced_memory.close()
+            self._release_embeddings(namespaced_memory.embedding_model_name)
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Current reference counts, e.g. for the system administration UI."""
+        with self._lock:
+            return {'embedding_models': dict(self._embedding_refs), 'memory_managers': dict(self._manager_refs), 'namespaced_memories': dict(self._namespaced_refs), 'embedding_cache': self.embedding_cache.stats()}
+
+
+
+memory_registry = MemoryRegistry()  # Shared instance used by agents and the API.
@@ -0,0 +1,506 @@
+import json
+import logging
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared (multi-process) stores are not supported.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# On-disk layout of a memory store directory:
+#
+#   CURRENT                 - name of the live generation (replaced atomically on compaction).
+#   embeddings.<gen>.bin    - fixed 64 byte header followed by fixed-width float32 (or int8) embedding records.
+#   records.<gen>.log       - append-only log of [length, crc32, json payload] records (id, text, metadata, timestamp).
+#   tombstones.<gen>.log    - append-only log, in the same format, of {"rows": [...]} records marking rows as deleted.
+#   LOCK, MANIFEST          - shared stores only: the writer lock, and the version, generation and committed sizes
+#                             of the files (replaced atomically after every write).
+#
+# A memory is committed once its log record is fully written; the embedding row is always written first,
+# so after a crash both files are simply truncated back to the last record whose checksum is valid. Deleted rows stay
+# in place (row numbers are index ids) until compaction rewrites the store without them.
+#
+# A shared store may be opened by several processes at once (e.g. API workers). Each write happens under an exclusive
+# flock on LOCK and ends by publishing a new MANIFEST version. Readers take no lock: refresh() reads the manifest and
+# loads only the committed bytes it declares. Rows below the committed count never change, so a reader's memory map
+# stays a consistent snapshot until it refreshes. Compaction writes a new generation, and readers still mapping the
+# old files keep working until they notice the generation change and reopen.
+
+MAGIC = b"TGMEMEMB"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64  # Keeps the embedding rows aligned for memory mapping.
+_HEADER = struct.Struct("<8sIIII")  # magic, format version, embedding dimension, metric code, quantization code
+METRICS = ("l2", "cosine")  # Index in this tuple is the metric code; stores written before it existed read as "l2".
+QUANTIZATIONS = ("float32", "int8")  # Likewise for the quantization code; older stores read as "float32".
+INT8_SCALE = 127.0  # int8 stores hold round(x * 127) of unit-normalized embeddings, whose components lie in [-1, 1].
+_RECORD_HEADER = struct.Struct("<II")  # payload length, crc32 of payload
+
+
+class MemoryStoreError(Exception):
+    """Raised when a memory store on disk cannot be opened or is incompatible."""
+
+
+class MemoryStore:
+    def __init__(self, path: str, embedding_dim: int, fsync: bool = True, compact_ratio: float = 0.5, metric: str = "l2", quantization: str = "float32", shared: bool = False):
+        self.path = path  # Directory holding the store files.
+        self.embedding_dim = embedding_dim
+        self.metric = metric  # "cosine" stores hold unit-normalized embeddings. An existing store's header wins on open().
+        self.fsync = fsync  # fsync both files after each commit (set False for faster, less durable writes).
+        self.compact_ratio = compact_ratio  # Fraction of dead records that triggers compaction.
+        self.quantization = quantization  # "int8" stores 1 byte per dimension instead of 4 (cosine stores only). The header wins on open().
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}'. Expected one of {QUANTIZATIONS}.")
+        if quantization == "int8" and metric != "cosine":
+            raise ValueError("int8 quantization needs unit-normalized embeddings, i.e. metric='cosine'.")
+        self.shared = shared  # Opened by several processes: writes must hold locked(), refresh() loads the others' writes.
+        if shared and fcntl is None:
+            raise ValueError("Shared memory stores need POSIX file locking (fcntl).")
+        self.version = 0  # Manifest version loaded by this process (shared stores).
+        self.generation = 0
+        self.count = 0  # Number of committed records.
+        self.dead_records = 0  # Deleted rows still taking up space (included in count), reclaimed by compact().
+        self.deleted_rows = set()  # Rows marked deleted by a tombstone.
+        self._embedding_file = None
+        self._log_file = None
+        self._tombstone_file = None
+        self._log_bytes = 0  # Committed lengths of the records and tombstones logs.
+        self._tombstone_bytes = 0
+        self._lock_file = None
+        self._lock_depth = 0
+        self._matrix = None  # Cached memory map of the embedding rows, remapped when the row count changes.
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Type of the stored embedding components."""
+        return np.dtype(np.int8 if self.quantization == "int8" else np.float32)
+
+
+    @property
+    def row_bytes(self) -> int:
+        return self.embedding_dim * self.dtype.itemsize
+
+
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        """Converts float embeddings to the stored representation. Stored int8 codes are passed through as they are."""
+        embeddings = np.asarray(embeddings)
+        if self.quantization != "int8":
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.dtype == np.int8:
+            return np.ascontiguousarray(embeddings)
+        return np.clip(np.rint(embeddings * INT8_SCALE), -127, 127).astype(np.int8)
+
+
+    def decode(self, embeddings: np.ndarray) -> np.ndarray:
+        """Converts stored rows (e.g. a slice of embeddings()) back to float32 vectors."""
+        if self.quantization != "int8":
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        return np.asarray(embeddings, dtype=np.float32) * np.float32(1.0 / INT8_SCALE)
+
+
+    def _embeddings_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"embeddings.{generation}.bin")
+
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"records.{generation}.log")
+
+
+    def _tombstones_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"tombstones.{generation}.log")
+
+
+    def _current_path(self) -> str:
+        return os.path.join(self.path, "CURRENT")
+
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "MANIFEST")
+
+
+    def open(self) -> List[Dict[str, Any]]:
+        """Opens (or creates) the store, recovers from torn writes and returns the committed records."""
+        os.makedirs(self.path, exist_ok=True)  # Before locked(), whose lock file lives in the store directory.
+        with self.locked():  # Recovery truncates files, which must not race another process's write.
+            records = self._open()
+            if self.shared:
+                self._publish()
+        return records
+
+
+    def _open(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self._current_path(), "r") as f:
+                self.generation = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            self.generation = 0
+
+        embeddings_path = self._embeddings_path(self.generation)
+        log_path = self._log_path(self.generation)
+
+        if not os.path.exists(embeddings_path):
+            with open(embeddings_path, "wb") as f:
+                f.write(self._header())
+        else:
+            self._check_header(embeddings_path)
+        if not os.path.exists(log_path):
+            open(log_path, "wb").close()
+
+        records, valid_bytes = self._scan_log(log_path)
+
+        # Only keep records that also have a complete embedding row.
+        rows_on_disk = (os.path.getsize(embeddings_path) - HEADER_SIZE) // self.row_bytes
+        if rows_on_disk < len(records):
+            logger.warning(f"MemoryStore.open: {len(records) - rows_on_disk} records without embeddings in '{self.path}', discarding them.")
+            valid_bytes = records[rows_on_disk]["_offset"]
+            records = records[:rows_on_disk]
+        for record in records:
+            record.pop("_offset", None)
+
+        self.count = len(records)
+        self._truncate(log_path, valid_bytes)
+        self._log_bytes = valid_bytes
+        self._truncate(embeddings_path, HEADER_SIZE + self.count * self.row_bytes)
+        self._load_tombstones()
+        self._remove_stale_generations()
+
+        self._embedding_file = open(embeddings_path, "r+b")
+        self._log_file = open(log_path, "ab")
+        self._tombstone_file = open(self._tombstones_path(self.generation), "ab")
+        return records
+
+
+    def _load_tombstones(self):
+        tombstones_path = self._tombstones_path(self.generation)
+        if not os.path.exists(tombstones_path):
+            open(tombstones_path, "wb").close()
+        tombstones, valid_bytes = self._scan_log(tombstones_path)
+        self._truncate(tombstones_path, valid_bytes)
+        self._tombstone_bytes = valid_bytes
+        self.deleted_rows = {row for tombstone in tombstones for row in tombstone["rows"] if row < self.count}
+        self.dead_records = len(self.deleted_rows)
+
+
+    def close(self):
+        for f in (self._embedding_file, self._log_file, self._tombstone_file):
+            if f:
+                f.close()
+        self._embedding_file = None
+        self._log_file = None
+        self._tombstone_file = None
+        self._matrix = None
+        if self._lock_file and self._lock_depth == 0:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+    @contextmanager
+    def locked(self):
+        """Holds the exclusive writer lock of a shared store across processes (a no-op for unshared stores).
+
+        Reentrant. It does not serialize threads of one process, which share the lock; MemoryManager does that.
+        """
+        if not self.shared:
+            yield
+            return
+        if self._lock_depth == 0:
+            if self._lock_file is None:
+                self._lock_file = open(os.path.join(self.path, "LOCK"), "a+b")
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+
+    def _read_manifest(self) -> Dict[str, Any] or None:
+        try:
+            with open(self._manifest_path(), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+    def _publish(self):
+        """Publishes the committed state of a shared store as a new manifest version, the commit point for readers."""
+        manifest = self._read_manifest() or {}
+        self.version = max(manifest.get("version", 0), self.version) + 1
+        self._replace_file(self._manifest_path(), json.dumps({"version": self.version, "generation": self.generation, "count": self.count,
+                                                             "log_bytes": self._log_bytes, "tombstone_bytes": self._tombstone_bytes}), self.fsync)
+
+
+    @staticmethod
+    def _replace_file(file_path: str, text: str, fsync: bool = True):
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+
+
+    def _check_writable(self):
+        """A shared store may only be written under locked() and after refresh() has loaded every other writer's commits
+        (row numbers would collide otherwise). A crashed writer's uncommitted tail is cut off before writing after it."""
+        if not self.shared:
+            return
+        if self._lock_depth == 0:
+            raise MemoryStoreError(f"Writes to the shared store '{self.path}' must hold locked().")
+        manifest = self._read_manifest()
+        if manifest is not None and manifest["version"] != self.version:
+            raise MemoryStoreError(f"Shared store '{self.path}' is at version {manifest['version']}, loaded {self.version}; refresh() first.")
+        self._truncate(self._log_path(self.generation), self._log_bytes)
+        self._truncate(self._tombstones_path(self.generation), self._tombstone_bytes)
+
+
+    def refresh(self) -> Tuple[List[Dict[str, Any]], List[int]] or None:
+        """Loads what other processes committed to a shared store since open() or the last refresh().
+
+        Returns (new records, newly deleted rows), both empty if nothing changed (always, for unshared stores), or None
+        if the store was compacted meanwhile: every row number changed, so the caller must close() and open() it again.
+        """
+        if not self.shared:
+            return [], []
+        manifest = self._read_manifest()
+        if manifest is None or manifest["version"] == self.version:
+            return [], []
+        if manifest["generation"] != self.generation:
+            return None
+        try:  # Only the bytes the manifest declares are read: they are complete and never change.
+            records, _ = self._scan_log(self._log_path(self.generation), self._log_bytes, manifest["log_bytes"])
+            tombstones, _ = self._scan_log(self._tombstones_path(self.generation), self._tombstone_bytes, manifest["tombstone_bytes"])
+            self.count = manifest["count"]
+            self._matrix = None
+            self.embeddings()  # Mapped now, while this generation's files surely exist.
+        except FileNotFoundError:  # Compacted, and the old generation removed, after the manifest was read.
+            return None
+        for record in records:
+            record.pop("_offset", None)
+        deleted = sorted({row for tombstone in tombstones for row in tombstone["rows"] if row < self.count} - self.deleted_rows)
+        self.deleted_rows.update(deleted)
+        self.dead_records += len(deleted)
+        self._log_bytes = manifest["log_bytes"]
+        self._tombstone_bytes = manifest["tombstone_bytes"]
+        self.version = manifest["version"]
+        return records, deleted
+
+
+    def _header(self) -> bytes:
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, self.embedding_dim, METRICS.index(self.metric), QUANTIZATIONS.index(self.quantization)).ljust(HEADER_SIZE, b"\0")
+
+
+    def _check_header(self, embeddings_path: str):
+        with open(embeddings_path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:  # Crashed while creating the store; rewrite the header.
+            with open(embeddings_path, "wb") as f:
+                f.write(self._header())
+            return
+        magic, version, dim, metric_code, quantization_code = _HEADER.unpack_from(header)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise MemoryStoreError(f"'{embeddings_path}' is not a memory store (magic={magic!r}, version={version}).")
+        if dim != self.embedding_dim:
+            raise MemoryStoreError(f"'{embeddings_path}' holds {dim}-dim embeddings, expected {self.embedding_dim}.")
+        if metric_code >= len(METRICS):
+            raise MemoryStoreError(f"'{embeddings_path}' uses unknown metric code {metric_code}.")
+        if quantization_code >= len(QUANTIZATIONS):
+            raise MemoryStoreError(f"'{embeddings_path}' uses unknown quantization code {quantization_code}.")
+        self.metric = METRICS[metric_code]
+        self.quantization = QUANTIZATIONS[quantization_code]
+
+
+    @staticmethod
+    def _scan_log(log_path: str, begin: int = 0, end: int = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Reads log records (from byte begin to end) until the first torn or corrupt one. Returns the records and the valid byte length."""
+        records = []
+        offset = 0
+        with open(log_path, "rb") as f:
+            f.seek(begin)
+            data = f.read() if end is None else f.read(end - begin)
+
+        while offset + _RECORD_HEADER.size <= len(data):
+            length, crc = _RECORD_HEADER.unpack_from(data, offset)
+            start = offset + _RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break  # Torn write from a crash; everything after this point is discarded.
+            record = json.loads(payload)
+            record["_offset"] = begin + offset
+            records.append(record)
+            offset = start + length
+
+        if offset < len(data):
+            logger.warning(f"MemoryStore: discarding {len(data) - offset} bytes of incomplete log data in '{log_path}'.")
+        return records, begin + offset
+
+
+    @staticmethod
+    def _truncate(file_path: str, size: int):
+        if os.path.getsize(file_path) != size:
+            with open(file_path, "r+b") as f:
+                f.truncate(size)
+
+
+    def _remove_stale_generations(self):
+        """Removes files left behind by an interrupted or completed compaction."""
+        keep = {os.path.basename(path) for path in (self._embeddings_path(self.generation), self._log_path(self.generation), self._tombstones_path(self.generation))} | {"CURRENT"}
+        for name in os.listdir(self.path):
+            if name not in keep and name.startswith(("embeddings.", "records.", "tombstones.")):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError as e:
+                    logger.warning(f"MemoryStore: could not remove stale file '{name}': {e}")
+
+
+    @staticmethod
+    def _encode_record(record: Dict[str, Any]) -> bytes:
+        payload = json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+        return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+    def append(self, embedding: np.ndarray, record: Dict[str, Any]) -> int:
+        """Appends one embedding and its record. Costs O(1) I/O regardless of store size. Returns the row number."""
+        self._check_writable()
+        row = self.count
+        vector = self.encode(embedding).reshape(-1)
+        if vector.shape[0] != self.embedding_dim:
+            raise ValueError(f"Embedding has dimension {vector.shape[0]}, expected {self.embedding_dim}.")
+
+        # Embedding first, log record last: the log record is the commit point.
+        os.pwrite(self._embedding_file.fileno(), vector.tobytes(), HEADER_SIZE + row * self.row_bytes)
+        if self.fsync:
+            os.fsync(self._embedding_file.fileno())
+
+        self._write_log(self._encode_record(record))
+        self.count += 1
+        self._committed()
+        return row
+
+
+    def append_many(self, embeddings: np.ndarray, records: List[Dict[str, Any]]) -> range:
+        """Appends a batch with one embedding write, one log write and one fsync of each file. Returns the new row numbers."""
+        matrix = self.encode(embeddings).reshape(len(records), -1)
+        if matrix.shape[1] != self.embedding_dim:
+            raise ValueError(f"Embeddings have dimension {matrix.shape[1]}, expected {self.embedding_dim}.")
+        first_row = self.count
+        if not records:
+            return range(first_row, first_row)
+        self._check_writable()
+
+        os.pwrite(self._embedding_file.fileno(), matrix.tobytes(), HEADER_SIZE + first_row * self.row_bytes)
+        if self.fsync:
+            os.fsync(self._embedding_file.fileno())
+
+        # A crash part way through keeps every fully written record before the tear, like single appends.
+        self._write_log(b"".join(self._encode_record(record) for record in records))
+        self.count += len(records)
+        self._committed()
+        return range(first_row, self.count)
+
+
+    def _write_log(self, data: bytes, log_file=None):
+        """Appends to the log (or log_file), rolling back a partial write so later records are never hidden behind garbage."""
+        log_file = log_file or self._log_file
+        log_size = self._log_bytes if log_file is self._log_file else self._tombstone_bytes  # Not tell(): other processes may have appended.
+        try:
+            log_file.write(data)
+            log_file.flush()
+            if self.fsync:
+                os.fsync(log_file.fileno())
+        except Exception:
+            log_file.truncate(log_size)
+            raise
+        if log_file is self._log_file:
+            self._log_bytes += len(data)
+        else:
+            self._tombstone_bytes += len(data)
+
+
+    def _committed(self):
+        if self.shared:
+            self._publish()
+
+
+    def delete(self, rows: List[int]) -> int:
+        """Marks rows as deleted with one tombstone record. The space is reclaimed by compact(). Returns rows newly deleted."""
+        rows = sorted({int(row) for row in rows if 0 <= row < self.count} - self.deleted_rows)
+        if not rows:
+            return 0
+        self._check_writable()
+        self._write_log(self._encode_record({"rows": rows}), self._tombstone_file)
+        self.deleted_rows.update(rows)
+        self.dead_records += len(rows)
+        self._committed()
+        return len(rows)
+
+
+    def embeddings(self) -> np.ndarray:
+        """Returns the committed embeddings as a read-only, memory-mapped (count, dim) matrix of dtype (see decode()).
+
+        Nothing is read up front; pages are loaded on demand and shared by every process mapping the same store.
+        """
+        if self._matrix is None or self._matrix.shape[0] != self.count:
+            if self.count == 0:  # mmap cannot map an empty region.
+                self._matrix = np.empty((0, self.embedding_dim), dtype=self.dtype)
+            else:
+                self._matrix = np.memmap(self._embeddings_path(self.generation), dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(self.count, self.embedding_dim))
+        return self._matrix
+
+
+    def needs_compaction(self) -> bool:
+        return self.count > 0 and self.dead_records / self.count >= self.compact_ratio
+
+
+    def compact(self, records: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Rewrites the store as a new generation containing only the given live records, then switches to it atomically."""
+        self._check_writable()
+        new_generation = self.generation + 1
+        embeddings_path = self._embeddings_path(new_generation)
+        log_path = self._log_path(new_generation)
+
+        with open(embeddings_path, "wb") as f:
+            f.write(self._header())
+            f.write(self.encode(embeddings).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(log_path, "wb") as f:
+            for record in records:
+                f.write(self._encode_record(record))
+            f.flush()
+            os.fsync(f.fileno())
+        open(self._tombstones_path(new_generation), "wb").close()
+
+        # Switching CURRENT is the atomic commit of the compaction; a crash before it leaves the old generation live.
+        self._replace_file(self._current_path(), str(new_generation))
+
+        self.close()
+        self.generation = new_generation
+        self.count = len(records)
+        self.dead_records = 0
+        self.deleted_rows = set()
+        self._log_bytes = os.path.getsize(log_path)
+        self._tombstone_bytes = 0
+        self._remove_stale_generations()
+        self._embedding_file = open(embeddings_path, "r+b")
+        self._log_file = open(log_path, "ab")
+        self._tombstone_file = open(self._tombstones_path(new_generation), "ab")
+        self._committed()
+        logger.info(f"MemoryStore.compact: Compacted '{self.path}' to generation {new_generation} with {self.count} records.")
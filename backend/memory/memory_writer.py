@@ -0,0 +1,81 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class WriteBehindWriter:
+    """Write-behind persistence for MemoryManager.add_memory with group commit.
+
+    add_memory only puts the memory on a bounded queue and returns; a worker thread takes up to batch_size queued
+    memories, or whatever arrived within flush_interval seconds of the first one, embeds them in one batch and commits
+    them with one store write and one fsync. A full queue blocks add_memory (backpressure) instead of growing without
+    bound. After a crash the store recovers to the last committed batch; memories still queued are lost, so callers
+    needing a durability point call flush(). Queued memories become searchable once their batch is committed.
+    """
+
+    def __init__(self, commit, max_queue: int = 10_000, batch_size: int = 256, flush_interval: float = 0.05):
+        self.commit = commit  # callable(records) -> int or None, persists and indexes a batch (MemoryManager._commit_records).
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self.committed = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+
+
+    def submit(self, record: Dict[str, Any]):
+        """Queues one record (id, text, metadata, timestamp), blocking while the queue is full."""
+        if self._stop.is_set():
+            raise RuntimeError("WriteBehindWriter: Writer is stopped.")
+        self.queue.put(record)
+
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                committed = self.commit(batch) or 0  # None: the batch failed.
+                self.committed += committed
+                self.failed += len(batch) - committed
+            except Exception as e:
+                logger.error(f"WriteBehindWriter: Error committing {len(batch)} memories: {e}")
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+    def flush(self):
+        """Blocks until every memory queued so far is committed (or has failed)."""
+        self.queue.join()
+
+
+    def stop(self):
+        """Commits what is queued, then stops the worker."""
+        self._stop.set()
+        self._thread.join()
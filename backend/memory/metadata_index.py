@@ -0,0 +1,146 @@
+import bisect
+import json
+import logging
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Union
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+RANGE_OPERATORS = {
+    '$gt': lambda value, bound: value > bound,
+    '$gte': lambda value, bound: value >= bound,
+    '$lt': lambda value, bound: value < bound,
+    '$lte': lambda value, bound: value <= bound,
+}
+
+
+
+class MetadataIndex:
+    """Inverted indexes over memory metadata and timestamps, mapping predicates to sorted arrays of store rows.
+
+    Each metadata field maps value -> rows holding it (list values are indexed per element, so {"tags": "x"} matches
+    entries whose tags contain "x"). Timestamps are kept in row order with a flag telling whether they are still
+    sorted, in which case time windows are two binary searches.
+
+    Filters look like {"agent_id": 7, "priority": {"$gte": 3}, "task_id": {"$in": [1, 2]}}; all predicates must hold.
+    Values that are not hashable (e.g. nested dicts) are not indexed and cannot be filtered on.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Dict[Any, array]] = {}
+        self.timestamps = array('d')
+        self.timestamps_sorted = True
+
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+    def add(self, row: int, metadata: Dict[str, Any], timestamp: float):
+        """Indexes one entry. Rows must be added in increasing order (they are store row numbers)."""
+        for field, value in (metadata or {}).items():
+            for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+                try:
+                    rows = self.fields.setdefault(field, {}).setdefault(item, array('q'))
+                except TypeError:  # Unhashable value; not filterable.
+                    continue
+                if not rows or rows[-1] != row:  # A list may repeat a value; keep each row once.
+                    rows.append(row)
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self.timestamps_sorted = False
+        self.timestamps.append(timestamp)
+
+
+    @classmethod
+    def build(cls, columns: "MemoryColumns") -> "MetadataIndex":
+        """Builds an index over a MemoryColumns, parsing each distinct metadata value once."""
+        index = cls()
+        metadata_values = [json.loads(value) for value in columns.metadata_values]
+        for row in range(len(columns)):
+            if not columns.is_live(row):  # Deleted row awaiting compaction: keeps its row number, callers exclude it from results.
+                index.add(row, None, index.timestamps[-1] if index.timestamps else 0.0)
+            else:
+                index.add(row, metadata_values[columns.metadata_ids[row]], columns.timestamp_seconds(row))
+        return index
+
+
+    def select(self, filters: Dict[str, Any] = None, since: Union[datetime, float] = None, until: Union[datetime, float] = None) -> np.ndarray:
+        """Returns the sorted rows matching all filters and since <= timestamp < until."""
+        rows = self._time_window(since, until)
+        for field, condition in (filters or {}).items():
+            matched = self._match_field(field, condition)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+            if rows.size == 0:
+                break
+        return rows if rows is not None else np.arange(len(self), dtype=np.int64)
+
+
+    def _match_field(self, field: str, condition: Any) -> np.ndarray:
+        values = self.fields.get(field, {})
+        if isinstance(condition, dict):
+            if '$in' in condition:
+                wanted = [values[v] for v in condition['$in'] if self._hashable(v) and v in values]
+            else:
+                unknown = set(condition) - set(RANGE_OPERATORS)
+                if unknown:
+                    raise ValueError(f"MetadataIndex: Unsupported filter operators {unknown} for field '{field}'.")
+                wanted = [rows for value, rows in values.items() if all(self._compare(value, op, bound) for op, bound in condition.items())]
+        else:
+            wanted = [values[condition]] if self._hashable(condition) and condition in values else []
+
+        if not wanted:
+            return np.empty(0, dtype=np.int64)
+        # Copies rather than views: an exported buffer would stop the arrays from growing on the next add().
+        if len(wanted) == 1:
+            return np.array(wanted[0], dtype=np.int64)
+        return np.unique(np.concatenate([np.array(rows, dtype=np.int64) for rows in wanted]))  # A row may hold several list values.
+
+
+    @staticmethod
+    def _compare(value: Any, op: str, bound: Any) -> bool:
+        try:
+            return RANGE_OPERATORS[op](value, bound)
+        except TypeError:  # e.g. comparing a string value with a numeric bound
+            return False
+
+
+    @staticmethod
+    def _hashable(value: Any) -> bool:
+        try:
+            hash(value)
+            return True
+        except TypeError:
+            return False
+
+
+    def count_before(self, until: Union[datetime, float]) -> int or None:
+        """How many rows have a timestamp < until, which are then rows 0 to that count - 1, if timestamps are in row
+        order (a bisect, no scan); None otherwise (see select)."""
+        if not self.timestamps_sorted:
+            return None
+        return bisect.bisect_left(self.timestamps, until.timestamp() if isinstance(until, datetime) else until)
+
+
+    def _time_window(self, since, until) -> np.ndarray or None:
+        if since is None and until is None:
+            return None
+        low = since.timestamp() if isinstance(since, datetime) else since
+        high = until.timestamp() if isinstance(until, datetime) else until
+
+        if self.timestamps_sorted:  # Usual case: memories are appended in time order.
+            start = bisect.bisect_left(self.timestamps, low) if low is not None else 0
+            end = bisect.bisect_left(self.timestamps, high) if high is not None else len(self.timestamps)
+            return np.arange(start, max(start, end), dtype=np.int64)
+
+        timestamps = np.array(self.timestamps, dtype=np.float64)
+        mask = np.ones(len(timestamps), dtype=bool)
+        if low is not None:
+            mask &= timestamps >= low
+        if high is not None:
+            mask &= timestamps < high
+        return np.flatnonzero(mask).astype(np.int64)
@@ -0,0 +1,439 @@
+import glob
+import logging
+import math
+import os
+import threading
+import time
+from typing import List, Dict, Any, Tuple
+
+import faiss  # For efficient similarity search (install with: pip install faiss-cpu)
+import numpy as np
+
+from memory_store import INT8_SCALE
+
+
+logger = logging.getLogger(__name__)
+
+
+def faiss_metric(metric: str) -> int:
+    """Maps a memory store metric to the FAISS metric: cosine is inner product over unit-normalized vectors."""
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def worst_distance(metric: str) -> float:
+    """Distance value FAISS uses for missing results: larger is worse for L2, smaller is worse for inner product."""
+    return -np.inf if metric == "cosine" else np.inf
+
+
+def merge_results(distances: List[np.ndarray], ids: List[np.ndarray], k: int, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges per-part (distances, ids) search results column-wise into the overall top k per query."""
+    distances = np.concatenate(distances, axis=1)
+    ids = np.concatenate(ids, axis=1)
+    order = np.argsort(-distances if metric == "cosine" else distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+
+class FlatIndex:
+    """Exact (brute-force) search straight over the memory store's memory-mapped embedding matrix.
+
+    Unlike faiss.IndexFlatL2 nothing is copied into the index: the store's mmap is handed to faiss.knn at query time,
+    so startup does no work and the pages are shared by every process using the same store.
+    """
+
+    def __init__(self, store, metric: str = "l2"):
+        self.store = store
+        self.metric = metric
+
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.store)
+
+
+    def add(self, embeddings: np.ndarray):  # Rows are already appended to the store, which is what we search.
+        pass
+
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (distances, row ids) shaped (len(queries), k), padded with -1 ids like FAISS does."""
+        if self.store.quantization != "float32":  # Decoded a chunk at a time; a full float copy is what quantizing avoids.
+            return self.search_subset(queries, np.arange(len(self.store), dtype=np.int64), k)
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        matrix = self.store.embeddings()
+        distances = np.full((queries.shape[0], k), worst_distance(self.metric), dtype=np.float32)
+        ids = np.full((queries.shape[0], k), -1, dtype=np.int64)
+
+        n = min(k, matrix.shape[0])
+        if n > 0:
+            distances[:, :n], ids[:, :n] = faiss.knn(queries, matrix, n, metric=faiss_metric(self.metric))
+        return distances, ids
+
+
+    def search_subset(self, queries: np.ndarray, rows: np.ndarray, k: int, chunk_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search restricted to the given store rows, gathering at most chunk_rows embeddings at a time."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        matrix = self.store.embeddings()
+        all_distances = [np.full((queries.shape[0], k), worst_distance(self.metric), dtype=np.float32)]
+        all_ids = [np.full((queries.shape[0], k), -1, dtype=np.int64)]
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start:start + chunk_rows]
+            distances, positions = faiss.knn(queries, self.store.decode(matrix[chunk]), min(k, len(chunk)), metric=faiss_metric(self.metric))
+            all_distances.append(distances)
+            all_ids.append(np.where(positions >= 0, chunk[np.maximum(positions, 0)], -1))
+        return merge_results(all_distances, all_ids, k, self.metric)
+
+
+    def search_excluding(self, queries: np.ndarray, exclude: np.ndarray, k: int, chunk_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search over every store row except the sorted rows in exclude (e.g. deleted ones), which are masked out
+        of each chunk's distances, so the cost does not grow with how many rows are excluded."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        matrix = self.store.embeddings()
+        worst = worst_distance(self.metric)
+        all_distances = [np.full((queries.shape[0], k), worst, dtype=np.float32)]
+        all_ids = [np.full((queries.shape[0], k), -1, dtype=np.int64)]
+        for start in range(0, matrix.shape[0], chunk_rows):
+            chunk = self.store.decode(matrix[start:start + chunk_rows])
+            distances = queries @ chunk.T
+            if self.metric != "cosine":  # Squared L2, as faiss.knn reports it.
+                distances = (queries ** 2).sum(axis=1, keepdims=True) + (chunk ** 2).sum(axis=1) - 2 * distances
+            first, last = np.searchsorted(exclude, [start, start + len(chunk)])
+            distances[:, exclude[first:last] - start] = worst
+            n = min(k, len(chunk))
+            positions = np.argpartition(-distances if self.metric == "cosine" else distances, n - 1, axis=1)[:, :n]
+            distances = np.take_along_axis(distances, positions, axis=1)
+            all_distances.append(distances)
+            all_ids.append(np.where(distances == worst, -1, positions + start))
+        return merge_results(all_distances, all_ids, k, self.metric)
+
+
+
+INDEX_TIERS = ("flat", "sq8", "pq", "ivf_flat", "ivf_pq", "hnsw")  # Ordered roughly from most exact/slowest to fastest at scale.
+MAX_TRAINING_ROWS = 100_000  # Training IVF/PQ on a sample is as good as on everything, and much faster.
+
+
+def index_factory_string(tier: str, num_vectors: int, embedding_dim: int) -> str:
+    """Builds the faiss.index_factory description for a trained tier sized for num_vectors.
+
+    sq8 (1 byte per dimension) and pq (1 byte per 8 dimensions) are exhaustive scans over compressed codes: the index
+    holds only the codes, so RAM stays at a fraction of the float embeddings.
+    """
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))  # FAISS wants ~39 training points per centroid.
+    pq_m = embedding_dim // 8 if embedding_dim % 8 == 0 else embedding_dim  # 8 dims per sub-quantizer, 1 byte each.
+    if tier == "sq8":
+        return "SQ8"
+    if tier == "pq":
+        return f"PQ{pq_m}"
+    if tier == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if tier == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}"
+    if tier == "hnsw":
+        return "HNSW32"
+    raise ValueError(f"Unknown index tier '{tier}'. Expected one of {INDEX_TIERS}.")
+
+
+
+class TrainedIndex:
+    """An approximate FAISS index (IVF-Flat, IVF-PQ or HNSW) whose ids are the memory store's row numbers."""
+
+    def __init__(self, tier: str, index, nprobe: int = 16, ef_search: int = 64):
+        self.tier = tier
+        self.index = index
+        self.nprobe = nprobe  # IVF lists visited per query; higher means better recall and slower search.
+        self.ef_search = ef_search  # HNSW candidate list size per query; same trade-off as nprobe.
+        self._exclusion = None  # (exclude array, its int64 copy, IDSelectorBatch, IDSelectorNot) of the last exclusion search.
+        self._apply_search_params()
+
+
+    @classmethod
+    def train(cls, tier: str, embeddings: np.ndarray, nprobe: int = 16, ef_search: int = 64, metric: str = "l2", decode=None, chunk_rows: int = 65536) -> "TrainedIndex":
+        """Trains a new index of the given tier on embeddings and adds all of them (row i gets id i).
+
+        decode converts stored rows to float32 (see MemoryStore.decode); rows are decoded and added chunk_rows at a time,
+        so a memory-mapped store is never copied into RAM as a whole.
+        """
+        decode = decode or (lambda rows: np.ascontiguousarray(rows, dtype=np.float32))
+        num_vectors, embedding_dim = embeddings.shape
+        index = faiss.index_factory(embedding_dim, index_factory_string(tier, num_vectors, embedding_dim), faiss_metric(metric))
+        if not index.is_trained:
+            if num_vectors > MAX_TRAINING_ROWS:
+                rows = np.sort(np.random.default_rng(0).choice(num_vectors, MAX_TRAINING_ROWS, replace=False))
+                index.train(decode(embeddings[rows]))
+            else:
+                index.train(decode(embeddings))
+        for start in range(0, num_vectors, chunk_rows):
+            index.add(decode(embeddings[start:start + chunk_rows]))
+        return cls(tier, index, nprobe, ef_search)
+
+
+    @classmethod
+    def load(cls, path: str, tier: str, nprobe: int = 16, ef_search: int = 64) -> "TrainedIndex":
+        return cls(tier, faiss.read_index(path), nprobe, ef_search)
+
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Processes sharing a store may save at once.
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, path)  # Never leave a half-written index behind.
+
+
+    def _apply_search_params(self):
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = self.ef_search
+
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+
+    def bytes_per_vector(self) -> float:
+        """Serialized index size per vector, including centroids and codebooks."""
+        return faiss.serialize_index(self.index).size / max(1, self.ntotal)
+
+
+    def add(self, embeddings: np.ndarray):
+        self.index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+
+    def _exclusion_selector(self, exclude: np.ndarray) -> "faiss.IDSelector":
+        """Selector of every row but exclude's, reused while searches pass the same exclude array (MemoryManager keeps
+        one until rows are deleted or expire), as building its hash set costs time proportional to len(exclude)."""
+        if self._exclusion is None or self._exclusion[0] is not exclude:
+            rows = np.ascontiguousarray(exclude, dtype=np.int64)
+            excluded = faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(rows))
+            self._exclusion = (exclude, rows, excluded, faiss.IDSelectorNot(excluded))  # IDSelectorNot does not own excluded.
+        return self._exclusion[3]
+
+
+    def search(self, queries: np.ndarray, k: int, rows: np.ndarray = None, exclude: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Searches all rows, only the given rows, or all but the excluded rows, the latter two via a FAISS ID selector."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if rows is None and (exclude is None or len(exclude) == 0):
+            return self.index.search(queries, k)
+
+        if rows is not None:
+            selector = faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(np.ascontiguousarray(rows, dtype=np.int64)))
+        else:
+            selector = self._exclusion_selector(exclude)
+        if hasattr(self.index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.ef_search, k))
+        elif faiss.try_extract_index_ivf(self.index) is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return self.index.search(queries, k, params=params)
+
+
+
+class AdaptiveIndex:
+    """Serves exact flat search until the store reaches promote_threshold, then promotes to a trained tier.
+
+    Training and retraining (once the store has grown by retrain_factor since the last training, so the number of
+    IVF lists keeps up with the data) run on a background thread; searches use the previous index until the new
+    one has caught up with the rows appended meanwhile and is swapped in. Trained indexes are persisted in the
+    store directory so restarts only add the rows written since the last save.
+
+    A persisted index is named after the store generation it indexes: compaction renumbers the rows, so an index saved
+    for an earlier generation (e.g. by another process sharing the store, whose training outlived a compaction) is
+    never loaded. Saves replace the file atomically, so concurrent savers cannot publish a torn index.
+    """
+
+    def __init__(self, store, tier: str = "flat", promote_threshold: int = 50_000, retrain_factor: float = 4.0, nprobe: int = 16, ef_search: int = 64, background: bool = True, metric: str = "l2", exact_subset_size: int = 20_000):
+        if tier not in INDEX_TIERS:
+            raise ValueError(f"Unknown index tier '{tier}'. Expected one of {INDEX_TIERS}.")
+        self.store = store
+        self.tier = tier
+        self.promote_threshold = promote_threshold
+        self.retrain_factor = retrain_factor
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.background = background  # Train on a worker thread instead of blocking the caller.
+        self.metric = metric
+        self.exact_subset_size = exact_subset_size  # Filtered searches over at most this many rows are exact scans of just those rows.
+        self.flat = FlatIndex(store, metric)
+        self.trained = None
+        self.trained_size = 0  # Store size the trained index was trained on.
+        self._lock = threading.RLock()
+        self._training_thread = None
+
+        self._load_persisted()
+        self._maybe_train()
+
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.store.path, f"index.{self.tier}.{self.metric}.{self.store.generation}.faiss")
+
+
+    def _remove_stale_files(self):
+        """Deletes indexes persisted for other generations of the store."""
+        for path in glob.glob(os.path.join(self.store.path, f"index.{self.tier}.{self.metric}.*.faiss")):
+            if path != self.index_path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:  # Removed by another process sharing the store.
+                    pass
+
+
+    @property
+    def active_tier(self) -> str:
+        return self.trained.tier if self.trained is not None else "flat"
+
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.store)
+
+
+    def _load_persisted(self):
+        if self.tier == "flat":
+            return
+        self._remove_stale_files()
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            trained = TrainedIndex.load(self.index_path, self.tier, self.nprobe, self.ef_search)
+            if trained.ntotal > len(self.store):  # Written for rows that no longer exist (e.g. before a compaction).
+                logger.warning(f"AdaptiveIndex: Discarding stale persisted index '{self.index_path}'.")
+                return
+            self._catch_up(trained)
+            self.trained = trained
+            self.trained_size = trained.ntotal
+        except Exception as e:
+            logger.error(f"AdaptiveIndex: Could not load persisted index '{self.index_path}': {e}")
+
+
+    def _catch_up(self, trained: TrainedIndex):
+        """Adds store rows appended after the trained index was built or saved."""
+        if trained.ntotal < len(self.store):
+            trained.add(self.store.decode(self.store.embeddings()[trained.ntotal:len(self.store)]))
+
+
+    def _maybe_train(self):
+        size = len(self.store)
+        if self.tier == "flat" or size < self.promote_threshold:
+            return
+        if self.trained is not None and size < self.trained_size * self.retrain_factor:
+            return
+        if self._training_thread is not None and self._training_thread.is_alive():
+            return
+
+        if self.background:
+            self._training_thread = threading.Thread(target=self._train, name="memory-index-training", daemon=True)
+            self._training_thread.start()
+        else:
+            self._train()
+
+
+    def _train(self):
+        try:
+            size = len(self.store)
+            index_path = self.index_path  # Of the generation being trained on.
+            start_time = time.time()
+            trained = TrainedIndex.train(self.tier, self.store.embeddings()[:size], self.nprobe, self.ef_search, self.metric, decode=self.store.decode)
+            try:  # Before publishing it: once published, add() mutates it under the lock, and FAISS indexes are not thread-safe.
+                trained.save(index_path)  # Rows appended meanwhile are caught up when loaded.
+            except Exception as e:
+                logger.error(f"AdaptiveIndex: Could not persist '{self.tier}' index to '{index_path}': {e}")
+            with self._lock:
+                self._catch_up(trained)
+                self.trained = trained
+                self.trained_size = size
+            logger.info(f"AdaptiveIndex: Trained '{self.tier}' index on {size} memories in {time.time() - start_time:.1f}s.")
+        except Exception as e:
+            logger.error(f"AdaptiveIndex: Error training '{self.tier}' index: {e}")
+
+
+    def wait_for_training(self, timeout: float = None):
+        """Blocks until a background (re)training, if any, has finished."""
+        if self._training_thread is not None:
+            self._training_thread.join(timeout)
+
+
+    def add(self, embeddings: np.ndarray):  # Called after the rows were appended to the store.
+        with self._lock:
+            if self.trained is not None:
+                self._catch_up(self.trained)
+        self._maybe_train()
+
+
+    def search(self, queries: np.ndarray, k: int, rows: np.ndarray = None, exclude: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Searches everything, or only the given store rows (e.g. from a MetadataIndex filter), skipping the sorted rows
+        in exclude (e.g. deleted or expired ones) when searching everything.
+
+        Small row sets are scanned exactly, which is both faster and more accurate than filtering an approximate index;
+        large ones, and exclusions, are passed to the trained index as an ID selector.
+        """
+        if rows is not None and (self.trained is None or len(rows) <= self.exact_subset_size):
+            return self.flat.search_subset(queries, rows, k)
+        with self._lock:
+            if self.trained is not None:
+                return self.trained.search(queries, k, rows, exclude)
+        if exclude is not None and len(exclude):
+            return self.flat.search_excluding(queries, exclude, k)
+        return self.flat.search(queries, k)
+
+
+    def reset(self):
+        """Drops the trained index after the store's rows were renumbered (compaction) and retrains if needed."""
+        self.wait_for_training()
+        with self._lock:
+            self.trained = None
+            self.trained_size = 0
+            self._remove_stale_files()
+        self._maybe_train()
+
+
+
+BENCHMARK_TIERS = INDEX_TIERS + ("flat_int8",)  # flat_int8: exact search over an int8-quantized store (cosine only).
+
+
+def benchmark_index_tiers(embeddings: np.ndarray, queries: np.ndarray, top_k: int = 10, tiers=BENCHMARK_TIERS, nprobe: int = 16, ef_search: int = 64, metric: str = "l2") -> List[Dict[str, Any]]:
+    """Reports build time, mean query latency, recall@top_k (against exact float search) and bytes per stored vector for each index tier."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, ground_truth = faiss.knn(queries, embeddings, min(top_k, embeddings.shape[0]), metric=faiss_metric(metric))
+
+    report = []
+    for tier in tiers:
+        try:
+            start_time = time.perf_counter()
+            if tier in ("flat", "flat_int8"):
+                if tier == "flat_int8" and metric != "cosine":
+                    continue  # int8 storage is only offered for unit-normalized embeddings.
+                index = faiss.IndexFlatIP(embeddings.shape[1]) if metric == "cosine" else faiss.IndexFlatL2(embeddings.shape[1])
+                if tier == "flat_int8":  # Same rounding as MemoryStore.encode/decode.
+                    index.add(np.clip(np.rint(embeddings * INT8_SCALE), -127, 127).astype(np.float32) / INT8_SCALE)
+                    bytes_per_vector = embeddings.shape[1]
+                else:
+                    index.add(embeddings)
+                    bytes_per_vector = embeddings.shape[1] * 4
+                search = index.search
+            else:
+                trained = TrainedIndex.train(tier, embeddings, nprobe, ef_search, metric)
+                search = trained.search
+                bytes_per_vector = trained.bytes_per_vector()
+            build_seconds = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            for query in queries:  # One query at a time, like MemoryManager.search.
+                search(query.reshape(1, -1), top_k)
+            latency_ms = (time.perf_counter() - start_time) * 1000 / max(1, len(queries))
+
+            _, ids = search(queries, top_k)
+            hits = sum(len(set(found[found >= 0]) & set(expected)) for found, expected in zip(ids, ground_truth))
+            report.append({
+                'tier': tier,
+                'build_seconds': build_seconds,
+                'latency_ms': latency_ms,
+                'recall_at_k': hits / ground_truth.size if ground_truth.size else 1.0,
+                'bytes_per_vector': bytes_per_vector
+            })
+        except Exception as e:
+            logger.error(f"benchmark_index_tiers: Error benchmarking '{tier}': {e}")
+    return report
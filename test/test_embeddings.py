@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embeddings import Embeddings, benchmark_backends
+
+
+class CountingModel:
+    """Stand-in for a SentenceTransformer that records which texts it was asked to encode."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()  # Create temporary directory for testing
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)  # Clean up temporary directory after tests
+
+    def test_repeated_texts_are_not_encoded_again(self):
+        model = CountingModel()
+        embeddings = Embeddings("fake", model=model)
+        embeddings.generate("claim")
+        result = embeddings.generate(["claim", "other claim"])
+
+        self.assertEqual(model.encoded, ["claim", "other claim"])  # "claim" was only encoded once.
+        np.testing.assert_array_equal(result[0], [5.0, 1.0])
+        self.assertEqual(embeddings.cache.stats()["hits"], 1)
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_entries=2)
+        for text in ("a", "b", "c"):
+            cache.put("model", text, np.zeros(2))
+        self.assertIsNone(cache.get("model", "a"))
+        self.assertIsNotNone(cache.get("model", "c"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disk_cache_survives_restart(self):
+        db_path = os.path.join(self.temp_dir, "embeddings.db")
+        cache = EmbeddingCache(db_path=db_path)
+        cache.put("model", "text", np.ones(3))
+        cache.close()
+
+        reopened = EmbeddingCache(db_path=db_path)
+        np.testing.assert_array_equal(reopened.get("model", "text"), np.ones(3))
+        self.assertIsNone(reopened.get("other model", "text"))  # Keys include the model name.
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_backends_are_cached_separately(self):
+        cache = EmbeddingCache()
+        Embeddings("model", model=CountingModel(), cache=cache).generate("text")
+        onnx_model = CountingModel()
+        onnx = Embeddings("model", model=onnx_model, cache=cache, backend="onnx-int8")
+        onnx.generate("text")
+        self.assertEqual(onnx_model.encoded, ["text"])  # Not served from the torch entry.
+        self.assertEqual(onnx.onnx_file, "onnx/model_qint8_avx512_vnni.onnx")
+        self.assertRaises(ValueError, Embeddings, "model", model=onnx_model, backend="tensorrt")
+
+
+class TestSimilarity(unittest.TestCase):
+    def test_matrix_similarities_and_top_k(self):
+        rng = np.random.default_rng(0)
+        candidates = rng.standard_normal((1000, 8)).astype(np.float32)
+        queries = rng.standard_normal((3, 8)).astype(np.float32)
+        expected = Embeddings.normalize(queries) @ Embeddings.normalize(candidates).T
+
+        np.testing.assert_allclose(Embeddings.similarities(queries, candidates, chunk_rows=64), expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(Embeddings.similarities(queries[0], candidates), expected[0], rtol=1e-5, atol=1e-6)
+        self.assertAlmostEqual(float(Embeddings.similarities(queries[0], candidates[:1])[0]), Embeddings("fake", model=CountingModel()).similarity(queries[0], candidates[0]), places=5)
+
+        scores, indices = Embeddings.top_k(queries, candidates, 5, chunk_rows=64)  # Many chunks, merged.
+        np.testing.assert_array_equal(indices, np.argsort(-expected, axis=1)[:, :5])
+        np.testing.assert_allclose(scores, np.sort(expected, axis=1)[:, ::-1][:, :5], rtol=1e-5, atol=1e-6)
+        scores, indices = Embeddings.top_k(queries[0], candidates[:3], 10)
+        self.assertEqual((scores.shape, indices.shape), ((3,), (3,)))
+
+
+class TestBenchmarkBackends(unittest.TestCase):
+    def test_no_agreement_is_reported_without_torch(self):
+        def load_model(embeddings, model_name):
+            if embeddings.backend == "torch":
+                return None  # As if torch failed to load.
+            model = CountingModel()
+            model.backend = "onnx"
+            return model
+        with mock.patch.object(Embeddings, "load_model", load_model), self.assertLogs("embeddings", "WARNING"):
+            report = benchmark_backends("fake", ["a", "bb"], backends=("torch", "onnx"))
+        self.assertEqual([(row["backend"], row["mean_cosine"], row["min_cosine"]) for row in report], [("onnx", None, None)])  # Not measured against onnx itself.
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import shutil
+import tempfile
+import unittest
+
+from embeddings import Embeddings
+from memory_namespaces import SHARED_NAMESPACE, NamespacedMemory
+from test_memory_manager import FakeModel
+
+try:
+    from fact_checker_agent import FactCheckerAgent
+except ImportError:  # Needs the agents' LLM dependencies (llama_cpp, transformers).
+    FactCheckerAgent = None
+
+
+@unittest.skipIf(FactCheckerAgent is None, "agent dependencies are not installed")
+class TestFactCheckerAgent(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.model = FakeModel()
+        self.memory = NamespacedMemory(self.temp_dir, embedding_dim=self.model.dim, embeddings=Embeddings("fake", model=self.model))
+
+    def tearDown(self):
+        self.memory.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_verify_claims_finds_the_apis_memories(self):
+        self.memory.namespace(SHARED_NAMESPACE).add_memory("The Eiffel Tower is in Paris")  # Written through the API.
+        agent = FactCheckerAgent.__new__(FactCheckerAgent)  # Without loading models or tools.
+        agent.namespaced_memory = self.memory
+        agent.memory_namespaces = ["agent/4", SHARED_NAMESPACE]
+        agent.requires_tools = lambda claim: False
+
+        verification = agent.verify_claims(["The Eiffel Tower is in Paris"])[0]
+        self.assertTrue(verification["verified"])
+        self.assertIn("Eiffel Tower", verification["evidence"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,338 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+try:
+    import neo4j  # noqa: F401
+except ImportError:  # KnowledgeGraph's queries are tested against FakeDriver, which needs no server or driver.
+    sys.modules["neo4j"] = types.SimpleNamespace(GraphDatabase=None)
+
+import knowledge_graph
+from cached_graph import CachedGraph
+from graph_backend import open_graph
+from knowledge_graph import KnowledgeGraph
+from local_graph import LocalGraph
+
+
+class FakeResult:
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def consume(self):
+        pass
+
+
+class FakeSession:
+    """Runs transaction functions against itself as the tx, recording every query; driver.respond(query, params)
+    returns the records of a query and may raise."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.closed = False
+
+    def run(self, query, parameters=None, **params):  # The driver's signature.
+        params = {**(parameters or {}), **params}
+        self.driver.queries.append((query, params))
+        return FakeResult(self.driver.respond(query, params))
+
+    def read_transaction(self, function, *args):
+        return function(self, *args)
+
+    write_transaction = read_transaction
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDriver:
+    def __init__(self, respond=lambda query, params: []):
+        self.respond = respond
+        self.queries = []
+        self.sessions = []
+
+    def session(self):
+        self.sessions.append(FakeSession(self))
+        return self.sessions[-1]
+
+    def close(self):
+        pass
+
+
+class TestKnowledgeGraph(unittest.TestCase):
+    def _graph(self, respond=lambda query, params: [], **kwargs):
+        driver = FakeDriver(respond)
+        with mock.patch.object(knowledge_graph, "GraphDatabase", types.SimpleNamespace(driver=lambda uri, auth: driver)):
+            return KnowledgeGraph(**kwargs), driver
+
+    def test_batched_writes_chunk_group_and_quote(self):
+        def respond(query, params):
+            if "node_id" in query:
+                return [{"node_id": 100 + i} for i in range(len(params["rows"]))]
+            return [{"created": len(params["rows"])}]
+        graph, driver = self._graph(respond, batch_size=2)
+
+        self.assertEqual(graph.create_nodes("Per`son) DETACH DELETE (m", [{"name": str(i)} for i in range(5)]), [100, 101, 100, 101, 100])
+        self.assertEqual([len(params["rows"]) for _, params in driver.queries], [2, 2, 1])
+        self.assertIn("CREATE (n:`Per``son) DETACH DELETE (m`)", driver.queries[0][0])
+
+        driver.queries.clear()
+        self.assertEqual(graph.create_relationships([(1, 2, "KNOWS"), (2, 3, "KNOWS", {"since": 2020}), (3, 4, "LIKES"), (4, 5, "KNOWS")]), 4)
+        self.assertEqual([(query.split("[r:")[1].split("]")[0], len(params["rows"])) for query, params in driver.queries], [("`KNOWS`", 2), ("`LIKES`", 1), ("`KNOWS`", 1)])
+        self.assertEqual(driver.queries[0][1]["rows"][1], {"source_id": 2, "target_id": 3, "props": {"since": 2020}})
+        self.assertEqual(len(driver.sessions), 1)  # One pooled session for every call.
+
+    def test_session_pool_closes_failed_sessions(self):
+        def respond(query, params):
+            if params.get("props", {}).get("fail"):
+                raise RuntimeError("connection lost")
+            return [{"node_id": 7}]
+        graph, driver = self._graph(respond, session_pool_size=1)
+
+        self.assertEqual(graph.create_node("Person", {"name": "Alice"}), 7)
+        self.assertEqual(graph.create_node("Person", {"name": "Bob"}), 7)
+        self.assertEqual(len(driver.sessions), 1)
+        self.assertIsNone(graph.create_node("Person", {"fail": True}))
+        self.assertTrue(driver.sessions[0].closed)  # Not returned to the pool...
+        self.assertEqual(graph.create_node("Person", {"name": "Carol"}), 7)
+        self.assertEqual(len(driver.sessions), 2)  # ...so the next call opens a new one.
+        self.assertIn("CREATE (n:`Person` $props)", driver.queries[0][0])
+        graph.close()
+        self.assertTrue(driver.sessions[1].closed)
+
+    def test_search_nodes_query_text(self):
+        tx = FakeDriver(lambda query, params: [{"n": {"name": "Alice"}}]).session()
+
+        self.assertEqual(KnowledgeGraph._search_nodes(tx, None, "Per`son", {"age": 30, "team": "a"}, 10, 5, ["name"]), [{"name": "Alice"}])
+        self.assertEqual(tx.driver.queries[-1], ("MATCH (n:`Per``son`) WHERE n.`age` = $value0 AND n.`team` = $value1 RETURN n ORDER BY id(n) SKIP $skip LIMIT $limit",
+                                                 {"skip": 10, "limit": 5, "value0": 30, "value1": "a"}))
+
+        KnowledgeGraph._search_nodes(tx, "Ali+B)", "Person", {"age": 30}, 0, 5, ["name"], True)
+        self.assertEqual(tx.driver.queries[-1], ("CALL db.index.fulltext.queryNodes($index, $candidates) YIELD node AS n WHERE n.`age` = $value0 AND (toLower(toString(n.`name`)) CONTAINS $query) RETURN n ORDER BY id(n) SKIP $skip LIMIT $limit",
+                                                 {"skip": 0, "limit": 5, "value0": 30, "index": "kg_Person_fulltext", "candidates": "*ali* AND *b*", "query": "ali+b)"}))
+
+        KnowledgeGraph._search_nodes(tx, "+)", "Person", None, 0, 5, ["name"], True)  # No words to look up: scanned.
+        self.assertTrue(tx.driver.queries[-1][0].startswith("MATCH (n:`Person`) WHERE"))
+
+        KnowledgeGraph._search_nodes(tx, "Ali", None, None, 0, 5, ["name", "description"])
+        self.assertEqual(tx.driver.queries[-1], ("MATCH (n) WHERE (toLower(toString(n.`name`)) CONTAINS $query OR toLower(toString(n.`description`)) CONTAINS $query) RETURN n ORDER BY id(n) SKIP $skip LIMIT $limit",
+                                                 {"skip": 0, "limit": 5, "query": "ali"}))
+
+    def test_search_nodes_creates_indexes_without_waiting(self):
+        state = ["POPULATING"]
+        def respond(query, params):
+            if query.startswith("SHOW"):
+                return [{"state": state[0]}]
+            return [{"n": {"name": "Alice"}}] if "RETURN n" in query else []
+        graph, driver = self._graph(respond)
+
+        self.assertEqual(graph.search_nodes("ali", node_type="Person", properties={"age": 30}), [{"name": "Alice"}])
+        queries = [query for query, _ in driver.queries]
+        self.assertEqual(len([query for query in queries if query.startswith("CREATE")]), 2)
+        self.assertFalse(any("awaitIndexes" in query for query in queries))
+        self.assertTrue(queries[-1].startswith("MATCH (n:`Person`)"))  # Not populated yet: scanned.
+
+        state[0] = "ONLINE"
+        driver.queries.clear()
+        graph.search_nodes("ali", node_type="Person", properties={"age": 30})
+        graph.search_nodes("ali", node_type="Person", properties={"age": 30})
+        queries = [query for query, _ in driver.queries]
+        self.assertEqual(len(queries), 3)  # One state check, then only the searches.
+        self.assertTrue(queries[-1].startswith("CALL db.index.fulltext.queryNodes"))
+
+    def test_search_nodes_matches_substrings_before_and_after_indexing(self):
+        people = [{"id": 1, "name": "Alice Smith"}, {"id": 2, "name": "Bob"}, {"id": 3, "name": "Malik"}, {"id": 4, "name": "Ali"}]
+        state = ["POPULATING"]
+        def respond(query, params):
+            if query.startswith("SHOW"):
+                return [{"state": state[0]}]
+            if "RETURN n" not in query:
+                return []
+            nodes = people
+            if "queryNodes" in query:  # Lucene: each wildcard term must match a whole token.
+                terms = [re.compile(term.replace("*", ".*") + "$") for term in params["candidates"].split(" AND ")]
+                nodes = [n for n in nodes if all(any(term.match(token) for token in re.findall(r"\w+", n["name"].lower())) for term in terms)]
+            nodes = [n for n in nodes if params["query"] in n["name"].lower()]
+            return [{"n": n} for n in nodes][params["skip"]:params["skip"] + params["limit"]]
+        graph, driver = self._graph(respond)
+
+        scanned = graph.search_nodes("ali", node_type="Person")
+        state[0] = "ONLINE"
+        indexed = graph.search_nodes("ali", node_type="Person")
+        self.assertIn("queryNodes", driver.queries[-1][0])
+        self.assertEqual(scanned, indexed)
+        self.assertEqual([n["id"] for n in indexed], [1, 3, 4])  # "ali" within "Malik" too, as in LocalGraph.
+        self.assertEqual(graph.search_nodes("e sm", node_type="Person"), [people[0]])  # Across words, as a phrase.
+        self.assertEqual(graph.search_nodes("smith alice", node_type="Person"), [])
+
+    def test_search_nodes_without_index_privileges(self):
+        def respond(query, params):
+            if query.startswith("CREATE"):
+                raise RuntimeError("schema operations are not allowed")
+            return [{"n": {"name": "Alice"}}]
+        graph, driver = self._graph(respond)
+
+        for _ in range(2):
+            self.assertEqual(graph.search_nodes("ali", node_type="Person", properties={"age": 30}), [{"name": "Alice"}])
+        queries = [query for query, _ in driver.queries]
+        self.assertEqual(len([query for query in queries if query.startswith("CREATE")]), 2)  # Tried once each.
+        self.assertFalse(any(query.startswith("SHOW") for query in queries))
+        self.assertTrue(all("CONTAINS $query" in query for query in queries if "RETURN n" in query))
+
+    def test_subgraph_expands_distinct_frontiers(self):
+        edges = {1: [2, 3], 2: [1, 3, 4], 3: [1, 2, 4], 4: [2, 3, 5], 5: [4]}  # Many paths from 1 to 4, one node each.
+        def respond(query, params):
+            if "$frontier" in query:
+                reached = sorted({b for a in params["frontier"] for b in edges[a]} - set(params["visited"]))
+                return [{"node_id": node_id} for node_id in reached[:params["limit"]]]
+            if "RETURN id(n)" in query:
+                return [{"node_id": node_id} for node_id in sorted(params["node_ids"]) if node_id in edges][:params["limit"]]
+            return [{"nodes": [{"id": node_id} for node_id in sorted(params["node_ids"])], "relationships": []}]
+        graph, driver = self._graph(respond)
+
+        self.assertEqual([n["id"] for n in graph.subgraph([3, 9], depth=2)["nodes"]], [3, 1, 2, 4, 5])
+        self.assertEqual([params["frontier"] for query, params in driver.queries if "$frontier" in query], [[3], [1, 2, 4]])
+        self.assertNotIn("*", "".join(query for query, _ in driver.queries))  # No variable-length paths.
+
+        driver.queries.clear()
+        self.assertEqual([n["id"] for n in graph.subgraph([5], depth=10, limit=3)["nodes"]], [5, 4, 2])
+        self.assertEqual(len(driver.queries), 4)  # Stops expanding at the limit.
+        self.assertEqual(graph.subgraph([9]), {"nodes": [], "relationships": []})
+
+
+class TestLocalGraph(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "graph.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_create_and_reopen(self):
+        graph = open_graph("local", path=self.path)
+        alice = graph.create_node("Person", {"name": "Alice"})
+        ids = graph.create_nodes("Person", [{"name": "Bob"}, {"name": "Carol"}], batch_size=1)
+        self.assertEqual(graph.create_relationships([(alice, ids[0], "KNOWS"), (alice, 99, "KNOWS"), (ids[0], ids[1], "KNOWS", {"since": 2020})]), 2)
+        self.assertTrue(graph.create_relationship(ids[1], alice, "FOLLOWS"))
+        graph.close()
+
+        reopened = LocalGraph(self.path)
+        self.assertEqual(reopened.get_node(ids[1]), {"name": "Carol"})
+        self.assertIsNone(reopened.get_node(42))
+        self.assertEqual(len(reopened.outgoing[alice]), 1)
+        self.assertEqual(reopened.relationship_properties[1], {"since": 2020})
+        reopened.close()
+
+    def test_search_nodes(self):
+        graph = LocalGraph(":memory:")
+        graph.create_nodes("Person", [{"name": f"Person {i}", "team": i % 2} for i in range(10)])
+        graph.create_node("City", {"name": "Person Town"})
+
+        self.assertEqual(len(graph.search_nodes(node_type="Person", properties={"team": 1})), 5)
+        graph.create_node("Person", {"name": "Late", "team": 1})  # Kept in the property index built above.
+        self.assertEqual(len(graph.search_nodes(node_type="Person", properties={"team": 1})), 6)
+        self.assertEqual([n["name"] for n in graph.search_nodes("person 1", node_type="Person")], ["Person 1"])
+        self.assertEqual(len(graph.search_nodes("person")), 11)  # Every label.
+        page = graph.search_nodes(node_type="Person", limit=3, skip=3)
+        self.assertEqual([n["name"] for n in page], ["Person 3", "Person 4", "Person 5"])
+        self.assertEqual(graph.search_nodes(node_type="Robot"), [])
+        graph.close()
+
+    def test_traversals(self):
+        graph = LocalGraph(":memory:")
+        a, b, c, d, e = graph.create_nodes("Person", [{"name": name} for name in "abcde"])
+        graph.create_relationships([(a, b, "KNOWS"), (b, c, "KNOWS"), (c, d, "KNOWS"), (e, a, "FOLLOWS"), (a, c, "WORKS_WITH")])
+
+        around_a = graph.neighbourhood(a, depth=1, relationship_types=["KNOWS", "FOLLOWS"])
+        self.assertEqual([n["id"] for n in around_a["nodes"]], [a, b, e])
+        self.assertEqual({(r["source"], r["target"], r["type"]) for r in around_a["relationships"]}, {(a, b, "KNOWS"), (e, a, "FOLLOWS")})
+        self.assertEqual(around_a["nodes"][1], {"id": b, "type": "Person", "properties": {"name": "b"}})
+
+        two_hops = graph.subgraph([a], depth=2, relationship_types=["KNOWS"], direction="out")
+        self.assertEqual([n["id"] for n in two_hops["nodes"]], [a, b, c])
+        self.assertEqual(len(two_hops["relationships"]), 2)  # WORKS_WITH is filtered out.
+        self.assertEqual(len(graph.subgraph([a, d], depth=5, limit=3)["nodes"]), 3)
+        self.assertEqual(graph.subgraph([a], direction="sideways"), {"nodes": [], "relationships": []})
+
+        path = graph.shortest_path(a, d, relationship_types=["KNOWS"])
+        self.assertEqual([n["id"] for n in path["nodes"]], [a, b, c, d])
+        self.assertEqual([(r["source"], r["target"]) for r in path["relationships"]], [(a, b), (b, c), (c, d)])
+        self.assertEqual(len(graph.shortest_path(a, d)["relationships"]), 2)  # Via WORKS_WITH.
+        self.assertIsNone(graph.shortest_path(a, d, relationship_types=["KNOWS"], max_depth=2))
+        self.assertIsNone(graph.shortest_path(d, a, direction="out"))
+        self.assertEqual(len(graph.shortest_path(a, a)["nodes"]), 1)
+        graph.close()
+
+    def test_numpy_node_ids(self):
+        graph = LocalGraph(":memory:")
+        a, b, c = np.array(graph.create_nodes("Person", [{"name": name} for name in "abc"]), dtype=np.int64)  # E.g. ids kept in a numpy array.
+        self.assertEqual(graph.create_relationships([(a, b, "KNOWS"), (b, c, "KNOWS"), (a, np.int64(9), "KNOWS")]), 2)
+        self.assertTrue(graph.has_node(a))
+        self.assertFalse(graph.has_node(1.0))
+        self.assertEqual(graph.get_node(c), {"name": "c"})
+        around_a = graph.subgraph([a], depth=2)
+        self.assertEqual([type(n["id"]) for n in around_a["nodes"]], [int, int, int])
+        self.assertEqual([n["id"] for n in graph.shortest_path(a, c)["nodes"]], [a, b, c])
+        graph.close()
+
+    def test_cached_lookups(self):
+        graph = open_graph("local", cache_entries=100, path=":memory:")
+        self.assertIsInstance(graph, CachedGraph)
+        alice = graph.create_node("Person", {"name": "Alice"})
+        paris = graph.create_node("City", {"name": "Paris"})
+
+        self.assertEqual(graph.get_node(alice), {"name": "Alice"})
+        graph.get_node(alice)["name"] = "Changed"  # Callers get copies.
+        self.assertEqual(graph.get_node(alice), {"name": "Alice"})
+        self.assertEqual(len(graph.search_nodes(node_type="Person")), 1)
+        self.assertEqual(len(graph.search_nodes(node_type="City")), 1)
+        self.assertEqual(graph.stats()["hits"], 2)
+
+        graph.create_relationship(alice, paris, "LIVES_IN")  # Changes no cached result.
+        graph.create_node("Person", {"name": "Bob"})  # Drops the Person search only.
+        self.assertEqual(len(graph.search_nodes(node_type="Person")), 2)
+        self.assertEqual(len(graph.search_nodes(node_type="City")), 1)
+        stats = graph.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["invalidations"]), (3, 4, 1))
+
+        graph.graph.create_node("City", {"name": "Rome"})  # Behind the cache's back...
+        self.assertEqual(len(graph.search_nodes(node_type="City")), 1)
+        graph.invalidate()  # ...until told.
+        self.assertEqual(len(graph.search_nodes(node_type="City")), 2)
+        self.assertEqual(graph.stats()["version"], 1)
+        graph.close()
+
+    def test_cache_version_source_and_eviction(self):
+        external_version = [0]
+        graph = CachedGraph(LocalGraph(":memory:"), max_entries=2, version_source=lambda: external_version[0])
+        ids = graph.create_nodes("Person", [{"name": name} for name in "abc"])
+        for node_id in ids:
+            graph.get_node(node_id)
+        self.assertEqual(graph.stats()["entries"], 2)
+        self.assertEqual(graph.stats()["evictions"], 1)
+
+        graph.get_node(ids[2])
+        external_version[0] += 1
+        graph.get_node(ids[2])
+        self.assertEqual(graph.stats()["hits"], 1)
+        self.assertEqual(graph.version, 1)
+        graph.close()
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, open_graph, "rdf")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,385 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+import memory_store
+from context_window import ContextWindow
+from embeddings import Embeddings
+from lexical_index import LexicalIndex
+from memory_manager import MemoryManager
+from memory_namespaces import NamespacedMemory
+from memory_registry import MemoryRegistry
+from memory_store import MemoryStore
+
+
+class FakeModel:
+    """Deterministic stand-in for a SentenceTransformer: the same text always gets the same random vector."""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.calls = 0
+
+    def _encode_one(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def encode(self, text, batch_size=32, **kwargs):
+        self.calls += 1
+        if isinstance(text, str):
+            return self._encode_one(text)
+        return np.stack([self._encode_one(t) for t in text])
+
+
+class TestMemoryManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()  # Create temporary directory for testing
+        self.memory_file = os.path.join(self.temp_dir, "memory.pkl")
+        self.model = FakeModel()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)  # Clean up temporary directory after tests
+
+    def _manager(self, **kwargs):
+        return MemoryManager(embedding_dim=self.model.dim, memory_file=self.memory_file, embeddings=Embeddings("fake", model=self.model), **kwargs)
+
+    def test_add_and_search(self):
+        manager = self._manager()
+        manager.add_memory("The sky is blue.", {"agent_id": 1})
+        manager.add_memory("Grass is green.")
+
+        results = manager.search("The sky is blue.", top_k=1)
+        self.assertEqual(results[0]["text"], "The sky is blue.")
+        self.assertEqual(results[0]["metadata"], {"agent_id": 1})
+        self.assertAlmostEqual(results[0]["similarity_score"], 1.0, places=5)  # Cosine of a vector with itself.
+
+    def test_memories_persist(self):
+        manager = self._manager()
+        manager.add_memories(["one", "two", "three"], [{"n": 1}, {"n": 2}, {"n": 3}])
+        manager.close()
+
+        reopened = self._manager()
+        self.assertEqual([entry["text"] for entry in reopened.memory], ["one", "two", "three"])
+        self.assertEqual(reopened.search("two", top_k=1)[0]["metadata"], {"n": 2})
+
+    def test_min_score_filters_results(self):
+        manager = self._manager()
+        manager.add_memories(["alpha", "beta", "gamma"])
+        self.assertEqual(len(manager.search("alpha", top_k=3, min_score=0.99)), 1)
+
+    def test_filtered_and_time_windowed_search(self):
+        manager = self._manager()
+        now = datetime.now()
+        manager.add_memories(["agent 7, old", "agent 7, new", "agent 8, new"], [{"agent_id": 7}, {"agent_id": 7}, {"agent_id": 8}], [now - timedelta(days=2), now, now])
+
+        results = manager.search("agent 8, new", top_k=5, min_score=-1.0, filters={"agent_id": 7}, since=now - timedelta(days=1))
+        self.assertEqual([r["text"] for r in results], ["agent 7, new"])
+        self.assertEqual(manager.search("anything", filters={"agent_id": {"$gt": 8}}), [])
+
+    def test_delete_update_and_expire_by_id(self):
+        manager = self._manager(ttl=3600)
+        now = datetime.now()
+        manager.add_memories(["keep", "drop", "edit", "stale"], timestamps=[now, now, now, now - timedelta(hours=2)])
+        ids = {entry["text"]: entry["id"] for entry in manager.memory}
+
+        self.assertTrue(manager.delete_memory(ids["drop"]))
+        self.assertFalse(manager.delete_memory(ids["drop"]))
+        self.assertTrue(manager.update_memory(ids["edit"], text="edited", metadata={"v": 2}))
+        self.assertEqual({r["text"] for r in manager.search("drop", top_k=10, min_score=-1.0)}, {"keep", "edited"})  # "stale" is past its ttl.
+        self.assertEqual(manager.get_memory(ids["edit"])["timestamp"], now)  # Updating neither extends the ttl nor moves it in time.
+        self.assertTrue(manager.update_memory(ids["stale"], text="refreshed"))
+        self.assertEqual(manager.expire(), 1)
+        manager.close()
+
+        reopened = self._manager()
+        self.assertEqual(sorted(entry["text"] for entry in reopened.memory if entry), ["edited", "keep"])
+        self.assertEqual(reopened.get_memory(ids["edit"])["metadata"], {"v": 2})
+        reopened.compact()
+        self.assertTrue(reopened.metadata_index.timestamps_sorted)  # "stale" was added out of time order; compaction renumbers the rows by time.
+        self.assertEqual(len(reopened.store), 2)
+        self.assertEqual(reopened.search("keep", top_k=1)[0]["id"], ids["keep"])
+
+    def test_search_skips_expired_and_deleted_rows(self):
+        now = datetime.now()
+        for index_type in ("flat", "hnsw"):
+            manager = self._manager(ttl=3600, index_type=index_type, promote_threshold=40)
+            manager.add_memories([f"note {i}" for i in range(50)], timestamps=[now - timedelta(hours=2)] + [now] * 49)
+            manager.index.wait_for_training()
+            self.assertEqual(manager.index.active_tier, index_type)
+            expired_text = manager.memory[0]["text"]
+            results = manager.search(expired_text, top_k=3, min_score=-1.0)  # Its nearest neighbour is expired.
+            self.assertEqual(len(results), 3)
+            self.assertNotIn(expired_text, [r["text"] for r in results])
+            self.assertEqual(len(manager.search(expired_text, top_k=3, mode="lexical")), 3)
+
+            manager.store.compact_ratio = 2.0  # Keep the tombstones, so searches must skip them.
+            manager.delete_memories([entry["id"] for entry in manager.memory][1:46])
+            self.assertEqual(len(manager.store.deleted_rows), 45)
+            self.assertEqual(sorted(r["text"] for r in manager.search("note", top_k=5, min_score=-1.0)), [f"note {i}" for i in range(46, 50)])
+            if index_type == "hnsw":
+                selector = manager.index.trained._exclusion[3]
+                manager.search("note 47", top_k=5, min_score=-1.0)
+                self.assertIs(manager.index.trained._exclusion[3], selector)  # Not rebuilt per query.
+            manager.close()
+            shutil.rmtree(os.path.splitext(self.memory_file)[0] + ".store")
+
+    def test_excluded_rows_are_cached_until_they_change(self):
+        now = datetime.now()
+        for times in ([-3, -2, 0, 0, 0], [0, -3, 0, -2, 0]):  # In row order (bisect) and not (scan).
+            manager = self._manager(ttl=3600)
+            manager.add_memories([f"note {i}" for i in range(5)], timestamps=[now + timedelta(hours=h) for h in times])
+            manager.store.compact_ratio = 2.0
+            expired = [row for row, h in enumerate(times) if h < -1]
+            with manager._lock:
+                excluded = manager._excluded_rows()
+                self.assertEqual(excluded.tolist(), expired)
+                self.assertIs(manager._excluded_rows(), excluded)  # Reused while nothing changed.
+            manager.delete_memory(manager.memory[4]["id"])
+            with manager._lock:
+                self.assertEqual(manager._excluded_rows().tolist(), expired + [4])
+            manager.add_memory("old note", timestamp=now - timedelta(hours=5))
+            with manager._lock:
+                self.assertEqual(manager._excluded_rows().tolist(), expired + [4, 5])
+            manager.compact()
+            with manager._lock:
+                self.assertEqual(manager._excluded_rows().tolist(), [0, 1, 2])  # Renumbered oldest first; expire() deletes them.
+            manager.close()
+            shutil.rmtree(os.path.splitext(self.memory_file)[0] + ".store")
+
+    def test_lexical_and_hybrid_search_find_exact_terms(self):
+        manager = self._manager()
+        manager.add_memories(["Crash in parser.py, see JIRA-1234", "Build failed with error E0425", "The sky is blue."])
+
+        self.assertEqual(manager.search("JIRA-1234", mode="lexical")[0]["text"], "Crash in parser.py, see JIRA-1234")
+        self.assertEqual(manager.search("1234", mode="lexical")[0]["text"], "Crash in parser.py, see JIRA-1234")
+        hybrid = manager.search("what was error e0425?", top_k=2, min_score=-1.0, mode="hybrid")
+        self.assertEqual(hybrid[0]["text"], "Build failed with error E0425")
+        self.assertIn("bm25_score", hybrid[0])
+        self.assertEqual(manager.search("nothing matches", mode="lexical"), [])
+
+    def test_lexical_index_is_built_on_first_use(self):
+        manager = self._manager()
+        manager.add_memories(["alpha report", "beta report"])
+        manager.close()
+
+        manager = self._manager()
+        self.assertIsNone(manager.lexical_index)  # Opening does not tokenize every text.
+        build = LexicalIndex.build
+        def build_while_adding(*args, **kwargs):
+            index = build(*args, **kwargs)
+            manager.add_memory("gamma report")  # Not blocked by the build, and not lost by it.
+            return index
+        with mock.patch.object(LexicalIndex, "build", side_effect=build_while_adding):
+            self.assertEqual([r["text"] for r in manager.search("report", top_k=5, mode="lexical")], ["alpha report", "beta report", "gamma report"])
+        self.assertEqual(len(manager.lexical_index), 3)
+
+        manager.delete_memory(manager.search("alpha", mode="lexical")[0]["id"])
+        manager.compact()
+        self.assertIsNone(manager.lexical_index)
+        self.assertEqual([r["text"] for r in manager.search("report", top_k=5, mode="lexical")], ["beta report", "gamma report"])
+        manager.close()
+
+    def test_int8_storage_and_benchmark(self):
+        manager = self._manager(quantization="int8")
+        manager.add_memories([f"memory {i}" for i in range(50)])
+        self.assertEqual(manager.search("memory 7", top_k=1)[0]["text"], "memory 7")
+
+        report = {row["tier"]: row for row in manager.benchmark_index(num_queries=10, top_k=5, tiers=("flat", "flat_int8", "sq8"))}
+        self.assertEqual(report["flat"]["recall_at_k"], 1.0)
+        self.assertEqual(report["flat_int8"]["bytes_per_vector"], self.model.dim)
+        self.assertGreater(report["sq8"]["recall_at_k"], 0.8)
+
+    def test_memories_are_stored_in_columns(self):
+        manager = self._manager()
+        manager.add_memories(["first", "second", "third"], [{"agent_id": 1}, {"agent_id": 1}, {"agent_id": 2}])
+        self.assertEqual(len(manager.memory.metadata_values), 2)  # Identical metadata is stored once.
+
+        result = manager.search("second", top_k=1)[0]
+        self.assertEqual(result.copy(), {"id": result["id"], "text": "second", "metadata": {"agent_id": 1}, "timestamp": result["timestamp"], "similarity_score": result["similarity_score"]})
+        with self.assertRaises(TypeError):
+            result["text"] = "changed"  # Results are views of the columns; memories change through update_memory().
+        manager.delete_memory(manager.memory[0]["id"])
+        manager.compact()
+        self.assertEqual(result["text"], "second")  # Views stay readable after compaction renumbers the rows.
+
+    def test_search_many_batches_queries(self):
+        manager = self._manager()
+        manager.add_memories(["red", "green", "blue"])
+
+        results = manager.search_many(["blue", "red", "green"], top_k=1)
+        self.assertEqual([r[0]["text"] for r in results], ["blue", "red", "green"])
+        calls = self.model.calls
+        self.assertEqual([len(r) for r in manager.search_many(["cyan", "magenta"], top_k=2, min_score=-1.0)], [2, 2])
+        self.assertEqual(self.model.calls, calls + 1)  # One encoder batch for all uncached queries.
+        self.assertEqual(manager.search_many([]), [])
+
+    def test_batch_durability_group_commits(self):
+        manager = self._manager(durability="batch", write_batch_size=8, write_interval_ms=1000)
+        ids = [manager.add_memory(f"note {i}", {"i": i}) for i in range(8)]
+        manager.flush()
+        self.assertEqual(len(manager.memory), 8)
+        self.assertEqual(manager.get_memory(ids[3])["text"], "note 3")
+
+        memory_id = manager.add_memory("queued")
+        self.assertTrue(manager.delete_memory(memory_id))  # Deleting by id commits the queue first.
+        manager.add_memory("last")
+        manager.close()  # Commits what is still queued.
+
+        reloaded = self._manager()
+        self.assertEqual(len(reloaded.memory.live_rows()), 9)
+        self.assertRaises(ValueError, self._manager, durability="never")
+
+    def test_dedup_on_insert_and_offline(self):
+        manager = self._manager()
+        manager.add_memories(["red", "red", "green"])  # Written before deduplication was enabled.
+        self.assertEqual(manager.deduplicate(threshold=0.99), 1)
+        self.assertEqual(sorted(r["text"] for r in manager.search("red", top_k=5, min_score=-1.0)), ["green", "red"])
+        manager.close()
+
+        manager = self._manager(dedup_threshold=0.99)
+        red = manager.search("red", top_k=1)[0]
+        self.assertEqual(manager.add_memory("red"), red["id"])  # Merged instead of inserted, keeping the id.
+        self.assertEqual(manager.add_memories(["blue", "blue"]), 1)  # The second is merged into the first.
+        self.assertEqual(len(manager.memory.live_rows()), 3)
+        self.assertEqual(manager.get_memory(red["id"])["metadata"]["duplicate_count"], 2)
+        self.assertEqual(manager.search("blue", top_k=1)[0]["metadata"]["duplicate_count"], 1)
+
+        agent_red = manager.add_memory("red", {"agent_id": 7})  # Same text, other metadata: kept apart...
+        self.assertNotEqual(agent_red, red["id"])
+        self.assertEqual(manager.search("red", top_k=5, filters={"agent_id": 7})[0]["id"], agent_red)  # ...so filters still find it.
+        self.assertEqual(manager.add_memory("red", {"agent_id": 7}), agent_red)
+        self.assertEqual(manager.add_memories(["pink", "pink"], [{"agent_id": 7}, {"agent_id": 8}]), 2)
+        self.assertEqual(manager.deduplicate(), 0)
+        self.assertRaises(ValueError, self._manager, dedup_threshold=0.9, metric="l2")
+        self.assertRaises(ValueError, self._manager, dedup_threshold=0.9, durability="batch")
+
+    def test_shared_store_between_managers(self):
+        first, second = self._manager(shared=True), self._manager(shared=True)  # As in two API worker processes.
+        first.add_memory("red")
+        memory_id = second.add_memory("green")  # Loads "red" first, so the rows do not collide.
+        self.assertEqual({r["text"] for r in first.search("green", top_k=5, min_score=-1.0)}, {"red", "green"})
+
+        first.delete_memory(memory_id)
+        self.assertEqual([r["text"] for r in second.search("green", top_k=5, min_score=-1.0)], ["red"])
+        second.compact()
+        first.add_memory("blue")  # Reloads the compacted store before writing.
+        self.assertEqual(sorted(r["text"] for r in second.search("blue", top_k=5, min_score=-1.0)), ["blue", "red"])
+        first.close()
+        second.close()
+
+
+class TestNamespacedMemory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.model = FakeModel()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _memory(self):
+        return NamespacedMemory(self.temp_dir, embedding_dim=self.model.dim, embeddings=Embeddings("fake", model=self.model))
+
+    def test_namespaces_are_separate_shards(self):
+        memory = self._memory()
+        memory.add_memories("agent/1", ["red", "green"])
+        memory.add_memories("agent/2", ["blue"])
+
+        self.assertEqual({r["text"] for r in memory.namespace("agent/1").search("blue", top_k=5, min_score=-1.0)}, {"red", "green"})
+        self.assertEqual(len(memory.namespace("agent/2").memory), 1)
+        memory.close()
+
+        reopened = self._memory()
+        self.assertEqual(reopened.namespaces(), ["agent/1", "agent/2"])
+        results = reopened.search("blue", top_k=2, min_score=-1.0)
+        self.assertEqual((results[0]["text"], results[0]["namespace"]), ("blue", "agent/2"))
+        self.assertEqual(len(results), 2)
+
+    def test_agents_find_the_apis_memories(self):
+        memory = self._memory()
+        api_memory = memory.namespace("shared")  # What api.py hands to AgentSystem.
+        api_memory.add_memories(["red", "green"])
+        memory.add_memory("agent/4", "blue")
+        memory.add_memory("agent/5", "yellow")
+
+        results = memory.search_many(["red", "blue"], namespaces=["agent/4", "shared"], top_k=2, min_score=-1.0)  # Agent 4's reads.
+        self.assertEqual([[(r["text"], r["namespace"]) for r in query_results][0] for query_results in results], [("red", "shared"), ("blue", "agent/4")])
+        self.assertNotIn("yellow", {r["text"] for query_results in results for r in query_results})
+        self.assertEqual(memory.search_many(["red"], namespaces=[]), [[]])
+        memory.close()
+
+    def test_legacy_memory_file_moves_to_shared_namespace(self):
+        legacy_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, legacy_dir)
+        legacy_file = os.path.join(legacy_dir, "memory.pkl")
+        legacy = MemoryManager(embedding_dim=self.model.dim, memory_file=legacy_file, embeddings=Embeddings("fake", model=self.model))
+        legacy.add_memories(["red", "green"], [{"n": 1}, {"n": 2}])
+        ids = [entry["id"] for entry in legacy.memory]
+        legacy.close()
+
+        memory = self._memory()
+        self.assertEqual(memory.import_memory_file(legacy_file), 2)
+        self.assertEqual(memory.namespaces(), ["shared"])
+        self.assertEqual(memory.namespace("shared").get_memory(ids[1])["metadata"], {"n": 2})
+        self.assertEqual(memory.search("red", top_k=1)[0]["id"], ids[0])
+        self.assertEqual(memory.import_memory_file(legacy_file), 0)  # Imported once.
+        self.assertTrue(os.path.isdir(os.path.join(legacy_dir, "memory.store.migrated")))
+        memory.close()
+
+
+class TestContextWindow(unittest.TestCase):
+    def test_evicts_whole_oldest_messages(self):
+        window = ContextWindow(max_tokens=6, tokenizer=str.split)
+        for message in ("one two", "three four", "five six seven"):
+            window.add(message)
+        self.assertEqual(window.render(), "three four\nfive six seven")
+        self.assertEqual(window.token_count, 5)
+
+    def test_summarizes_evicted_messages(self):
+        window = ContextWindow(max_tokens=5, tokenizer=str.split, summarizer=lambda summary, evicted: "summary")
+        for message in ("one two", "three four", "five six seven"):
+            window.add(message)
+        self.assertEqual(window.render(), "summary\nfive six seven")
+
+
+class TestMemoryRegistry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.registry = MemoryRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_managers_and_models_are_shared(self):
+        memory_file = os.path.join(self.temp_dir, "memory.pkl")
+        first = self.registry.acquire_memory_manager(memory_file)
+        second = self.registry.acquire_memory_manager(memory_file)
+        other = self.registry.acquire_memory_manager(os.path.join(self.temp_dir, "other.pkl"))
+
+        self.assertIs(first, second)
+        self.assertIs(first.embeddings, other.embeddings)
+        self.assertFalse(first.embeddings.is_loaded)  # Nothing is loaded until the first embedding is generated.
+
+        for manager in (first, second, other):
+            self.registry.release_memory_manager(manager)
+        stats = self.registry.stats()
+        self.assertEqual(stats['embedding_models'], {})
+        self.assertEqual(stats['memory_managers'], {})
+
+    def test_shared_falls_back_without_file_locking(self):
+        with mock.patch.object(memory_store, "fcntl", None):  # As on Windows.
+            self.assertRaises(ValueError, MemoryStore, os.path.join(self.temp_dir, "direct.store"), 16, shared=True)
+            memory = self.registry.acquire_namespaced_memory(os.path.join(self.temp_dir, "memory"), shared=True)
+            manager = self.registry.acquire_memory_manager(os.path.join(self.temp_dir, "memory.pkl"), shared=True)
+            self.assertFalse(memory.namespace("shared").store.shared)
+            self.assertFalse(manager.store.shared)
+            self.registry.release_namespaced_memory(memory)
+            self.registry.release_memory_manager(manager)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from memory_store import MemoryStore, MemoryStoreError
+
+
+def _append_shared(path, worker, n):  # Runs in a child process.
+    store = MemoryStore(path, 4, fsync=False, shared=True)
+    store.open()
+    for i in range(n):
+        with store.locked():
+            store.refresh()
+            store.append(np.full(4, worker, dtype=np.float32), {"text": f"worker {worker} memory {i}"})
+    store.close()
+
+
+class TestMemoryStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()  # Create temporary directory for testing
+        self.path = os.path.join(self.temp_dir, "memory.store")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)  # Clean up temporary directory after tests
+
+    def _append(self, store, n):
+        for i in range(n):
+            store.append(np.full(4, i, dtype=np.float32), {"text": f"memory {i}", "metadata": {}, "timestamp": 0.0})
+
+    def test_append_and_reopen(self):
+        store = MemoryStore(self.path, 4)
+        store.open()
+        self._append(store, 3)
+        store.close()
+
+        reopened = MemoryStore(self.path, 4)
+        records = reopened.open()
+        self.assertEqual([r["text"] for r in records], ["memory 0", "memory 1", "memory 2"])
+        embeddings = reopened.embeddings()
+        self.assertIsInstance(embeddings, np.memmap)  # Mapped, not read into RAM.
+        np.testing.assert_array_equal(embeddings[:, 0], [0, 1, 2])
+
+    def test_append_many(self):
+        store = MemoryStore(self.path, 4)
+        store.open()
+        self._append(store, 1)
+        rows = store.append_many(np.ones((2, 4), dtype=np.float32), [{"text": "a"}, {"text": "b"}])
+        self.assertEqual(list(rows), [1, 2])
+        store.close()
+
+        reopened = MemoryStore(self.path, 4)
+        self.assertEqual([r["text"] for r in reopened.open()], ["memory 0", "a", "b"])
+        np.testing.assert_array_equal(reopened.embeddings()[1:], np.ones((2, 4)))
+
+    def test_metric_is_read_from_header(self):
+        MemoryStore(self.path, 4, metric="cosine").open()
+        reopened = MemoryStore(self.path, 4)  # Requests the default "l2"; the existing header wins.
+        reopened.open()
+        self.assertEqual(reopened.metric, "cosine")
+
+    def test_torn_write_is_discarded(self):
+        store = MemoryStore(self.path, 4)
+        store.open()
+        self._append(store, 2)
+        store.close()
+        with open(os.path.join(self.path, "records.0.log"), "ab") as f:
+            f.write(b"\x40\x00\x00\x00partial")  # Simulates a crash in the middle of a log write.
+        with open(os.path.join(self.path, "embeddings.0.bin"), "ab") as f:
+            f.write(b"\x00" * 10)
+
+        reopened = MemoryStore(self.path, 4)
+        self.assertEqual(len(reopened.open()), 2)
+        self._append(reopened, 1)  # Appending after recovery must not be hidden behind the torn record.
+        reopened.close()
+        self.assertEqual(len(MemoryStore(self.path, 4).open()), 3)
+
+    def test_compact_switches_generation(self):
+        store = MemoryStore(self.path, 4)
+        store.open()
+        self._append(store, 2)
+        store.compact([{"text": "kept", "metadata": {}, "timestamp": 0.0}], np.ones((1, 4), dtype=np.float32))
+        store.close()
+
+        reopened = MemoryStore(self.path, 4)
+        self.assertEqual([r["text"] for r in reopened.open()], ["kept"])
+        self.assertEqual(reopened.generation, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "records.0.log")))
+
+    def test_deleted_rows_persist_until_compaction(self):
+        store = MemoryStore(self.path, 4)
+        store.open()
+        self._append(store, 4)
+        self.assertEqual(store.delete([1, 3]), 2)
+        self.assertEqual(store.delete([1]), 0)  # Already deleted.
+        self.assertTrue(store.needs_compaction())
+        store.close()
+
+        reopened = MemoryStore(self.path, 4)
+        self.assertEqual(len(reopened.open()), 4)  # Rows keep their numbers until compaction.
+        self.assertEqual(reopened.deleted_rows, {1, 3})
+        reopened.compact([{"text": "memory 0"}, {"text": "memory 2"}], reopened.embeddings()[[0, 2]])
+        self.assertEqual(reopened.deleted_rows, set())
+        self.assertFalse(os.path.exists(os.path.join(self.path, "tombstones.0.log")))
+
+    def test_int8_quantization(self):
+        store = MemoryStore(self.path, 4, metric="cosine", quantization="int8")
+        store.open()
+        store.append_many(np.array([[1.0, 0.0, 0.0, 0.0], [0.5, -0.5, 0.5, -0.5]], dtype=np.float32), [{"text": "a"}, {"text": "b"}])
+        store.close()
+
+        reopened = MemoryStore(self.path, 4, metric="cosine")  # Requests float32; the header wins.
+        reopened.open()
+        self.assertEqual(reopened.quantization, "int8")
+        self.assertEqual(reopened.embeddings().dtype, np.int8)
+        self.assertEqual(os.path.getsize(os.path.join(self.path, "embeddings.0.bin")), 64 + 2 * 4)
+        np.testing.assert_allclose(reopened.decode(reopened.embeddings()), [[1, 0, 0, 0], [0.5, -0.5, 0.5, -0.5]], atol=1 / 127)
+        with self.assertRaises(ValueError):
+            MemoryStore(self.path, 4, metric="l2", quantization="int8")
+
+    def test_shared_store_readers_refresh(self):
+        writer = MemoryStore(self.path, 4, shared=True)
+        writer.open()
+        reader = MemoryStore(self.path, 4, shared=True)
+        reader.open()
+        self.assertRaises(MemoryStoreError, self._append, writer, 1)  # Shared stores are written under the lock.
+
+        with writer.locked():
+            self.assertEqual(writer.refresh(), ([], []))  # Catches up with the reader's open() first.
+            self._append(writer, 2)
+            writer.delete([0])
+        records, deleted = reader.refresh()
+        self.assertEqual([r["text"] for r in records], ["memory 0", "memory 1"])
+        self.assertEqual((deleted, len(reader.embeddings())), ([0], 2))
+        self.assertEqual(reader.refresh(), ([], []))
+
+        with writer.locked():
+            writer.compact([{"text": "memory 1"}], writer.embeddings()[1:])
+        self.assertIsNone(reader.refresh())  # Compacted: the reader has to reopen.
+        self.assertEqual(len(reader.embeddings()), 2)  # Its old snapshot stays readable meanwhile.
+        reader.close()
+        self.assertEqual(len(reader.open()), 1)
+
+    def test_shared_store_concurrent_writers(self):
+        MemoryStore(self.path, 4, shared=True).open()
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_append_shared, args=(self.path, worker, 25)) for worker in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+
+        records = MemoryStore(self.path, 4).open()
+        self.assertEqual(len(records), 100)  # No write was lost or overwritten.
+        self.assertEqual(len({r["text"] for r in records}), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
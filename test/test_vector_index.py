@@ -0,0 +1,104 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from memory_store import MemoryStore
+from vector_index import AdaptiveIndex, TrainedIndex
+
+
+class TestAdaptiveIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()  # Create temporary directory for testing
+        self.path = os.path.join(self.temp_dir, "memory.store")
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)  # Clean up temporary directory after tests
+
+    def _store(self):
+        store = MemoryStore(self.path, 16, fsync=False, metric="cosine")
+        store.open()
+        return store
+
+    def _append(self, store, n):
+        embeddings = self.rng.standard_normal((n, 16)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        store.append_many(embeddings, [{"text": f"memory {len(store) + i}", "metadata": {}, "timestamp": 0.0} for i in range(n)])
+        return embeddings
+
+    def _assert_finds_rows(self, index, store, rows):
+        _, ids = index.search(store.decode(store.embeddings()[rows]), 1)
+        self.assertEqual(ids[:, 0].tolist(), list(rows))
+
+    def test_promotion_catch_up_reload_and_reset(self):
+        for tier in ("ivf_flat", "hnsw"):
+            with self.subTest(tier=tier):
+                store = self._store()
+                self._append(store, 40)
+                index = AdaptiveIndex(store, tier, promote_threshold=50, metric="cosine")
+                self.assertEqual(index.active_tier, "flat")  # Below the threshold.
+
+                train = TrainedIndex.train
+                def train_while_rows_arrive(*args, **kwargs):
+                    trained = train(*args, **kwargs)
+                    self._append(store, 5)  # Appended while the background training ran.
+                    return trained
+                with mock.patch.object(TrainedIndex, "train", side_effect=train_while_rows_arrive):
+                    self._append(store, 20)
+                    index.add(None)
+                    index.wait_for_training()
+                self.assertEqual(index.active_tier, tier)
+                self.assertEqual(index.trained.ntotal, 65)  # Caught up with the rows added during training.
+                self._assert_finds_rows(index, store, [0, 59, 64])
+                self.assertTrue(os.path.exists(index.index_path))
+                store.close()
+
+                store = self._store()
+                self._append(store, 3)
+                reloaded = AdaptiveIndex(store, tier, promote_threshold=50, metric="cosine")
+                self.assertEqual(reloaded.active_tier, tier)  # Loaded, not retrained.
+                self.assertEqual(reloaded.trained.ntotal, 68)
+                self._assert_finds_rows(reloaded, store, [10, 67])
+
+                live_rows = np.arange(10, 68)
+                store.compact([{"text": f"memory {row}", "metadata": {}, "timestamp": 0.0} for row in live_rows], store.embeddings()[live_rows])
+                reloaded.reset()
+                reloaded.wait_for_training()
+                self.assertEqual(reloaded.trained.ntotal, 58)  # Retrained on the renumbered rows.
+                self._assert_finds_rows(reloaded, store, [0, 57])
+                self.assertEqual(glob.glob(os.path.join(self.path, f"index.{tier}.*.faiss")), [reloaded.index_path])  # The old generation's index is gone.
+                store.close()
+                shutil.rmtree(self.path)
+
+    def test_save_leaves_no_temporary_files(self):
+        store = self._store()
+        self._append(store, 60)
+        index = AdaptiveIndex(store, "ivf_flat", promote_threshold=50, background=False, metric="cosine")
+        self.assertEqual([os.path.basename(path) for path in glob.glob(os.path.join(self.path, "index.*"))], [os.path.basename(index.index_path)])
+        store.close()
+
+    def test_trained_index_is_saved_before_it_is_published(self):
+        store = self._store()
+        self._append(store, 60)
+        index = AdaptiveIndex(store, "hnsw", promote_threshold=100, metric="cosine")
+        save = TrainedIndex.save
+        published_while_saving = []
+        def save_and_check(trained, path):
+            published_while_saving.append(index.trained is trained)  # add() may mutate it once published.
+            save(trained, path)
+        with mock.patch.object(TrainedIndex, "save", save_and_check):
+            index.promote_threshold = 50
+            index.add(None)
+            index.wait_for_training()
+        self.assertEqual(published_while_saving, [False])
+        self.assertEqual(index.active_tier, "hnsw")
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()